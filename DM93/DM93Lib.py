@@ -115,10 +115,10 @@ def fcstSpVarPropagator(grid, f2n, r2, q2, k=None, dt=1., nu=0):
     else:
         assert isinstance(r2, np.ndarray)
         assert isinstance(q2, np.ndarray)
-        assert k == None
+        assert k is None
         assert isinstance(f2n, np.ndarray)
        
-    if k==None: k = grid.halfK
+    if k is None: k = grid.halfK
     m2 = np.exp(-4.*nu*np.pi*dt*k**2/grid.L**2)
     return m2*r2*f2n/(r2+f2n) + q2
 
@@ -171,15 +171,17 @@ def spVarStationary(grid, r2, q2, k=None, dt=1., nu=0):
             must be provided as an `int` (the wavenumber).
         q2 : float | np.ndarray
             Model error correlation power spectra or component
-        k : int | None
+        k : int | np.ndarray | None
             If not provided (or == None), then all spectrum is propagated
             and `f2n`, `r2` and `q2` must be arrays (full spectra).
+            An array gives the wavenumbers of the components of `r2` 
+            and `q2` (a part of the spectrum).
         dt : float
             Time increment
         nu : float
             Viscosity coefficient
     '''
-    if k==None: k = grid.halfK
+    if k is None: k = grid.halfK
     m2 = np.exp(-4.*nu*np.pi*dt*k**2/grid.L**2)
     alpha = 0.5 * (q2 + r2*(m2+1.))
     beta = alpha**2 - m2*r2**2
@@ -210,7 +212,7 @@ def convRate(grid, f2n, r2, q2, k=None, dt=1., nu=0):
         nu : float
             Viscosity coefficient
     '''
-    if k==None: k = grid.halfK
+    if k is None: k = grid.halfK
     m2 = np.exp(-4.*nu*np.pi*dt*k**2/grid.L**2)
     return (m2*r2 + q2 - f2n)/(f2n + r2)
 
@@ -230,17 +232,57 @@ def convRateAssymp(grid, r2, q2, k=None, dt=1., nu=0):
             Observation error correlation power spectra or component
         q2 : float | np.ndarray
             Model error correlation power spectra or component
-        k : int | None
+        k : int | np.ndarray | None
             If not provided (or == None), then all spectrum is propagated
             and `f2n`, `r2` and `q2` must be arrays (full spectra).
+            An array gives the wavenumbers of the components of `r2` 
+            and `q2` (a part of the spectrum).
         dt : float
             Time increment
         nu : float
             Viscosity coefficient
     '''
-    if k==None: k = grid.halfK
+    if k is None: k = grid.halfK
     m2 = np.exp(-4.*nu*np.pi*dt*k**2/grid.L**2)
     alpha = 0.5 * (q2 + r2*(m2+1.))
     beta = alpha**2 - m2*r2**2
     return (alpha - np.sqrt(beta))/(alpha + np.sqrt(beta))
 
+
+def spFilterCycle(spMultiplier, r2, q2, f2, xbSp, obsSp):
+    ''' Spectral Kalman Filter cycles
+    
+    Assimilation cycles of the spectral Kalman Filter (see 
+    `SpectralKalmanFilter`) carried out entirely in spectral space: 
+    each wavenumber is independent, such that the cycles can be run 
+    on any part of the spectrum.
+    Returns the forecast and analysis variances and the analysis 
+    spectra of each cycle.
+
+    :Parameters:
+        spMultiplier : np.ndarray(dtype=complex)
+            Model spectral multiplier
+        r2 : np.ndarray
+            Observation error spectral variances
+        q2 : np.ndarray
+            Model error spectral variances
+        f2 : np.ndarray
+            Initial forecast spectral variances
+        xbSp : np.ndarray(dtype=complex)
+            Initial background spectrum
+        obsSp : np.ndarray(dtype=complex)
+            Observations spectra (one per cycle on the first axis)
+    '''
+    nCycles = len(obsSp)
+    m2 = np.abs(spMultiplier)**2
+    f2Traj = np.empty(shape=(nCycles,)+np.shape(f2))
+    a2Traj = np.empty(shape=(nCycles,)+np.shape(f2))
+    anlSp = np.empty_like(obsSp)
+    for i in xrange(nCycles):
+        gain = f2/(f2+r2)
+        f2Traj[i] = f2
+        anlSp[i] = xbSp + gain*(obsSp[i]-xbSp)
+        a2Traj[i] = (1.-gain)*f2
+        xbSp = spMultiplier*anlSp[i]
+        f2 = m2*a2Traj[i] + q2
+    return f2Traj, a2Traj, anlSp
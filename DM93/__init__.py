@@ -22,8 +22,32 @@
 
 ''' Daley and Menard 1993 Kalman Filter 1D lab '''
 
-from gridCls import Grid
-from spectralModelCls import AdvectionDiffusionModel
+from gridCls import Grid, Grid2D
+from spectralModelCls import AdvectionDiffusionModel, BurgersModel
+from spectralModelCls import AdvectionDiffusionModel2D
+from spectralModelCls import VariableAdvectionDiffusionModel
 from DM93Lib import *
 from covarianceCls import Covariance, Uncorrelated,  Foar, Soar, Gaussian
+from covarianceCls import CirculantCovariance, DiagonalCovariance
+from covarianceCls import PackedCovariance, LowRankCovariance, HybridCovariance
+from obsOperatorCls import ObsOperator, PointObsOperator
+from variationalLib import conjugateGradient, var3D, var4D, adjointTest
+from analysisLib import directAnalysis
 
+from kalmanFilterCls import KalmanFilter, SpectralKalmanFilter
+from kalmanFilterCls import FrozenGainFilter
+from batchKalmanFilterCls import BatchKalmanFilter, BatchSpectralKalmanFilter
+from ensembleKalmanFilterCls import EnsembleKalmanFilter
+from adaptiveFilterCls import InnovationStatistics, AdaptiveFilter
+from smootherCls import RTSSmoother, FixedLagSmoother
+from monteCarloLib import monteCarloKF
+from runnerLib import runExperiments, runSharded, sharedArray
+from shardedLib import shardedSpectralFilter, shardedStationarySolution
+from configCls import Config
+from diskCacheCls import DiskCache
+from trajectoryCls import TrajectoryWriter, TrajectoryReader
+from checkpointCls import Checkpointer
+from experimentsLib import EXPERIMENTS, saveResults
+import experimentsLib
+import plotsLib
+import benchmarkLib
@@ -0,0 +1,158 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Headless batch mode
+
+Run one experiment of `experimentsLib` without display and save its 
+results in a numpy `.npz` file::
+
+    python -m DM93 kalmanFilter --config config.py --output kf.npz \
+                                --set nDt=20 modVar=0.1 --plot kf.png
+
+Configuration parameters (see `Config`) and parameters of the 
+experiment function can be overridden with `--set` (values are python 
+literals); the figure is only produced (and `matplotlib` only 
+imported) with `--plot`.  With `--profile`, the time, FLOPs and memory
+of each stage of the run are printed and saved in a JSON file.
+'''
+import sys
+import inspect
+import argparse
+from ast import literal_eval
+
+from DM93.configCls import Config
+from DM93 import profilerLib
+from DM93.experimentsLib import EXPERIMENTS, XP_DIVERGENCE, saveResults
+
+
+def parameters(func, config, overrides):
+    ''' Configuration and arguments of an experiment function 
+    
+    Overrides naming a configuration parameter are applied to `config`,
+    the others update the defaults of `func`.
+    '''
+    argSpec = inspect.getargspec(func)
+    defaults = argSpec.defaults or ()
+    params = dict(zip(argSpec.args[len(argSpec.args)-len(defaults):], 
+                        defaults))
+    confOverrides = dict()
+    for key, value in overrides.iteritems():
+        if key in Config.DEFAULTS:
+            confOverrides[key] = value
+        elif key in params:
+            params[key] = value
+        else:
+            raise ValueError('unknown parameter: %s'%key)
+    params['config'] = config.replace(**confOverrides)
+    return params
+
+
+def plot(name, params, results):
+    ''' Produce the experiment figure '''
+    from DM93 import plotsLib
+    config = params['config']
+    grid = config.grid
+    units = {'spaceUnits':config.km}
+    if name == 'propagation':
+        units['timeUnits'] = config.h
+        return plotsLib.plotPropagation(grid, results, **units)
+    elif name == 'analysis':
+        return plotsLib.plotAnalysis(grid, results, **units)
+    elif name == 'kalmanFilter':
+        units['timeUnits'] = config.h
+        return plotsLib.plotKalmanFilter(grid, results, config.obsVar, 
+                                        config.modVar, config.fctVar,
+                                        **units)
+    elif name == 'filterDivergence':
+        xpDict = params['xpDict']
+        if xpDict is None: xpDict = XP_DIVERGENCE
+        return plotsLib.plotFilterDivergence(results, xpDict, config.obsVar,
+                                                timeUnits=config.h)
+    elif name == 'sensitivitySweep':
+        return plotsLib.plotSensitivitySweep(results)
+    elif name == 'assymptoticSolution':
+        return plotsLib.plotAssymptoticSolution(grid, results)
+    elif name == 'viscosity':
+        return plotsLib.plotViscosity(grid, results)
+    elif name == 'spectralVariance':
+        return plotsLib.plotSpectralVariance(grid, results)
+    elif name == 'sampleCorrelations':
+        return plotsLib.plotSampleCorrelations(results)
+    elif name == 'stationarySolutions':
+        return plotsLib.plotStationarySolutions(results)
+    elif name == 'correlationModels':
+        return plotsLib.plotCorrelationModels(grid, results, **units)
+    elif name == 'filterAccuracy':
+        return plotsLib.plotFilterAccuracy(grid, results)
+    elif name == 'precisionLoss':
+        return plotsLib.plotPrecisionLoss(grid, results)
+    elif name == 'adaptiveFilter':
+        return plotsLib.plotAdaptiveFilter(results)
+    elif name == 'kalmanFilter2D':
+        return plotsLib.plotKalmanFilter2D(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m DM93',
+                                description='Run a DM93 experiment headless')
+    parser.add_argument('experiment', choices=sorted(EXPERIMENTS.keys()))
+    parser.add_argument('--config', default='config.py',
+                        help='configuration script (default: config.py)')
+    parser.add_argument('--output', default=None,
+                        help='results file (default: EXPERIMENT.npz)')
+    parser.add_argument('--set', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='configuration or experiment parameters '
+                                'overrides')
+    parser.add_argument('--plot', default=None, metavar='FIGURE',
+                        help='save the experiment figure')
+    parser.add_argument('--profile', default=None, metavar='JSON',
+                        help='profile the run stages and save statistics')
+    args = parser.parse_args(argv)
+
+    overrides = dict()
+    for item in args.set:
+        key, value = item.split('=', 1)
+        overrides[key] = literal_eval(value)
+
+    config = Config.fromFile(args.config)
+    func = EXPERIMENTS[args.experiment]
+    params = parameters(func, config, overrides)
+    if args.profile is None:
+        results = func(**params)
+    else:
+        with profilerLib.profiling() as profile:
+            results = func(**params)
+        print(profile.table())
+        profile.save(args.profile)
+
+    output = args.output
+    if output is None: output = args.experiment+'.npz'
+    saveResults(output, results)
+    print('%s results saved in %s'%(args.experiment, output))
+
+    if args.plot is not None:
+        import matplotlib
+        matplotlib.use('Agg')
+        fig = plot(args.experiment, params, results)
+        fig.savefig(args.plot)
+        print('%s figure saved in %s'%(args.experiment, args.plot))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+
+class InnovationStatistics(object):
+    ''' Online innovation statistics of an assimilation cycle
+
+    Statistics are updated at every analysis from the innovation 
+    d = y - xb, the analysis residual y - xa and increment xa - xb, in 
+    constant memory (independent of the number of cycles).  Means are
+    cumulative or, with `memory`, exponentially weighted with weight 
+    max(1/n, 1/memory) (forgets the cycles older than about `memory`).
+
+    With collocated observations (identity observation operator), the 
+    expectations of the scalar statistics (normalized by the number of
+    observations p) are, for a consistent filter:
+
+    - 'dd': d.d/p = tr(B+R)/p
+    - 'rEstimate': (y-xa).d/p = tr(R)/p (Desroziers et al., 2005)
+    - 'bEstimate': (xa-xb).d/p = tr(B)/p (Desroziers et al., 2005)
+    - 'chi2': d.(B+R)^-1.d/p = 1 
+
+    and are compared to the variances predicted by the filter 
+    ('obsVar' = tr(R)/p and 'fctVar' = tr(B)/p).  The chi-square 
+    statistic uses (B+R)^-1.d = R^-1.(y-xa), valid for an analysis with
+    the gain of B (one solve with R, cheap for diagonal or circulant 
+    covariances).  A mean normalized chi-square above its upper bound
+    (`chi2Bounds`) flags forecast errors underestimated by the filter 
+    (divergence).
+
+    :Attributes:
+        memory : int | None
+            memory of the exponentially weighted means (cumulative 
+            means if None)
+        nCycles : int
+            number of cycles
+        mean : np.ndarray
+            innovation mean at each observation
+        var : np.ndarray
+            innovation variance at each observation
+        scalars : dict
+            running means of the scalar statistics
+        last : dict
+            scalar statistics of the last cycle
+    '''
+
+    SCALARS = ('dd', 'rEstimate', 'bEstimate', 'chi2', 'obsVar', 'fctVar')
+
+    def __init__(self, memory=None):
+        self.memory = memory
+        self.nCycles = 0
+        self.mean = None
+        self.var = None
+        self.scalars = dict((name, 0.) for name in self.SCALARS)
+        self.last = dict()
+
+    @property
+    def weight(self):
+        ''' Weight of the last cycle in the running means '''
+        if self.memory is None:
+            return 1./self.nCycles
+        return max(1./self.nCycles, 1./self.memory)
+
+    @property
+    def nEffective(self):
+        ''' Effective number of (independent) cycles of the means '''
+        w = self.weight
+        return (2.-w)/w if self.memory is not None else self.nCycles
+
+    def update(self, d, residual, increment, R, B):
+        ''' Update the statistics with one analysis, return the scalar 
+        statistics of the cycle
+
+        :Parameters:
+            d : np.ndarray
+                innovation y - xb
+            residual : np.ndarray
+                analysis residual y - xa
+            increment : np.ndarray
+                analysis increment xa - xb
+            R : `Covariance`
+                observation error covariance
+            B : `Covariance`
+                background error covariance used in the analysis
+        '''
+        p = float(np.size(d))
+        last = {'dd':d.dot(d)/p, 
+                'rEstimate':residual.dot(d)/p,
+                'bEstimate':increment.dot(d)/p, 
+                'chi2':d.dot(R.solve(residual))/p,
+                'obsVar':R.variance.sum()/p, 
+                'fctVar':B.variance.sum()/p}
+        self.nCycles += 1
+        w = self.weight
+        if self.mean is None:
+            self.mean = np.zeros_like(d, dtype=np.float64)
+            self.var = np.zeros_like(d, dtype=np.float64)
+        delta = d - self.mean
+        self.mean += w*delta
+        self.var = (1.-w)*(self.var + w*delta**2)
+        for name, value in last.iteritems():
+            self.scalars[name] += w*(value - self.scalars[name])
+        self.last = last
+        return last
+
+    def chi2Bounds(self, nSigma=3.):
+        ''' Bounds of the mean normalized chi-square of a consistent 
+        filter: 1 +/- nSigma*sqrt(2/(p*n)), with n the effective number 
+        of cycles
+
+        :Parameters:
+            nSigma : float
+                number of standard deviations
+        '''
+        p = len(self.mean)
+        delta = nSigma*np.sqrt(2./(p*self.nEffective))
+        return 1.-delta, 1.+delta
+
+    def isConsistent(self, nSigma=3.):
+        ''' True if the mean normalized chi-square is within its bounds '''
+        lower, upper = self.chi2Bounds(nSigma)
+        return lower <= self.scalars['chi2'] <= upper
+
+    def isDiverging(self, nSigma=3.):
+        ''' True if the mean normalized chi-square is above its upper 
+        bound (forecast errors underestimated by the filter) '''
+        return self.scalars['chi2'] > self.chi2Bounds(nSigma)[1]
+
+    def summary(self, nSigma=3.):
+        ''' Running means, chi-square bounds and consistency '''
+        summary = dict(self.scalars)
+        summary['nCycles'] = self.nCycles
+        summary['chi2Bounds'] = self.chi2Bounds(nSigma)
+        summary['consistent'] = self.isConsistent(nSigma)
+        summary['diverging'] = self.isDiverging(nSigma)
+        return summary
+
+
+class AdaptiveFilter(object):
+    ''' Kalman Filter with online innovation statistics and adaptive 
+    forecast error statistics
+
+    Wraps a filter (`KalmanFilter` or one of its subclasses) and updates
+    `InnovationStatistics` at every analysis.  The forecast error 
+    variance is estimated from the innovations, tr(B) = E[d.d] - tr(R)
+    (R is assumed known), with the running means, and used by `method`:
+
+    - None: diagnostics only
+    - 'inflation': the background error covariance is multiplied by 
+      the inflation factor lambda = (dd - obsVar)/fctVar before each 
+      analysis (with fctVar the uninflated forecast variance, lambda 
+      is bounded below by `minInflation`)
+    - 'Q': the model error covariance is Q0 multiplied by 
+      alpha = (dd - obsVar - (fctVar - alpha.qVar))/qVar >= 0, with 
+      qVar = tr(Q0)/p, i.e. the model error variance missing from the
+      propagated analysis variance
+
+    Factors are only adapted after `spinUp` cycles.
+
+    :Attributes:
+        kFilter : `KalmanFilter`
+            filter
+        method : str | None
+            adaptive scheme (None, 'inflation' or 'Q')
+        statistics : `InnovationStatistics`
+            online innovation statistics
+        inflation : float
+            current inflation factor
+        qFactor : float
+            current model error covariance factor
+        minInflation : float
+            lower bound of the inflation factor
+        spinUp : int
+            number of cycles before adaptation
+    '''
+
+    def __init__(   self, kFilter, method=None, memory=20, minInflation=1., 
+                    spinUp=None):
+        if method not in (None, 'inflation', 'Q'):
+            raise ValueError('unknown adaptive method: %s'%method)
+        self.kFilter = kFilter
+        self.method = method
+        self.statistics = InnovationStatistics(memory=memory)
+        self.Q0 = kFilter.Q
+        self.inflation = 1.
+        self.qFactor = 1.
+        self.minInflation = minInflation
+        if spinUp is None: spinUp = 5 if memory is None else memory//4
+        self.spinUp = spinUp
+        self._fctVar = 0.
+
+    @property
+    def factor(self):
+        ''' Current adaptive factor (inflation or Q factor) '''
+        return self.qFactor if self.method == 'Q' else self.inflation
+
+    def analyse(self, xb, B, y):
+        ''' Analysis step (see `KalmanFilter.analyse`), with the 
+        background error covariance inflated if `method` is 'inflation'
+        '''
+        fctVar = B.variance.sum()/float(np.size(y))
+        if self.method == 'inflation' and self.inflation != 1.:
+            B = B.scaled(self.inflation)
+        xa, A = self.kFilter.analyse(xb, B, y)
+        stats = self.statistics
+        stats.update(y-xb, y-xa, xa-xb, self.kFilter.R, B)
+        if self.method == 'Q':
+            # -- propagated analysis variance (without model error)
+            fctVar -= self.qFactor*self.Q0.variance.mean()
+        self._fctVar += stats.weight*(fctVar - self._fctVar)
+        if stats.nCycles > self.spinUp:
+            self._adapt()
+        return xa, A
+
+    def _adapt(self):
+        scalars = self.statistics.scalars
+        bVar = scalars['dd'] - scalars['obsVar']
+        if self.method == 'inflation':
+            self.inflation = max(self.minInflation, bVar/self._fctVar)
+        elif self.method == 'Q':
+            qVar = self.Q0.variance.mean()
+            self.qFactor = max(0., (bVar - self._fctVar)/qVar)
+            self.kFilter.Q = self.Q0.scaled(self.qFactor)
+
+    def forecast(self, xa, A):
+        ''' Forecast step (see `KalmanFilter.forecast`) '''
+        return self.kFilter.forecast(xa, A)
@@ -0,0 +1,86 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from covarianceCls import Covariance, CirculantCovariance
+from profilerLib import stage, fftFlops
+
+
+def directAnalysis(xb, y, B, R, method='auto', rtol=1e-8):
+    ''' Analysis by direct computation of the gain
+
+    Returns the analysis state, error covariance and the method used 
+    (xa, A, method).  Observations are collocated with grid points 
+    (identity observation operator) and states are stored on the last
+    axis.
+
+    When both B and R are homogeneous (circulant), including correlated 
+    observation errors, the analysis decouples by wavenumber (Daley 
+    and Menard, 1993): the gain b2/(b2+r2) and the increment are 
+    computed per wavenumber in O(J log J) ('spectral').  Otherwise, the
+    J x J innovation covariance B+R is solved in O(J**3) ('dense').
+
+    :Parameters:
+        xb : np.ndarray
+            background state(s)
+        y : np.ndarray
+            observations
+        B : `Covariance`
+            background error covariance
+        R : `Covariance`
+            observation error covariance
+        method : str
+            'auto' (spectral for homogeneous covariances, dense 
+            otherwise), 'spectral' or 'dense'
+        rtol : float
+            relative tolerance of the homogeneity check 
+            (see `CirculantCovariance.fromCovariance`)
+    '''
+    if method not in ('auto', 'spectral', 'dense'):
+        raise ValueError('unknown analysis method: %s'%method)
+    if method != 'dense':
+        try:
+            BSp = CirculantCovariance.fromCovariance(B, rtol=rtol)
+            RSp = CirculantCovariance.fromCovariance(R, rtol=rtol)
+        except ValueError:
+            if method == 'spectral': raise
+        else:
+            return _spectralAnalysis(xb, y, BSp, RSp) + ('spectral',)
+    return _denseAnalysis(xb, y, B, R) + ('dense',)
+
+
+def _spectralAnalysis(xb, y, B, R):
+    grid = B.grid
+    b2, r2 = B.spVariance, R.spVariance
+    with stage('directAnalysis.spectral', 
+                fftFlops(grid.J, 2*np.size(xb)//grid.J)):
+        gain = b2/(b2+r2)
+        xa = xb + grid.fftInverse(gain*grid.fftTransform(y-xb))
+        return xa, CirculantCovariance(grid, (1.-gain)*b2)
+
+
+def _denseAnalysis(xb, y, B, R):
+    grid = B.grid
+    J = grid.J
+    with stage('directAnalysis.dense', 14./3*J**3):
+        Bmat = B.matrix
+        K = np.linalg.solve(Bmat + R.matrix, Bmat).T
+        xa = xb + (y-xb).dot(K.T)
+        return xa, Covariance(grid, Bmat - K.dot(Bmat))
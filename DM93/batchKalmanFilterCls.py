@@ -0,0 +1,205 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from covarianceCls import CirculantCovariance
+from profilerLib import stage, fftFlops
+
+
+class BatchKalmanFilter(object):
+    ''' Kalman Filter of a batch of configurations
+
+    Runs the Kalman Filter (see `KalmanFilter`) of `nConf` 
+    configurations sharing the same linear model at once: states 
+    (nConf, J), error covariances (nConf, J, J) and the observation and
+    model error covariances of each configuration are stacked on a 
+    leading axis.  The gains are computed by batched solves and the 
+    covariances are propagated by the tangent linear model applied on 
+    the whole stack, such that a sweep over error statistics runs as a 
+    single computation.  Configurations which do not `assimilate` keep
+    their background (free model runs).  The analysis can update 
+    another covariance than the one of the gain (see `batchKalmanFilter`
+    for the recursion of `kalmanFilter`).
+
+    :Attributes:
+        model : `SpectralModel`
+            linear model
+        R : np.ndarray
+            stacked observation error covariances (see `stack`)
+        Q : np.ndarray
+            stacked model error covariances (see `stack`)
+        nConf : int
+            number of configurations
+        assimilate : np.ndarray(dtype=bool)
+            configurations assimilating the observations
+        solveDtype : numpy.dtype
+            floating point type of the gain solve and covariance update
+
+    :Methods:
+        stack : np.ndarray
+            return the stacked representation of covariances
+        analyse : np.ndarray, np.ndarray
+            return the analysis states and stacked error covariances
+        forecast : np.ndarray, np.ndarray
+            return the forecast states and stacked error covariances
+        variance : np.ndarray
+            return the grid point variances of stacked covariances
+    '''
+
+    def __init__(   self, model, R, Q, assimilate=None, 
+                    solveDtype=np.float64):
+        self.model = model
+        self.grid = model.grid
+        self.R = np.asarray(R)
+        self.Q = np.asarray(Q)
+        self.nConf = len(self.R)
+        assert len(self.Q) == self.nConf
+        if assimilate is None:
+            assimilate = np.ones(self.nConf, dtype=bool)
+        self.assimilate = np.asarray(assimilate, dtype=bool)
+        assert self.assimilate.shape == (self.nConf,)
+        self.solveDtype = np.dtype(solveDtype)
+
+    @classmethod
+    def stack(cls, grid, covs):
+        ''' Stacked covariance matrices (nConf, J, J) 
+
+        :Parameters:
+            grid : `Grid`
+                periodic grid
+            covs : list
+                `Covariance` of each configuration
+        '''
+        return np.array([cov.matrix for cov in covs])
+
+    def analyse(self, xb, B, y, P=None):
+        ''' Analysis step
+
+        Returns the analysis states and error covariances (xa, A), with 
+        A = (I-K).P and K the gains of B.
+
+        :Parameters:
+            xb : np.ndarray
+                background states (nConf, J)
+            B : np.ndarray
+                background error covariances (nConf, J, J)
+            y : np.ndarray
+                observations (nConf, J)
+            P : np.ndarray | None
+                covariances updated with the gains (B by default)
+        '''
+        if P is None: P = B
+        J, nAss = self.grid.J, np.count_nonzero(self.assimilate)
+        xa, A = xb.copy(), P.copy()
+        ass = self.assimilate
+        with stage('BatchKalmanFilter.gain', 8./3*nAss*J**3):
+            Bmat = B[ass].astype(self.solveDtype, copy=False)
+            KT = np.linalg.solve(Bmat + self.R[ass], Bmat)
+        with stage('BatchKalmanFilter.stateUpdate', 2.*nAss*J**2):
+            xa[ass] = xb[ass] + np.einsum('cji,cj->ci', KT, y[ass]-xb[ass])
+        with stage('BatchKalmanFilter.covarianceUpdate', 2.*nAss*J**3):
+            Pmat = P[ass].astype(self.solveDtype, copy=False)
+            A[ass] = Pmat - np.matmul(KT.swapaxes(-1, -2), Pmat)
+        return self.grid.asDtype(xa), self.grid.asDtype(A)
+
+    def forecast(self, xa, A):
+        ''' Forecast step
+
+        Returns the forecast states and error covariances (xb, B)
+        with B = M.A.M' + Q.
+
+        :Parameters:
+            xa : np.ndarray
+                analysis states (nConf, J)
+            A : np.ndarray
+                analysis error covariances (nConf, J, J)
+        '''
+        with stage('BatchKalmanFilter.stateForecast'):
+            xb = self.model.integrate(xa)
+        with stage('BatchKalmanFilter.covarianceForecast'):
+            AMt = self.model.tangentLinear(A)
+            B = self.model.tangentLinear(AMt.swapaxes(-1, -2)) + self.Q
+        return xb, self.grid.asDtype(B)
+
+    def variance(self, P):
+        ''' Grid point variances (nConf, J) of stacked covariances
+
+        :Parameters:
+            P : np.ndarray
+                stacked covariances
+        '''
+        return np.diagonal(P, axis1=-2, axis2=-1)
+
+
+class BatchSpectralKalmanFilter(BatchKalmanFilter):
+    ''' Spectral Kalman Filter of a batch of configurations
+
+    As `BatchKalmanFilter` for homogeneous statistics and a spectral 
+    multiplier model (see `SpectralKalmanFilter`): covariances are 
+    stacked spectral variances (nConf, N+1) and all the configurations
+    are analysed and propagated by a few vectorized operations, with 
+    one FFT of the stacked states per step.
+    '''
+
+    def __init__(   self, model, R, Q, assimilate=None, 
+                    solveDtype=np.float64):
+        super(BatchSpectralKalmanFilter, self).__init__(
+                                    model, R, Q, assimilate=assimilate, 
+                                    solveDtype=solveDtype)
+        self.m2 = np.abs(self.model.spMultiplier)**2
+
+    @classmethod
+    def stack(cls, grid, covs):
+        ''' Stacked spectral variances (nConf, N+1) of homogeneous 
+        covariances
+
+        :Parameters:
+            grid : `Grid`
+                periodic grid
+            covs : list
+                `Covariance` of each configuration
+        '''
+        return np.array([   cov.spVariance 
+                            if isinstance(cov, CirculantCovariance) else 
+                            CirculantCovariance.fromMatrix( 
+                                                grid, cov.matrix).spVariance
+                            for cov in covs])
+
+    def analyse(self, xb, B, y, P=None):
+        with stage('BatchSpectralKalmanFilter.gain', 2.*np.size(self.R)):
+            f2 = B.astype(self.solveDtype)
+            gain = self.assimilate[:,None]*f2/(f2+self.R)
+        with stage('BatchSpectralKalmanFilter.stateUpdate', 
+                    fftFlops(self.grid.J, np.size(xb)//self.grid.J)):
+            xa = xb + self.grid.fftInverse(gain*self.grid.fftTransform(y-xb))
+        if P is not None: f2 = P.astype(self.solveDtype)
+        return xa, (1.-gain)*f2
+
+    def forecast(self, xa, A):
+        with stage('BatchSpectralKalmanFilter.stateForecast'):
+            xb = self.model.integrate(xa)
+        with stage('BatchSpectralKalmanFilter.covarianceForecast', 
+                    2.*np.size(self.Q)):
+            f2 = self.m2*A + self.Q
+        return xb, f2
+
+    def variance(self, P):
+        variance = (self.grid.spWeights*P).sum(axis=-1)/self.grid.size
+        return np.repeat(variance[:,None], self.grid.J, axis=1)
@@ -0,0 +1,381 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Benchmark suite
+
+Times the hot paths of the lab (grid, correlation models, model 
+propagation, Kalman Filter steps and `DM93Lib` spectral functions) 
+across resolutions.  Dense implementations and their fast 
+alternatives (FFT, spectral) are grouped by operation such that they 
+are compared side by side; dense benchmarks are skipped above 
+`maxDenseN` (their cost grows as J**2 or J**3), as are the 2D 
+benchmarks (J**2 points).
+
+Results are saved in JSON, with the complexity slope (log-log slope of
+time versus J) of each benchmark, and can be compared to a baseline 
+with `compareBenchmarks`.
+'''
+import json
+import time
+import platform
+import numpy as np 
+
+from gridCls import Grid, Grid2D
+from covarianceCls import Covariance, CirculantCovariance, PackedCovariance
+from covarianceCls import LowRankCovariance, DiagonalCovariance
+from covarianceCls import HybridCovariance, Soar
+from spectralModelCls import AdvectionDiffusionModel, BurgersModel
+from spectralModelCls import VariableAdvectionDiffusionModel
+from spectralModelCls import AdvectionDiffusionModel2D
+from kalmanFilterCls import KalmanFilter, SpectralKalmanFilter
+from analysisLib import directAnalysis
+from DM93Lib import analSpVar, spVarStationary, convRateAssymp, \
+                    fcstSpVarPropagator
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+#----| benchmarks |----------------------------------
+
+class _Setup(object):
+    ''' Objects shared by the benchmarks of one resolution '''
+    km = 1000.
+    h = 3600.
+
+    def __init__(self, N):
+        self.N = N
+        self.L = 16000.*self.km
+        self.U = 100.*self.km/self.h
+        self.dt = self.h
+        self.grid = Grid(N, self.L)
+        self.x = np.random.normal(size=self.grid.J)
+        self.fctCorr = Soar(self.grid, self.L/20.)
+        self.model = AdvectionDiffusionModel(   self.grid, self.U, 
+                                                dt=self.dt)
+        self.B = CirculantCovariance.fromCorrModel(self.fctCorr, 2.)
+        self.R = CirculantCovariance(self.grid, 0.1*np.ones(N+1))
+        self.Q = CirculantCovariance.fromCorrModel(self.fctCorr, 0.01)
+        # -- analytical spectra for `DM93Lib` functions
+        self.f2 = 2.*self.fctCorr.powSpecTh()
+        self.r2 = 0.1*np.ones(N+1)
+        self.q2 = 0.01*self.fctCorr.powSpecTh()
+
+    def dense(self, cov):
+        return Covariance(self.grid, cov.matrix)
+
+    def coarseModel(self, factor):
+        model = AdvectionDiffusionModel(Grid(self.N//factor, self.L), 
+                                        self.U, dt=self.dt)
+        model.M
+        return model
+
+    def coarsePropagation(self, P, model):
+        coarse = model.grid
+        Pc = model(P.transfer(coarse).matrix)
+        return Covariance(coarse, Pc).transfer(self.grid).matrix
+
+    def spectralKF2D(self):
+        grid = Grid2D(self.N, self.L)
+        model = AdvectionDiffusionModel2D(  grid, (self.U, 0.5*self.U), 
+                                            dt=self.dt)
+        R = CirculantCovariance(grid, 0.1*np.ones(grid.spShape))
+        B = CirculantCovariance.fromCorrModel2D(grid, self.fctCorr, 2.)
+        Q = CirculantCovariance.fromCorrModel2D(grid, self.fctCorr, 0.01)
+        return SpectralKalmanFilter(model, R, Q), B, B.random()
+
+    def hybrid(self, nEns=20):
+        localization = CirculantCovariance.fromCorrModel(
+                                                Soar(self.grid, self.L/10.))
+        return HybridCovariance.fromEnsemble(   self.grid, self.B, 
+                                                self.B.random(size=nEns), 
+                                                localization)
+
+
+# -- (operation, implementation, dense, setup, function)
+#    dense benchmarks (and 2D ones, J**2 points) are limited to maxDenseN,
+#    setup(s) prepares the arguments (untimed), function(s, args) is timed
+BENCHMARKS = [
+    ('grid construction', 'Grid (F matrix)', True,
+        lambda s: None, 
+        lambda s, a: Grid(s.N, s.L).F),
+    ('grid construction', 'Grid (lazy F)', False,
+        lambda s: None, 
+        lambda s, a: Grid(s.N, s.L)),
+    ('transform', 'Grid.transform', True,
+        lambda s: s.grid.F, 
+        lambda s, a: s.grid.transform(s.x)),
+    ('transform', 'Grid.fftTransform', False,
+        lambda s: None, 
+        lambda s, a: s.grid.fftTransform(s.x)),
+    ('inverse transform', 'Grid.inverse', True,
+        lambda s: s.grid.F, 
+        lambda s, a: s.grid.inverse(s.x)),
+    ('inverse transform', 'Grid.fftInverse', False,
+        lambda s: s.grid.fftTransform(s.x), 
+        lambda s, a: s.grid.fftInverse(a)),
+    ('correlation construction', 'Soar.matrix', True,
+        lambda s: None, 
+        lambda s, a: Soar(s.grid, s.L/20.).matrix),
+    ('correlation construction', 'CirculantCovariance.fromCorrModel', False,
+        lambda s: None, 
+        lambda s, a: CirculantCovariance.fromCorrModel(
+                                            Soar(s.grid, s.L/20.))),
+    ('correlated sampling', 'Covariance.random', True,
+        lambda s: s.dense(s.B), 
+        lambda s, a: a.random()),
+    ('correlated sampling', 'CirculantCovariance.random', False,
+        lambda s: None, 
+        lambda s, a: s.B.random()),
+    ('model construction', 'AdvectionDiffusionModel.M', True,
+        lambda s: s.grid.F, 
+        lambda s, a: AdvectionDiffusionModel(s.grid, s.U, dt=s.dt).M),
+    ('state propagation', 'SpectralModel.tangentLinear (M)', True,
+        lambda s: s.model.M, 
+        lambda s, a: s.model.M.dot(s.x)),
+    ('state propagation', 'AdvectionDiffusionModel.tangentLinear (FFT)', 
+        False,
+        lambda s: None, 
+        lambda s, a: s.model.tangentLinear(s.x)),
+    ('state propagation', 'VariableAdvectionDiffusionModel (RK4)', False,
+        lambda s: VariableAdvectionDiffusionModel(
+                    s.grid, s.U*(1.+0.5*np.sin(2.*np.pi*s.grid.x/s.L)), 
+                    dt=s.dt), 
+        lambda s, a: a(s.x)),
+    ('covariance propagation', 'M.P.Mt (dense)', True,
+        lambda s: s.B.matrix, 
+        lambda s, a: s.model(a)),
+    ('covariance propagation', 'M.P.Mt at N/3 with transfers (dense)', True,
+        lambda s: (s.dense(s.B), s.coarseModel(3)), 
+        lambda s, a: s.coarsePropagation(a[0], a[1])),
+    ('covariance propagation', 'tangentLinear on P (FFT)', True,
+        lambda s: s.B.matrix, 
+        lambda s, a: s.model.tangentLinear(s.model.tangentLinear(a).T)),
+    ('covariance propagation', 'BurgersModel.tangentLinear on P (FFT)', 
+        True,
+        lambda s: (BurgersModel(s.grid, s.U, dt=s.dt), s.B.matrix), 
+        lambda s, a: a[0].tangentLinear(a[0].tangentLinear(a[1], s.x).T, 
+                                        s.x)),
+    ('covariance propagation', 'm2*f2 (spectral)', False,
+        lambda s: SpectralKalmanFilter(s.model, s.R, s.Q), 
+        lambda s, a: a.forecast(s.x, s.B)),
+    ('KF analysis', 'KalmanFilter.analyse', True,
+        lambda s: (KalmanFilter(s.model, s.dense(s.R), s.dense(s.Q)), 
+                    s.dense(s.B)),
+        lambda s, a: a[0].analyse(s.x, a[1], s.x)),
+    ('KF analysis', 'KalmanFilter.analyse (packed)', True,
+        lambda s: (KalmanFilter(s.model, s.dense(s.R), s.dense(s.Q), 
+                                packed=True), 
+                    PackedCovariance.fromMatrix(s.grid, s.B.matrix)),
+        lambda s, a: a[0].analyse(s.x, a[1], s.x)),
+    ('KF analysis', 'KalmanFilter.analyse (Joseph)', True,
+        lambda s: (KalmanFilter(s.model, s.dense(s.R), s.dense(s.Q), 
+                                joseph=True), 
+                    s.dense(s.B)),
+        lambda s, a: a[0].analyse(s.x, a[1], s.x)),
+    ('KF analysis', 'KalmanFilter.analyse (low rank, r=20)', False,
+        lambda s: (KalmanFilter(s.model, DiagonalCovariance(s.grid, 0.1), 
+                                s.Q), 
+                    LowRankCovariance(s.grid, 0.01, 
+                                        s.B.sqrtDot(np.random.normal(
+                                            size=(20, s.grid.J))).T
+                                        /np.sqrt(20.))),
+        lambda s, a: a[0].analyse(s.x, a[1], s.x)),
+    ('KF analysis', 'SpectralKalmanFilter.analyse', False,
+        lambda s: SpectralKalmanFilter(s.model, s.R, s.Q), 
+        lambda s, a: a.analyse(s.x, s.B, s.x)),
+    ('2D KF cycle (J**2 points)', 'SpectralKalmanFilter on Grid2D', True,
+        lambda s: s.spectralKF2D(), 
+        lambda s, a: a[0].forecast(*a[0].analyse(a[2], a[1], a[2]))),
+    ('direct analysis (correlated R)', 'directAnalysis (dense)', True,
+        lambda s: (s.dense(s.B), Covariance(s.grid, s.Q.matrix)), 
+        lambda s, a: directAnalysis(s.x, s.x, a[0], a[1], method='dense')),
+    ('direct analysis (correlated R)', 'directAnalysis (auto, dense input)', 
+        True,
+        lambda s: (s.dense(s.B), Covariance(s.grid, s.Q.matrix)), 
+        lambda s, a: directAnalysis(s.x, s.x, a[0], a[1])),
+    ('direct analysis (correlated R)', 'directAnalysis (spectral)', False,
+        lambda s: None, 
+        lambda s, a: directAnalysis(s.x, s.x, s.B, s.Q)),
+    ('hybrid covariance', 'blend matrix dot (20 members)', True,
+        lambda s: s.hybrid().matrix, 
+        lambda s, a: a.dot(s.x)),
+    ('hybrid covariance', 'HybridCovariance.dot (20 members)', False,
+        lambda s: s.hybrid(), 
+        lambda s, a: a.dot(s.x)),
+    ('spectral functions', 'analSpVar', False,
+        lambda s: None, 
+        lambda s, a: analSpVar(s.f2, s.r2)),
+    ('spectral functions', 'fcstSpVarPropagator', False,
+        lambda s: None, 
+        lambda s, a: fcstSpVarPropagator(s.grid, s.f2, s.r2, s.q2, 
+                                            dt=s.dt)),
+    ('spectral functions', 'spVarStationary', False,
+        lambda s: None, 
+        lambda s, a: spVarStationary(s.grid, s.r2, s.q2, dt=s.dt)),
+    ('spectral functions', 'convRateAssymp', False,
+        lambda s: None, 
+        lambda s, a: convRateAssymp(s.grid, s.r2, s.q2, dt=s.dt)),
+    ]
+
+
+#----| runner |--------------------------------------
+
+def timeCall(func, repeat=3, minTime=0.05):
+    ''' Best time of one call [s]
+
+    The number of calls per measure is increased until a measure lasts
+    at least `minTime`; the best of `repeat` measures is returned.
+
+    :Parameters:
+        func : callable
+            function to time (without argument)
+        repeat : int
+            number of measures
+        minTime : float
+            minimal duration of a measure [s]
+    '''
+    number = 1
+    while True:
+        start = _timer()
+        for i in xrange(number): func()
+        elapsed = _timer() - start
+        if elapsed >= minTime or number >= 1e6: break
+        number *= max(2, min(10, int(minTime/max(elapsed, 1e-9))+1))
+    best = elapsed/number
+    for i in xrange(repeat-1):
+        start = _timer()
+        for j in xrange(number): func()
+        best = min(best, (_timer()-start)/number)
+    return best
+
+
+def complexitySlope(J, times):
+    ''' Log-log slope of times versus resolution (None if < 2 points) '''
+    J = np.asarray(J, dtype=float)
+    times = np.asarray(times, dtype=float)
+    if len(J) < 2: return None
+    return float(np.polyfit(np.log(J), np.log(times), 1)[0])
+
+
+def runBenchmarks(  resolutions=(48, 96, 192, 384, 768, 1536, 3072), 
+                    maxDenseN=384, names=None, repeat=3, minTime=0.05, 
+                    verbose=False):
+    ''' Run the benchmarks across resolutions
+
+    Returns a dictionary with the machine description ('machine') and,
+    for each benchmark, its operation, whether it is dense, the 
+    resolutions ('N', 'J'), best times per call ('time' [s]) and 
+    complexity slope ('slope').
+
+    :Parameters:
+        resolutions : list
+            spectral truncatures N
+        maxDenseN : int
+            largest N of dense benchmarks
+        names : list | None
+            benchmarks to run (all by default)
+        repeat, minTime : 
+            see `timeCall`
+        verbose : bool
+            print the times as they are measured
+    '''
+    np.random.seed(0)
+    results = dict()
+    for N in resolutions:
+        setup = _Setup(N)
+        for operation, name, dense, prepare, func in BENCHMARKS:
+            if names is not None and name not in names: continue
+            if dense and N > maxDenseN: continue
+            args = prepare(setup)
+            t = timeCall(lambda: func(setup, args), repeat=repeat, 
+                         minTime=minTime)
+            bench = results.setdefault(name, {  'operation':operation, 
+                                                'dense':dense, 'N':[], 
+                                                'J':[], 'time':[]})
+            bench['N'].append(N)
+            bench['J'].append(setup.grid.J)
+            bench['time'].append(t)
+            if verbose:
+                print('N=%-5d %-45s %.3e s'%(N, name, t))
+    for bench in results.itervalues():
+        bench['slope'] = complexitySlope(bench['J'], bench['time'])
+
+    return {'machine':{ 'platform':platform.platform(), 
+                        'python':platform.python_version(),
+                        'numpy':np.__version__,
+                        'date':time.strftime('%Y-%m-%d %H:%M:%S')},
+            'benchmarks':results}
+
+
+def benchmarkTable(results):
+    ''' Benchmark results as a text table (grouped by operation) '''
+    benchmarks = results['benchmarks']
+    resolutions = sorted(set(N for b in benchmarks.itervalues() 
+                                for N in b['N']))
+    lines = ['%-48s'%'benchmark' + ''.join('%11s'%('N=%d'%N) 
+                                            for N in resolutions) 
+                + '%8s'%'slope']
+    for operation in sorted(set(b['operation'] 
+                                for b in benchmarks.itervalues())):
+        lines.append('-- %s'%operation)
+        for name in sorted(benchmarks):
+            b = benchmarks[name]
+            if b['operation'] != operation: continue
+            times = dict(zip(b['N'], b['time']))
+            line = '   %-45s'%name
+            for N in resolutions:
+                line += '%11.2e'%times[N] if N in times else '%11s'%'-'
+            slope = b['slope']
+            line += '%8.2f'%slope if slope is not None else '%8s'%'-'
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def saveBenchmarks(fileName, results):
+    ''' Save benchmark results in JSON '''
+    with open(fileName, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def loadBenchmarks(fileName):
+    ''' Load benchmark results saved with `saveBenchmarks` '''
+    with open(fileName) as f:
+        return json.load(f)
+
+
+def compareBenchmarks(results, baseline):
+    ''' Time ratios (results/baseline) for common benchmarks and N
+
+    Returns a dictionary {name: {N: ratio}}; ratios above 1 are 
+    slowdowns.
+
+    :Parameters:
+        results, baseline : dict
+            benchmark results (see `runBenchmarks`)
+    '''
+    ratios = dict()
+    for name, bench in results['benchmarks'].iteritems():
+        ref = baseline['benchmarks'].get(name)
+        if ref is None: continue
+        refTimes = dict(zip(ref['N'], ref['time']))
+        common = dict(  (N, t/refTimes[N]) 
+                        for N, t in zip(bench['N'], bench['time'])
+                        if N in refTimes)
+        if common: ratios[name] = common
+    return ratios
@@ -0,0 +1,169 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Checkpoint and restart of assimilation cycles '''
+import os
+import numpy as np 
+
+from covarianceCls import Covariance, CirculantCovariance, DiagonalCovariance
+from covarianceCls import PackedCovariance, LowRankCovariance
+
+class Checkpointer(object):
+    ''' Checkpoint and restart the state of an assimilation cycle
+
+    The state (arrays, scalars and covariances) and the state of the
+    `numpy.random` generator are saved in a `.npz` file every `every` 
+    steps; the file is written aside and renamed, such that an 
+    interruption never leaves a partial checkpoint.  A cycle restarted
+    from a checkpoint is bit-identical to an uninterrupted one.
+
+    Covariances are saved in their most compact exact form: spectral 
+    variances for `CirculantCovariance`, variances for 
+    `DiagonalCovariance`, the diagonal and factor of 
+    `LowRankCovariance`, the upper triangle of `PackedCovariance` and 
+    of exactly symmetric dense matrices (the full matrix otherwise).
+
+    :Parameters:
+        fileName : str
+            checkpoint file
+        every : int
+            checkpoint interval (steps)
+
+    :Methods:
+        isCheckpointStep : int
+            return True if the state is saved after `step`
+        save : int, **
+            save the state after `step`
+        load : `Grid`
+            return the last saved step and state (or None) and restore 
+            the random generator state
+        remove : 
+            remove the checkpoint file
+    '''
+
+    def __init__(self, fileName, every=10):
+        self.fileName = fileName
+        self.every = every
+
+    def isCheckpointStep(self, step):
+        ''' Return True if the state is saved after `step` '''
+        return (step+1)%self.every == 0
+
+    def save(self, step, **state):
+        ''' Save the state after `step` (and the random generator state)
+
+        :Parameters:
+            step : int
+                last completed step
+            state : np.ndarray | float | `Covariance`
+                state variables
+        '''
+        arrays = {'step':step}
+        name, keys, pos, hasGauss, cachedGaussian = np.random.get_state()
+        arrays.update({ 'rng/name':name, 'rng/keys':keys, 'rng/pos':pos, 
+                        'rng/hasGauss':hasGauss, 
+                        'rng/cachedGaussian':cachedGaussian})
+        for key, value in state.iteritems():
+            if isinstance(value, Covariance):
+                kind, data = _packCovariance(value)
+                if isinstance(data, tuple):
+                    for iPart, part in enumerate(data):
+                        arrays['cov/%s/%s/%d'%(kind, key, iPart)] = part
+                else:
+                    arrays['cov/%s/%s'%(kind, key)] = data
+            else:
+                arrays['var/'+key] = np.asarray(value)
+
+        tmpName = self.fileName+'.tmp'
+        with open(tmpName, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmpName, self.fileName)
+
+    def load(self, grid):
+        ''' Last saved step and state, or None if there is no checkpoint
+
+        The random generator state is restored.
+
+        :Parameters:
+            grid : `Grid`
+                grid of the covariances
+        '''
+        if not os.path.exists(self.fileName):
+            return None
+        state = dict()
+        parts = dict()
+        with np.load(self.fileName) as data:
+            step = int(data['step'])
+            np.random.set_state((   str(data['rng/name']), data['rng/keys'], 
+                                    int(data['rng/pos']), 
+                                    int(data['rng/hasGauss']),
+                                    float(data['rng/cachedGaussian'])))
+            for key in data.files:
+                prefix, sep, name = key.partition('/')
+                if prefix == 'var':
+                    state[name] = data[key]
+                elif prefix == 'cov':
+                    kind, name = name.split('/', 1)
+                    name, sep, iPart = name.partition('/')
+                    if sep:
+                        covParts = parts.setdefault((kind, name), dict())
+                        covParts[int(iPart)] = data[key]
+                    else:
+                        state[name] = _unpackCovariance(grid, kind, 
+                                                        data[key])
+        for (kind, name), data in parts.iteritems():
+            data = tuple(data[iPart] for iPart in sorted(data))
+            state[name] = _unpackCovariance(grid, kind, data)
+        return step, state
+
+    def remove(self):
+        ''' Remove the checkpoint file '''
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+
+def _packCovariance(cov):
+    if isinstance(cov, CirculantCovariance):
+        return 'circulant', cov.spVariance
+    elif isinstance(cov, DiagonalCovariance):
+        return 'diagonal', cov.variance
+    elif isinstance(cov, PackedCovariance):
+        return 'symmetric', cov.packed
+    elif isinstance(cov, LowRankCovariance):
+        return 'lowrank', (cov.diagonal, cov.U)
+    matrix = np.asarray(cov.matrix)
+    if np.array_equal(matrix, matrix.T):
+        return 'packed', matrix[np.triu_indices(len(matrix))]
+    return 'dense', matrix
+
+def _unpackCovariance(grid, kind, data):
+    if kind == 'circulant':
+        return CirculantCovariance(grid, data)
+    elif kind == 'diagonal':
+        return DiagonalCovariance(grid, data)
+    elif kind == 'symmetric':
+        return PackedCovariance(grid, data)
+    elif kind == 'lowrank':
+        return LowRankCovariance(grid, *data)
+    elif kind == 'packed':
+        return Covariance(grid, PackedCovariance(grid, data).matrix)
+    elif kind == 'dense':
+        return Covariance(grid, data)
+    raise ValueError('unknown covariance representation: %s'%kind)
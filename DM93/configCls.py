@@ -0,0 +1,287 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import threading
+import numpy as np 
+
+from gridCls import Grid
+from diskCacheCls import DiskCache
+from spectralModelCls import AdvectionDiffusionModel, BurgersModel
+from covarianceCls import Covariance, Uncorrelated, Foar, Soar, Gaussian
+
+CORR_MODELS = dict((cls.name, cls) for cls in (Uncorrelated, Foar, Soar, 
+                                                Gaussian))
+
+MODELS = {  'advectionDiffusion':AdvectionDiffusionModel, 
+            'burgers':BurgersModel}
+
+class Config(object):
+    ''' Experiment configuration
+
+    Parameters are read-only; the derived objects (grid, model, 
+    correlation models and covariances) are built on first access and 
+    cached.  The cache is keyed by the parameters each object depends 
+    on, such that configurations derived with `replace` share the 
+    objects they have in common (e.g. the grid and model when only a 
+    variance changes).  A configuration can be shared between threads 
+    and is sent to worker processes with its cache.
+
+    :Parameters:
+        N : int
+            spectral truncature
+        L : float
+            domain length [m]
+        dt : float
+            time increment [s]
+        U : float
+            zonal wind speed [m/s]
+        nuFactor : float
+            non-dimensional viscosity (nu = nuFactor/dt*(2 pi L)**2)
+        modelName : str
+            model ('advectionDiffusion' or the nonlinear 'burgers', for
+            which the Kalman Filter is the extended Kalman Filter)
+        obsCorrName, fctCorrName, modCorrName : str
+            observation, forecast and model error correlation models 
+            ('uncorrelated', 'foar', 'soar' or 'gaussian')
+        obsLc, fctLc, modLc : float | None
+            correlation lengths [m] (L/20 for forecast and L/50 for 
+            model errors by default)
+        obsVar, fctVar, modVar : float
+            error variances
+        obsBias, fctBias, modBias : float
+            error biases
+        cacheDir : str | None
+            directory of the on-disk cache of the grid, correlation and 
+            propagator matrices (no cache by default)
+        cacheMaxSize : int | None
+            maximal size of the on-disk cache [bytes]
+        dtype : str
+            floating point type of the grid fields, matrices and 
+            ensembles ('float64' or 'float32')
+        solveDtype : str
+            floating point type of the filters gain solve and covariance
+            update ('float64' keeps them in double precision when 
+            `dtype` is 'float32')
+        coarseN : int | None
+            spectral truncature of the reduced resolution covariance 
+            propagation of the Kalman Filter (full resolution by 
+            default)
+
+    :Attributes:
+        nu : float
+            viscosity coefficient
+        cache : `DiskCache` | None
+            on-disk cache
+        grid : `Grid`
+            periodic grid
+        model : `SpectralModel`
+            model
+        coarseModel : `SpectralModel` | None
+            model on the coarse grid (truncature `coarseN`)
+        obsCorr, fctCorr, modCorr : `CorrModel`
+            correlation models
+        R, B, Q : `Covariance`
+            observation, (initial) forecast and model error covariances
+
+    :Methods:
+        fromFile : str
+            load a configuration script
+        replace : 
+            return a copy with some parameters replaced
+    '''
+
+    # -- units of space: m and time: s
+    km = 1000.
+    h = 3600.
+    day = 24.*h
+
+    DEFAULTS = {'N':48, 'L':16000.*km, 'dt':1.*h, 'U':100.*km/h, 
+                'nuFactor':0., 'modelName':'advectionDiffusion',
+                'obsCorrName':'uncorrelated', 'obsLc':None, 'obsVar':0.1, 
+                'obsBias':0.,
+                'fctCorrName':'soar', 'fctLc':None, 'fctVar':2., 
+                'fctBias':0.,
+                'modCorrName':'gaussian', 'modLc':None, 'modVar':0.01, 
+                'modBias':0.,
+                'cacheDir':None, 'cacheMaxSize':None,
+                'dtype':'float64', 'solveDtype':'float64',
+                'coarseN':None,
+                }
+
+    def __init__(self, **kwargs):
+        params = dict(self.DEFAULTS)
+        for key, value in kwargs.iteritems():
+            if key not in params:
+                raise ValueError('unknown configuration parameter: %s'%key)
+            params[key] = value
+        self.__dict__['_params'] = params
+        self.__dict__['_cache'] = dict()
+        self.__dict__['_lock'] = threading.RLock()
+
+    @classmethod
+    def fromFile(cls, fileName, **kwargs):
+        ''' Load a configuration script 
+
+        The script is executed and the configuration parameters it 
+        defines are retained (other names are ignored).
+
+        :Parameters:
+            fileName : str
+                configuration script
+            kwargs : 
+                parameters overriding those of the script
+        '''
+        namespace = {'km':cls.km, 'h':cls.h, 'day':cls.day}
+        execfile(fileName, namespace)
+        params = dict(  (key, namespace[key]) for key in cls.DEFAULTS 
+                        if key in namespace)
+        params.update(kwargs)
+        return cls(**params)
+
+    def replace(self, **kwargs):
+        ''' Return a configuration with some parameters replaced
+
+        The new configuration shares the cache of this one.
+
+        :Parameters:
+            kwargs : 
+                parameters to replace
+        '''
+        params = dict(self._params)
+        params.update(kwargs)
+        config = self.__class__(**params)
+        config.__dict__['_cache'] = self._cache
+        config.__dict__['_lock'] = self._lock
+        return config
+
+    @property
+    def parameters(self):
+        return dict(self._params)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_params'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Config is read-only, use replace()')
+
+    def __getstate__(self):
+        return {'_params':self._params, '_cache':self._cache}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__['_lock'] = threading.RLock()
+
+    def __repr__(self):
+        return 'Config(%s)'%', '.join(  '%s=%r'%(key, self._params[key]) 
+                                        for key in sorted(self._params))
+
+    #----| derived objects |-----------------------------
+
+    # -- parameters of the grid (on which all objects are defined)
+    _GRID_KEYS = ('N', 'L', 'cacheDir', 'cacheMaxSize', 'dtype')
+
+    # -- parameters of the model
+    _MODEL_KEYS = ('modelName', 'U', 'dt', 'nuFactor')
+
+    def _cached(self, name, keys, builder):
+        key = (name,) + tuple(self._params[k] for k in keys)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = builder()
+            return self._cache[key]
+
+    @property
+    def nu(self):
+        return self.nuFactor/self.dt*(2.*np.pi*self.L)**2
+
+    @property
+    def cache(self):
+        if self.cacheDir is None: return None
+        return self._cached('cache', ('cacheDir', 'cacheMaxSize'),
+                            lambda: DiskCache(  self.cacheDir, 
+                                                maxSize=self.cacheMaxSize))
+
+    @property
+    def grid(self):
+        return self._cached('grid', self._GRID_KEYS, 
+                            lambda: Grid(   self.N, self.L, cache=self.cache,
+                                            dtype=self.dtype))
+
+    @property
+    def model(self):
+        return self._cached('model', self._GRID_KEYS+self._MODEL_KEYS,
+                            lambda: MODELS[self.modelName](
+                                        self.grid, self.U, dt=self.dt, 
+                                        nu=self.nu))
+
+    @property
+    def coarseModel(self):
+        if self.coarseN is None: return None
+        return self._cached('coarseModel', 
+                            self._GRID_KEYS+('coarseN',)+self._MODEL_KEYS,
+                            lambda: MODELS[self.modelName](
+                                        Grid(   self.coarseN, self.L, 
+                                                cache=self.cache, 
+                                                dtype=self.dtype), 
+                                        self.U, dt=self.dt, nu=self.nu))
+
+    def _corrModel(self, prefix, defaultLc):
+        keys = self._GRID_KEYS + (prefix+'CorrName', prefix+'Lc')
+        def build():
+            Lc = self._params[prefix+'Lc']
+            if Lc is None: Lc = defaultLc
+            cls = CORR_MODELS[self._params[prefix+'CorrName']]
+            return cls(self.grid, Lc)
+        return self._cached(prefix+'Corr', keys, build)
+
+    def _covariance(self, prefix, corrModel):
+        keys = self._GRID_KEYS + (prefix+'CorrName', prefix+'Lc', 
+                                    prefix+'Var')
+        return self._cached(prefix+'Cov', keys, 
+                            lambda: Covariance( self.grid, 
+                                                self._params[prefix+'Var']
+                                                * corrModel.matrix))
+
+    @property
+    def obsCorr(self):
+        return self._corrModel('obs', None)
+
+    @property
+    def fctCorr(self):
+        return self._corrModel('fct', self.L/20.)
+
+    @property
+    def modCorr(self):
+        return self._corrModel('mod', self.L/50.)
+
+    @property
+    def R(self):
+        return self._covariance('obs', self.obsCorr)
+
+    @property
+    def B(self):
+        return self._covariance('fct', self.fctCorr)
+
+    @property
+    def Q(self):
+        return self._covariance('mod', self.modCorr)
@@ -21,6 +21,13 @@
 
 ''' Correlation models library '''
 import numpy as np
+try:
+    from scipy.linalg import blas as scipyBlas
+except ImportError:
+    scipyBlas = None
+
+from profilerLib import stage, fftFlops
+from variationalLib import conjugateGradient
 
 class Covariance(object):
     ''' Covariance
@@ -36,34 +43,903 @@ class Covariance(object):
     :Methods:
         random : None|float, None|float
             generate a random realisation from the covariance model
+        dot : np.ndarray
+            apply the covariance on a vector
+        solve : np.ndarray
+            apply the inverse covariance on a vector
+        sqrtDot : np.ndarray
+            apply a square root of the covariance on a control vector
+        sqrtTDot : np.ndarray
+            apply the transposed square root on a vector
+        scaled : float
+            return the covariance multiplied by a factor
     '''
 
     def __init__(self, grid, matrix):
         self.grid = grid
 
-        # -- assert matrix is symetric
-        for i in xrange(self.grid.J):
-            for j in xrange(i):
-                np.testing.assert_almost_equal(matrix[i,j], matrix[j,i])
+        # -- assert matrix is symetric (to single precision accuracy for
+        #    single precision matrices)
+        decimal = 7 if matrix.dtype.itemsize >= 8 else 4
+        with stage('Covariance.validate', matrix.size):
+            np.testing.assert_array_almost_equal(   matrix, matrix.T, 
+                                                    decimal=decimal)
         self.matrix = matrix
 
-    def random(self, bias=0.):
+    def random(self, bias=0., size=None):
         ''' Generate a random realisation from the covariance model
         
         :Parameters:
             bias : float
                 uniform bias (mean)
+            size : int | None
+                number of realisations (stacked on the first axis)
         '''
         mean = bias * np.ones(self.grid.J)
-        return np.random.multivariate_normal(mean, self.matrix)
+        J = self.grid.J
+        with stage('Covariance.random', 21.*J**3 + 2.*J**2*(size or 1)):
+            return self.grid.asDtype(np.random.multivariate_normal(
+                                            mean, self.matrix, size=size))
 
     @property
     def variance(self):
         return self.matrix.diagonal()
+
+    @property
+    def controlSize(self):
+        ''' Size of the control vector space of `sqrtDot` '''
+        return np.size(self.variance)
+
+    def dot(self, x):
+        ''' Apply the covariance on a vector (last axis of `x`): C.x
+
+        :Parameters:
+            x : np.ndarray
+                vector(s)
+        '''
+        with stage('Covariance.dot', 2.*self.grid.J*x.size):
+            return x.dot(self.matrix.T)
+
+    def solve(self, x):
+        ''' Apply the inverse covariance on a vector (last axis of `x`): 
+        C^-1.x
+
+        :Parameters:
+            x : np.ndarray
+                vector(s)
+        '''
+        J = self.grid.J
+        with stage('Covariance.solve', 2./3*J**3 + 2.*J*x.size):
+            return np.linalg.solve(self.matrix, x.T).T
+
+    def sqrtDot(self, v):
+        ''' Apply the symmetric square root on a control vector: C^1/2.v
+
+        The square root is computed once (eigen decomposition) and kept.
+
+        :Parameters:
+            v : np.ndarray
+                control vector(s) (last axis)
+        '''
+        return v.dot(self._sqrtMatrix().T)
+
+    def sqrtTDot(self, x):
+        ''' Apply the transposed square root on a vector: C^T/2.x 
+
+        :Parameters:
+            x : np.ndarray
+                vector(s) (last axis)
+        '''
+        return x.dot(self._sqrtMatrix())
+
+    def scaled(self, factor):
+        ''' Covariance multiplied by `factor` (e.g. inflation) 
+
+        :Parameters:
+            factor : float
+                positive factor
+        '''
+        # -- symmetrized: scaling also scales round-off asymmetries
+        matrix = factor*self.matrix
+        return Covariance(self.grid, 0.5*(matrix+matrix.T))
+
+    def transfer(self, grid):
+        ''' Covariance transferred to a grid of another resolution: 
+        T.C.T' with T the spectral truncation or zero-padding (see 
+        `Grid.transfer`), applied by FFT on the rows then the columns
+
+        :Parameters:
+            grid : `Grid`
+                target grid (same length)
+        '''
+        return Covariance(grid, self.grid.transfer(
+                                self.grid.transfer(self.matrix, grid).T, grid))
+
+    def _sqrtMatrix(self):
+        if getattr(self, '_sqrt', None) is None:
+            eigVal, eigVec = np.linalg.eigh(self.matrix)
+            eigVal[eigVal < 0.] = 0.
+            self._sqrt = (eigVec*np.sqrt(eigVal)).dot(eigVec.T)
+        return self._sqrt
         
     def __getitem__(self, slice):
         return self.matrix[slice]
 
+
+class CirculantCovariance(Covariance):
+    ''' Homogeneous covariance on a periodic grid
+
+    The covariance matrix is circulant and diagonalized by the Fourier
+    transform: it is stored through its eigenvalues (one per wavenumber)
+    and applied by FFT in O(J log J).  The dense matrix is only built
+    (and kept) when `matrix` is accessed.
+
+    On a `Grid2D`, the covariance is homogeneous on the doubly periodic
+    domain (block circulant), fields have the grid shape and the 
+    eigenvalues the shape of the 2D half spectrum; correlation models 
+    are extended to 2D with `fromCorrModel2D`.
+
+    :Attributes:
+        grid : `Grid` | `Grid2D`
+            space domain descriptor
+        spVariance : np.ndarray
+            covariance eigenvalues indexed by `grid.halfK` (of shape 
+            `grid.spShape`) (spectral variances)
+        matrix : np.ndarray
+            symetric circulant matrix
+        variance : np.ndarray
+            diagonal of covariance matrix
+    '''
+
+    def __init__(self, grid, spVariance):
+        self.grid = grid
+        self.spVariance = grid.asDtype(np.asarray(spVariance, dtype=float))
+        assert self.spVariance.shape == self.grid.spShape
+
+    @classmethod
+    def fromColumn(cls, grid, column):
+        ''' Build from the matrix column associated with x=0 
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            column : np.ndarray
+                covariance between the domain center and every grid point
+        '''
+        return cls(grid, grid.fftTransform(column).real)
+
+    @classmethod
+    def fromMatrix(cls, grid, matrix):
+        ''' Build from a (circulant) covariance matrix
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            matrix : np.ndarray
+                circulant covariance matrix
+        '''
+        return cls.fromColumn(grid, matrix[:,grid.size//2].reshape(grid.shape))
+
+    @classmethod
+    def fromCorrModel(cls, corrModel, variance=1.):
+        ''' Build from a correlation model, without its matrix 
+
+        :Parameters:
+            corrModel : `CorrModel`
+                homogeneous correlation model
+            variance : float
+                constant variance
+        '''
+        return cls.fromColumn(corrModel.grid, variance*corrModel.corrFunc())
+
+    @classmethod
+    def fromCorrModel2D(cls, grid, corrModel, variance=1., isotropic=True):
+        ''' Build on a `Grid2D` from a correlation model, isotropic or 
+        separable (see `CorrModel.corrFunc2D`)
+
+        :Parameters:
+            grid : `Grid2D`
+                doubly periodic grid
+            corrModel : `CorrModel`
+                homogeneous correlation model (on `grid.grid1D`)
+            variance : float
+                constant variance
+            isotropic : bool
+                if True, isotropic correlations, else separable
+        '''
+        return cls.fromColumn(grid, 
+                                variance*corrModel.corrFunc2D(isotropic))
+
+    @classmethod
+    def homogenized(cls, cov):
+        ''' Homogeneous part of a covariance
+
+        The circulant covariance whose column is the average of the 
+        (periodic) diagonals of the covariance matrix, i.e. whose 
+        spectral variances are the diagonal of the covariance in 
+        spectral space.
+
+        :Parameters:
+            cov : `Covariance`
+                covariance
+        '''
+        if isinstance(cov, CirculantCovariance):
+            return cov
+        grid = cov.grid
+        idx = np.arange(grid.J)
+        diagonals = cov.matrix[idx[:,None], (idx[:,None]+idx[None,:])%grid.J]
+        return cls.fromColumn(grid, np.roll(diagonals.mean(axis=0), grid.N))
+
+    @classmethod
+    def fromCovariance(cls, cov, rtol=1e-8):
+        ''' Homogeneous form of a covariance
+
+        Circulant covariances are returned as is, correlation models and
+        constant diagonal covariances are converted without their matrix
+        and dense matrices are checked to be circulant, in O(J**2), 
+        to the relative tolerance `rtol`.  Raises `ValueError` if the 
+        covariance is not homogeneous.
+
+        :Parameters:
+            cov : `Covariance`
+                covariance
+            rtol : float
+                relative tolerance of the homogeneity check
+        '''
+        grid = cov.grid
+        if isinstance(cov, CirculantCovariance):
+            return cov
+        elif isinstance(cov, CorrModel):
+            return cls.fromCorrModel(cov)
+        elif isinstance(cov, DiagonalCovariance):
+            var = cov.variance
+            if (len(var) == grid.J 
+                    and np.allclose(var, var[0], rtol=rtol, atol=0.)):
+                return cls(grid, var[0]*np.ones(grid.N+1))
+            raise ValueError('inhomogeneous diagonal covariance')
+        elif isinstance(cov, (LowRankCovariance, HybridCovariance)):
+            raise ValueError('%s is not homogeneous'%cov.__class__.__name__)
+
+        matrix = cov.matrix
+        if matrix.shape != (grid.J, grid.J):
+            raise ValueError('covariance is not defined on the grid')
+        circulant = cls.fromMatrix(grid, matrix)
+        scale = np.abs(matrix.diagonal()).max()
+        if not np.allclose(circulant.matrix, matrix, rtol=0., 
+                            atol=rtol*scale):
+            raise ValueError('covariance matrix is not circulant')
+        return circulant
+
+    @property
+    def matrix(self):
+        if getattr(self, '_matrix', None) is None:
+            grid = self.grid
+            if grid.size > grid.J:
+                # -- 2D grids: covariance applied on the canonical basis
+                identity = np.eye(grid.size).reshape((grid.size,)+grid.shape)
+                self._matrix = self.dot(identity).reshape(grid.size, -1)
+            else:
+                column = np.roll(grid.fftInverse(self.spVariance), -grid.N)
+                idx = np.arange(grid.J)
+                self._matrix = column[(idx[:,None]-idx[None,:])%grid.J]
+        return self._matrix
+
+    @property
+    def variance(self):
+        var = (self.grid.spWeights*self.spVariance).sum()/self.grid.size
+        return var * np.ones(self.grid.shape)
+
+    def random(self, bias=0., size=None):
+        ''' Generate a random realisation from the covariance model
+        
+        :Parameters:
+            bias : float
+                uniform bias (mean)
+            size : int | None
+                number of realisations (stacked on the first axis)
+        '''
+        shape = self.grid.shape if size is None else (size,)+self.grid.shape
+        with stage('CirculantCovariance.random', 0.):
+            return bias + self.sqrtDot(
+                            self.grid.asDtype(np.random.normal(size=shape)))
+
+    def dot(self, x):
+        return self._apply(self.spVariance, x)
+
+    def solve(self, x):
+        return self._apply(1./self.spVariance, x)
+
+    def scaled(self, factor):
+        return CirculantCovariance(self.grid, factor*self.spVariance)
+
+    def transfer(self, grid):
+        n = min(self.grid.N, grid.N)
+        spVariance = np.zeros(grid.N+1)
+        spVariance[:n+1] = self.spVariance[:n+1]*(float(grid.J)/self.grid.J)
+        return CirculantCovariance(grid, spVariance)
+
+    def sqrtDot(self, v):
+        return self._apply(np.sqrt(np.maximum(self.spVariance, 0.)), v)
+
+    sqrtTDot = sqrtDot
+
+    def _apply(self, spectrum, x):
+        ''' Apply a spectral multiplier on the last axis of `x` '''
+        J = self.grid.J
+        with stage('CirculantCovariance.apply', fftFlops(J, x.size//J)):
+            return self.grid.fftInverse(spectrum*self.grid.fftTransform(x))
+
+
+class DiagonalCovariance(Covariance):
+    ''' Uncorrelated (diagonal) covariance
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        variance : np.ndarray
+            diagonal of covariance matrix 
+            (its size may differ from the grid for observations)
+        matrix : np.ndarray
+            diagonal matrix
+    '''
+
+    def __init__(self, grid, variance):
+        self.grid = grid
+        if np.isscalar(variance):
+            variance = variance * np.ones(self.grid.J)
+        self._variance = grid.asDtype(np.asarray(variance, dtype=float))
+
+    @property
+    def variance(self):
+        return self._variance
+
+    @property
+    def matrix(self):
+        return np.diag(self._variance)
+
+    def random(self, bias=0., size=None):
+        ''' Generate a random realisation from the covariance model
+        
+        :Parameters:
+            bias : float
+                uniform bias (mean)
+            size : int | None
+                number of realisations (stacked on the first axis)
+        '''
+        shape = (len(self._variance),) if size is None else (size, len(self._variance))
+        return bias + self.sqrtDot(
+                            self.grid.asDtype(np.random.normal(size=shape)))
+
+    def dot(self, x):
+        return self._variance*x
+
+    def solve(self, x):
+        return x/self._variance
+
+    def sqrtDot(self, v):
+        return np.sqrt(self._variance)*v
+
+    sqrtTDot = sqrtDot
+
+    def scaled(self, factor):
+        return DiagonalCovariance(self.grid, factor*self._variance)
+
+    def __getitem__(self, slice):
+        return self.matrix[slice]
+
+
+class PackedCovariance(Covariance):
+    ''' Symmetric covariance stored as its packed upper triangle
+
+    Only the J(J+1)/2 elements of the upper triangle are stored (row by
+    row, in the order of `numpy.triu_indices`), which halves the storage
+    and makes the covariance symmetric by construction: it is not 
+    checked.  The dense matrix is rebuilt (and not kept) when `matrix` 
+    is accessed.
+
+    With scipy, the symmetric products and rank updates only compute 
+    one triangle (BLAS `syrk`, half the operations of a product) and 
+    the covariance is applied on vectors from the packed storage (BLAS
+    `spmv`); numpy products of the dense matrix are used otherwise.
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        packed : np.ndarray
+            packed upper triangle
+        matrix : np.ndarray
+            symetric matrix
+        variance : np.ndarray
+            diagonal of covariance matrix
+
+    :Methods:
+        fromMatrix : `Grid`, np.ndarray
+            return the covariance with the upper triangle of a matrix
+        symmetricProduct : `Grid`, np.ndarray
+            return the covariance X'.X
+        rankUpdate : np.ndarray, float
+            return the covariance C + alpha.X'.X
+    '''
+
+    # -- indices of the upper triangles (by size)
+    _triuIndices = dict()
+
+    def __init__(self, grid, packed):
+        self.grid = grid
+        self.packed = grid.asDtype(packed)
+        self.size = int(np.sqrt(8*len(self.packed)+1)-1)//2
+        assert len(self.packed) == self.size*(self.size+1)//2
+
+    @classmethod
+    def fromMatrix(cls, grid, matrix):
+        ''' Build from the upper triangle of a matrix (the lower 
+        triangle is ignored)
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            matrix : np.ndarray
+                (symmetric) covariance matrix
+        '''
+        return cls(grid, matrix[cls._triu(len(matrix))])
+
+    @classmethod
+    def symmetricProduct(cls, grid, X):
+        ''' Symmetric rank-k product X'.X (e.g. sum of outer products 
+        of the rows of `X`)
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            X : np.ndarray
+                factor
+        '''
+        with stage('PackedCovariance.symmetricProduct', 
+                    X.shape[0]*X.shape[1]**2):
+            return cls(grid, cls._syrk(X)[cls._triu(X.shape[1])])
+
+    def rankUpdate(self, X, alpha=1.):
+        ''' Symmetric rank-k update C + alpha.X'.X (e.g. A = B - H'.H)
+
+        :Parameters:
+            X : np.ndarray
+                factor
+            alpha : float
+                factor of the update
+        '''
+        with stage('PackedCovariance.rankUpdate', X.shape[0]*self.size**2):
+            upper = np.zeros((self.size, self.size), order='F', 
+                             dtype=np.result_type(self.packed, X))
+            upper[self._triu(self.size)] = self.packed
+            upper = self._syrk(X, alpha, upper)
+            return PackedCovariance(self.grid, 
+                                    upper[self._triu(self.size)])
+
+    @staticmethod
+    def _syrk(X, alpha=1., C=None):
+        ''' alpha.X'.X (+ C), upper triangle only with scipy '''
+        if scipyBlas is None:
+            XtX = alpha*X.T.dot(X)
+            return XtX if C is None else C + XtX
+        syrk = scipyBlas.get_blas_funcs('syrk', (X,) if C is None 
+                                                    else (X, C))
+        # -- X.T is Fortran ordered: A.A' with A = X.T avoids a copy
+        if C is None:
+            return syrk(alpha, X.T)
+        return syrk(alpha, X.T, beta=1., c=C, overwrite_c=1)
+
+    @classmethod
+    def _triu(cls, n):
+        if n not in cls._triuIndices:
+            cls._triuIndices[n] = np.triu_indices(n)
+        return cls._triuIndices[n]
+
+    @property
+    def matrix(self):
+        rows, cols = self._triu(self.size)
+        matrix = np.empty((self.size, self.size), dtype=self.packed.dtype)
+        matrix[rows, cols] = self.packed
+        matrix[cols, rows] = self.packed
+        return matrix
+
+    @property
+    def variance(self):
+        i = np.arange(self.size)
+        return self.packed[i*self.size - i*(i-1)//2]
+
+    def dot(self, x):
+        ''' Apply the covariance on vectors (last axis of `x`), from the
+        packed storage with scipy '''
+        with stage('Covariance.dot', 2.*self.grid.J*x.size):
+            if scipyBlas is None:
+                return x.dot(self.matrix)
+            # -- rows of the upper triangle are the columns of the lower
+            #    triangle in the (column major) BLAS packed storage
+            spmv = scipyBlas.get_blas_funcs('spmv', (self.packed, x))
+            vectors = x.reshape(-1, self.size)
+            Cx = np.empty(vectors.shape, dtype=spmv.dtype)
+            for i, v in enumerate(vectors):
+                Cx[i] = spmv(self.size, 1., self.packed, v, lower=1)
+            return Cx.reshape(x.shape)
+
+    def solve(self, x):
+        ''' Apply the inverse covariance on a vector (last axis of `x`),
+        by Cholesky factorization (of the dense matrix) '''
+        J = self.grid.J
+        with stage('Covariance.solve', J**3/3. + 2.*J*x.size):
+            C = np.linalg.cholesky(self.matrix)
+            return np.linalg.solve(C.T, np.linalg.solve(C, x.T)).T
+
+    def scaled(self, factor):
+        return PackedCovariance(self.grid, factor*self.packed)
+
+    def __getitem__(self, index):
+        if (isinstance(index, tuple) and len(index) == 2 
+                and all(isinstance(i, (int, np.integer)) for i in index)):
+            i, j = sorted(k % self.size for k in index)
+            return self.packed[i*self.size - i*(i-1)//2 + j-i]
+        return self.matrix[index]
+
+
+class LowRankCovariance(Covariance):
+    ''' Low rank plus diagonal covariance: C = D + U.U'
+
+    The covariance is stored through the variances of its diagonal part
+    `D` and the J x r factor `U` of its low rank part, such that it is 
+    applied in O(J r), inverted (Woodbury identity) in O(J r**2) and 
+    sampled with a control vector of size J + r.  The dense matrix is 
+    only built (and not kept) when `matrix` is accessed.
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        diagonal : np.ndarray
+            variances of the diagonal part
+        U : np.ndarray(shape=(J, r))
+            factor of the low rank part
+        rank : int
+            rank of the low rank part
+        matrix : np.ndarray
+            symetric matrix
+        variance : np.ndarray
+            diagonal of covariance matrix
+
+    :Methods:
+        fromEnsemble : `Grid`, np.ndarray, float|np.ndarray
+            return the sample covariance of an ensemble plus a diagonal
+        propagate : `SpectralModel`, np.ndarray|None
+            return the covariance with the low rank part propagated
+    '''
+
+    def __init__(self, grid, diagonal, U):
+        self.grid = grid
+        if np.isscalar(diagonal):
+            diagonal = diagonal * np.ones(grid.J)
+        self.diagonal = grid.asDtype(np.asarray(diagonal, dtype=float))
+        self.U = grid.asDtype(U)
+        assert self.U.shape[0] == len(self.diagonal)
+
+    @classmethod
+    def fromEnsemble(cls, grid, ens, diagonal=0.):
+        ''' Sample covariance of an ensemble (states stacked on the first 
+        axis), of rank nEns-1, plus a diagonal part
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            ens : np.ndarray
+                ensemble
+            diagonal : float | np.ndarray
+                variances of the diagonal part
+        '''
+        X = ens - ens.mean(axis=0)
+        return cls(grid, diagonal, X.T/np.sqrt(len(ens)-1.))
+
+    @property
+    def rank(self):
+        return self.U.shape[1]
+
+    @property
+    def matrix(self):
+        return np.diag(self.diagonal) + self.U.dot(self.U.T)
+
+    @property
+    def variance(self):
+        return self.diagonal + (self.U**2).sum(axis=1)
+
+    @property
+    def controlSize(self):
+        return len(self.diagonal) + self.rank
+
+    def random(self, bias=0., size=None):
+        ''' Generate a random realisation from the covariance model
+        
+        :Parameters:
+            bias : float
+                uniform bias (mean)
+            size : int | None
+                number of realisations (stacked on the first axis)
+        '''
+        shape = (self.controlSize,) if size is None else (size, 
+                                                            self.controlSize)
+        with stage('LowRankCovariance.random', 
+                    2.*self.controlSize*self.rank*(size or 1)):
+            return bias + self.sqrtDot(
+                            self.grid.asDtype(np.random.normal(size=shape)))
+
+    def dot(self, x):
+        with stage('LowRankCovariance.dot', 4.*self.rank*x.size):
+            return self.diagonal*x + (x.dot(self.U)).dot(self.U.T)
+
+    def solve(self, x):
+        ''' Apply the inverse covariance on a vector (last axis of `x`)
+        with the Woodbury identity:
+
+            C^-1 = D^-1 - D^-1.U.(I + U'.D^-1.U)^-1.U'.D^-1
+        '''
+        r = self.rank
+        with stage('LowRankCovariance.solve', 
+                    2.*len(self.diagonal)*r**2 + r**3 + 4.*r*x.size):
+            DInvU = self.U/self.diagonal[:,None]
+            W = np.eye(r) + self.U.T.dot(DInvU)
+            DInvX = x/self.diagonal
+            return DInvX - np.linalg.solve(W, DInvX.dot(self.U).T).T.dot(
+                                                                    DInvU.T)
+
+    def sqrtDot(self, v):
+        ''' Apply the square root [D^1/2, U] on a control vector of size 
+        J + r
+
+        :Parameters:
+            v : np.ndarray
+                control vector(s) (last axis)
+        '''
+        J = len(self.diagonal)
+        return np.sqrt(self.diagonal)*v[...,:J] + v[...,J:].dot(self.U.T)
+
+    def sqrtTDot(self, x):
+        ''' Apply the transposed square root [D^1/2, U]' on a vector
+
+        :Parameters:
+            x : np.ndarray
+                vector(s) (last axis)
+        '''
+        return np.concatenate((np.sqrt(self.diagonal)*x, x.dot(self.U)), 
+                                axis=-1)
+
+    def scaled(self, factor):
+        return LowRankCovariance(   self.grid, factor*self.diagonal, 
+                                    np.sqrt(factor)*self.U)
+
+    def propagate(self, model, x=None):
+        ''' Covariance with the low rank part propagated by the model:
+        D + (M.U).(M.U)' (the diagonal part is kept), in O(r) model 
+        integrations
+
+        :Parameters:
+            model : `SpectralModel`
+                model
+            x : np.ndarray | None
+                linearization state
+        '''
+        MU = model.tangentLinear(self.U.T, x).T
+        return LowRankCovariance(self.grid, self.diagonal, MU)
+
+
+class HybridCovariance(Covariance):
+    ''' Hybrid static and localized ensemble covariance
+
+        C = wStatic Cs + wEnsemble L o Pe
+
+    where `Cs` is a static covariance (typically a `CirculantCovariance`
+    applied by FFT), Pe = X'.X/(nEns-1) the sample covariance of the 
+    ensemble anomalies X and `L` a localization correlation (typically
+    circulant) applied by Schur (elementwise) product.  The localized 
+    ensemble part is applied matrix-free,
+
+        (L o Pe).x = sum_k X_k o L.(X_k o x)/(nEns-1),
+
+    in nEns applications of `L`; the J x J blend is never formed (but 
+    by `matrix`, on request).  Solves use conjugate gradients and the 
+    square root acts on a control vector [vStatic, v_1, ..., v_nEns], 
+    one localization control vector per member.  States are fields of 
+    shape `grid.shape` (last axes), on a `Grid2D` the control vectors of
+    the static and localization covariances are flattened fields.
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        static : `Covariance` | None
+            static covariance
+        X : np.ndarray(shape=(nEns,)+grid.shape)
+            ensemble anomalies scaled by (nEns-1)**-1/2
+        localization : `Covariance` | None
+            localization correlation (no localization if None)
+        weights : (float, float)
+            weights of the static and ensemble parts
+        tol : float
+            relative residual of the conjugate gradient solves
+        maxIter : int
+            maximal number of conjugate gradient iterations (10 times
+            the state size by default)
+        matrix : np.ndarray
+            symetric matrix (built on each access)
+        variance : np.ndarray
+            diagonal of covariance matrix
+
+    :Methods:
+        fromEnsemble : `Grid`, `Covariance`|None, np.ndarray, 
+                        `Covariance`|None, (float, float)
+            return the hybrid covariance of an ensemble
+    '''
+
+    def __init__(   self, grid, static, anomalies, localization=None, 
+                    weights=(0.5, 0.5), tol=1e-10, maxIter=None):
+        self.grid = grid
+        self.static = static
+        self.X = grid.asDtype(anomalies/np.sqrt(len(anomalies)-1.))
+        self.localization = localization
+        self.weights = weights
+        self.tol = tol
+        self.maxIter = 10*grid.size if maxIter is None else maxIter
+
+    @classmethod
+    def fromEnsemble(   cls, grid, static, ens, localization=None, 
+                        weights=(0.5, 0.5)):
+        ''' Hybrid covariance of an ensemble (states stacked on the first
+        axis)
+
+        :Parameters:
+            grid : `Grid`
+                space domain descriptor
+            static : `Covariance` | None
+                static covariance
+            ens : np.ndarray
+                ensemble
+            localization : `Covariance` | None
+                localization correlation
+            weights : (float, float)
+                weights of the static and ensemble parts
+        '''
+        return cls( grid, static, ens - ens.mean(axis=0), 
+                    localization=localization, weights=weights)
+
+    @property
+    def nEns(self):
+        return len(self.X)
+
+    @property
+    def _staticSize(self):
+        return 0 if self.static is None else self.static.controlSize
+
+    @property
+    def _locSize(self):
+        if self.localization is None: return 1
+        return self.localization.controlSize
+
+    @property
+    def controlSize(self):
+        return self._staticSize + self.nEns*self._locSize
+
+    def _flat(self, x):
+        ''' States `x` (last axes of shape `grid.shape`) as vectors '''
+        return x.reshape(x.shape[:x.ndim-len(self.grid.shape)]+(-1,))
+
+    def _field(self, v):
+        ''' Control vectors of a static or localization covariance (last
+        axis) as fields on a `Grid2D` '''
+        if self.grid.size == self.grid.J: return v
+        return v.reshape(v.shape[:-1]+self.grid.shape)
+
+    @property
+    def matrix(self):
+        wStatic, wEnsemble = self.weights
+        X = self._flat(self.X)
+        Pe = X.T.dot(X)
+        if self.localization is not None:
+            Pe *= self.localization.matrix
+        if self.static is None:
+            return wEnsemble*Pe
+        return wStatic*self.static.matrix + wEnsemble*Pe
+
+    @property
+    def variance(self):
+        wStatic, wEnsemble = self.weights
+        var = (self.X**2).sum(axis=0)
+        if self.localization is not None:
+            var *= self.localization.variance
+        if self.static is None:
+            return wEnsemble*var
+        return wStatic*self.static.variance + wEnsemble*var
+
+    def random(self, bias=0., size=None):
+        ''' Generate a random realisation from the covariance model
+        
+        :Parameters:
+            bias : float
+                uniform bias (mean)
+            size : int | None
+                number of realisations (stacked on the first axis)
+        '''
+        shape = (self.controlSize,) if size is None else (size, 
+                                                            self.controlSize)
+        return bias + self.sqrtDot(
+                            self.grid.asDtype(np.random.normal(size=shape)))
+
+    def dot(self, x):
+        wStatic, wEnsemble = self.weights
+        with stage('HybridCovariance.dot'):
+            if self.localization is None:
+                X = self._flat(self.X)
+                y = wEnsemble*(self._flat(x).dot(X.T)).dot(X)
+                y = y.reshape(x.shape)
+            else:
+                # -- (nEns, ..., J) Schur products with the members
+                nDim = len(self.grid.shape)
+                X = self.X.reshape((self.nEns,)+(1,)*(x.ndim-nDim)
+                                    +self.grid.shape)
+                y = wEnsemble*(X*self.localization.dot(X*x)).sum(axis=0)
+            if self.static is not None:
+                y += wStatic*self.static.dot(x)
+            return y
+
+    def solve(self, x):
+        ''' Apply the inverse covariance on vector(s) (last axes of `x`,
+        of shape `grid.shape`) by conjugate gradients '''
+        with stage('HybridCovariance.solve'):
+            x = np.asarray(x)
+            flat = x.reshape((-1,)+self.grid.shape)
+            y = np.array([  conjugateGradient(  self.dot, b, tol=self.tol, 
+                                                maxIter=self.maxIter)[0] 
+                            for b in flat])
+            return y.reshape(x.shape)
+
+    def sqrtDot(self, v):
+        ''' Apply the square root on a control vector of size 
+        `controlSize` 
+
+        :Parameters:
+            v : np.ndarray
+                control vector(s) (last axis)
+        '''
+        wStatic, wEnsemble = self.weights
+        nStatic = self._staticSize
+        vEns = v[...,nStatic:].reshape(v.shape[:-1]+(self.nEns, 
+                                                        self._locSize))
+        if self.localization is None:
+            x = vEns[...,0].dot(self._flat(self.X))
+            x = np.sqrt(wEnsemble)*x.reshape(v.shape[:-1]+self.grid.shape)
+        else:
+            vLoc = self.localization.sqrtDot(self._field(vEns))
+            x = np.sqrt(wEnsemble)*(self.X*vLoc).sum(
+                                            axis=-1-len(self.grid.shape))
+        if self.static is not None:
+            x += np.sqrt(wStatic)*self.static.sqrtDot(
+                                            self._field(v[...,:nStatic]))
+        return x
+
+    def sqrtTDot(self, x):
+        ''' Apply the transposed square root on a vector
+
+        :Parameters:
+            x : np.ndarray
+                vector(s) (last axes of shape `grid.shape`)
+        '''
+        wStatic, wEnsemble = self.weights
+        lead = x.shape[:x.ndim-len(self.grid.shape)]
+        if self.localization is None:
+            vEns = self._flat(x).dot(self._flat(self.X).T)
+        else:
+            xMembers = x.reshape(lead+(1,)+self.grid.shape)
+            vEns = self.localization.sqrtTDot(self.X*xMembers)
+            vEns = vEns.reshape(lead+(-1,))
+        vEns = np.sqrt(wEnsemble)*vEns
+        if self.static is None:
+            return vEns
+        vStatic = self.static.sqrtTDot(x).reshape(lead+(-1,))
+        return np.concatenate((np.sqrt(wStatic)*vStatic, vEns), axis=-1)
+
+
 class CorrModel(Covariance):
     ''' 
 
@@ -80,7 +956,8 @@ class CorrModel(Covariance):
         eFold : float
             ratio Lc/Lp
         matrix : np.ndarray
-            correlation matrix
+            correlation matrix (built on first use and kept in the grid
+            `DiskCache` if any)
 
     :Methods:
         powSpecTh : None|bool
@@ -101,12 +978,42 @@ class CorrModel(Covariance):
         self.Lc = Lc
         self.eFold = self._findEFold()
         self.Lp = self.Lc/self.eFold
-        self.matrix = self._buildMatrix()
+
+    @property
+    def matrix(self):
+        if getattr(self, '_matrix', None) is None:
+            grid = self.grid
+            if grid.cache is None:
+                self._matrix = self._buildMatrix()
+            else:
+                self._matrix = grid.cache.get(  'CorrModel.matrix',
+                                                {'name':self.name, 
+                                                 'N':grid.N, 'L':grid.L, 
+                                                 'Lc':self.Lc},
+                                                self._buildMatrix)
+            self._matrix = grid.asDtype(self._matrix)
+        return self._matrix
 
     def corrFunc(self):
         f = np.vectorize(self._func)
         return f(self.grid.x, self.Lp)
 
+    def corrFunc2D(self, isotropic=True):
+        ''' Correlations between the center and every point of the doubly
+        periodic square grid with the coordinates of `grid` 
+
+        :Parameters:
+            isotropic : bool
+                if True, function of the distance, else product of the 
+                correlations in each direction (separable)
+        '''
+        x = self.grid.x
+        if isotropic:
+            f = np.vectorize(self._func)
+            return f(np.sqrt(x[:,None]**2 + x[None,:]**2), self.Lp)
+        corr = self.corrFunc()
+        return corr[:,None]*corr[None,:]
+
     def powSpecTh(self, normalize=True):
         ''' Power spectrum
 
@@ -157,7 +1064,7 @@ class Uncorrelated(CorrModel):
         self.Lp = 0.
         self.eFold = 0.
         self.Lc = 0.
-        self.matrix = np.eye(self.grid.J)
+        self._matrix = np.eye(self.grid.J, dtype=self.grid.dtype)
 
     def _func(self, x, Lp):
         if x == 0:
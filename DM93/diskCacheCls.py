@@ -0,0 +1,242 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Persistent array cache '''
+import os
+import json
+import errno
+import hashlib
+import tempfile
+import numpy as np 
+
+def _canonical(value):
+    if isinstance(value, (bool, np.bool_)):
+        return repr(bool(value))
+    elif isinstance(value, (int, long, np.integer)):
+        return str(int(value))
+    elif isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    else:
+        return repr(value)
+
+
+class DiskCache(object):
+    ''' Content-addressed on-disk cache of arrays
+
+    Arrays (e.g. Fourier matrix, correlation matrices, model 
+    propagators) are stored in `.npy` files named after a hash of 
+    their description (object name and the parameters they depend 
+    on) and are loaded memory-mapped (read-only), such that only the 
+    parts actually used are read from disk.
+
+    Each entry has a `.json` companion holding its description, shape,
+    dtype, file size and SHA-1 checksum.  An entry is only used if its
+    description, header and size match (and its checksum if `checksum`
+    is True); otherwise it is discarded and rebuilt.  Files are written
+    to a temporary file and renamed, such that processes can share a 
+    cache directory.
+
+    When the cache size exceeds `maxSize`, the least recently used 
+    entries are evicted.
+
+    :Parameters:
+        directory : str
+            cache directory (created if needed)
+        maxSize : int | None
+            maximal size in bytes (unbounded by default)
+        checksum : bool
+            if True, verify the checksum of each entry when loading it
+            (reads the whole file)
+
+    :Methods:
+        get : str, dict, callable
+            return the cached array or build and store it
+        load : str, dict
+            return the cached array or None
+        store : str, dict, np.ndarray
+            store an array
+        clear : 
+            remove all entries
+    '''
+
+    def __init__(self, directory, maxSize=None, checksum=False):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.checksum = checksum
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST: raise
+
+    def describe(self, name, params):
+        ''' Canonical description and hash of an entry 
+
+        :Parameters:
+            name : str
+                object name
+            params : dict
+                parameters the object depends on
+        '''
+        desc = '%s(%s)'%(name, ', '.join(  '%s=%s'%(k, _canonical(params[k]))
+                                            for k in sorted(params)))
+        return desc, hashlib.sha1(desc).hexdigest()
+
+    def get(self, name, params, builder):
+        ''' Return the cached array, building and storing it if needed
+
+        :Parameters:
+            name : str
+                object name
+            params : dict
+                parameters the object depends on
+            builder : callable
+                function returning the array
+        '''
+        array = self.load(name, params)
+        if array is None:
+            array = builder()
+            self.store(name, params, array)
+        return array
+
+    def load(self, name, params):
+        ''' Return the cached array (memory-mapped) or None
+
+        :Parameters:
+            name : str
+                object name
+            params : dict
+                parameters the object depends on
+        '''
+        desc, digest = self.describe(name, params)
+        dataPath, metaPath = self._paths(digest)
+        try:
+            with open(metaPath) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if meta.get('description') != desc:
+            return None
+
+        try:
+            array = np.load(dataPath, mmap_mode='r')
+        except (IOError, ValueError):
+            self._remove(digest)
+            return None
+        if (    list(array.shape) != meta['shape'] 
+                or array.dtype.str != meta['dtype']
+                or os.path.getsize(dataPath) != meta['fileSize']
+                or (self.checksum and _sha1(dataPath) != meta['sha1'])):
+            del array
+            self._remove(digest)
+            return None
+
+        # -- mark as recently used
+        os.utime(metaPath, None)
+        return array
+
+    def store(self, name, params, array):
+        ''' Store an array (evicting old entries if needed)
+
+        :Parameters:
+            name : str
+                object name
+            params : dict
+                parameters the object depends on
+            array : np.ndarray
+                array to store
+        '''
+        desc, digest = self.describe(name, params)
+        dataPath, metaPath = self._paths(digest)
+        array = np.ascontiguousarray(array)
+
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        meta = {'description':desc, 'shape':list(array.shape), 
+                'dtype':array.dtype.str, 'fileSize':os.path.getsize(tmpPath),
+                'sha1':_sha1(tmpPath)}
+        os.rename(tmpPath, dataPath)
+
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmpPath, metaPath)
+
+        self._evict(keep=digest)
+
+    @property
+    def size(self):
+        ''' Total size of the entries in bytes '''
+        return sum(size for digest, size, lastUse in self._entries())
+
+    def clear(self):
+        ''' Remove all entries (and leftover temporary files) '''
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(('.npy', '.json', '.tmp')):
+                _unlink(os.path.join(self.directory, fileName))
+
+    def _paths(self, digest):
+        base = os.path.join(self.directory, digest)
+        return base+'.npy', base+'.json'
+
+    def _remove(self, digest):
+        for path in self._paths(digest):
+            _unlink(path)
+
+    def _entries(self):
+        entries = list()
+        for fileName in os.listdir(self.directory):
+            if not fileName.endswith('.json'): continue
+            digest = fileName[:-5]
+            dataPath, metaPath = self._paths(digest)
+            try:
+                size = os.path.getsize(dataPath) + os.path.getsize(metaPath)
+                lastUse = os.path.getmtime(metaPath)
+            except OSError:
+                continue
+            entries.append((digest, size, lastUse))
+        return entries
+
+    def _evict(self, keep=None):
+        if self.maxSize is None: return
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for digest, size, lastUse in entries)
+        for digest, size, lastUse in entries:
+            if total <= self.maxSize: break
+            if digest == keep: continue
+            self._remove(digest)
+            total -= size
+
+    def __repr__(self):
+        return 'DiskCache(%r, maxSize=%r)'%(self.directory, self.maxSize)
+
+
+def _sha1(path, chunkSize=1<<24):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT: raise
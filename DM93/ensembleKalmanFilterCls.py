@@ -0,0 +1,243 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from covarianceCls import Covariance, CirculantCovariance, HybridCovariance
+from variationalLib import conjugateGradient
+from profilerLib import stage
+
+
+class EnsembleKalmanFilter(object):
+    ''' Stochastic Ensemble Kalman Filter (perturbed observations)
+
+    The forecast error covariance is estimated from an ensemble of 
+    states (stacked on the first axis) propagated by the model with 
+    model error perturbations.  Each member assimilates observations
+    perturbed with the observation error covariance.
+
+    Ensembles are stored in the grid floating point type, the gain is 
+    solved in `solveDtype` (mixed precision when the grid is single 
+    precision).
+
+    With a `static` covariance or a `localization`, the forecast error
+    covariance is the `HybridCovariance` of the forecast ensemble and
+    members are analysed matrix-free: the innovations are solved by 
+    conjugate gradients with B + R, in O(nIter nEns**2 J log J) with
+    circulant static and localization covariances.
+
+    With `ensembleSpace` (always on a `Grid2D`, where states are fields
+    of shape (J, J)) and no localization, the analysis is solved in the
+    ensemble space with the Woodbury identity: with Xs the normalized 
+    forecast anomalies, the increment of each member is 
+    Xs'.(I + Xs.R^-1.Xs')^-1.Xs.R^-1.d, in O(nEns**2 J) plus nEns 
+    solves with R (FFT for circulant covariances), without any J x J 
+    matrix.  With a `static` covariance, D = wStatic Cs + R replaces R 
+    in the Woodbury identity (a circulant D for circulant Cs and R) 
+    and the increment is B.S^-1.d, with 
+    S^-1 = D^-1 - D^-1.Xs'.(I/wEnsemble + Xs.D^-1.Xs')^-1.Xs.D^-1: 
+    the static part keeps a full rank gain and the analysis spread of 
+    a small ensemble on a `Grid2D` consistent with its error.  On a 
+    `Grid2D`, a localization is applied by conjugate gradients, in 
+    O(nIter nEns**2) FFTs per analysis.
+
+    :Attributes:
+        model : `SpectralModel`
+            model
+        R : `Covariance`
+            observation error covariance
+        Q : `Covariance`
+            model error covariance
+        inflation : float
+            multiplicative inflation of the forecast covariance (applied
+            to the forecast anomalies before the analysis)
+        solveDtype : numpy.dtype
+            floating point type of the gain solve
+        static : `Covariance` | None
+            static part of an hybrid forecast error covariance
+        localization : `Covariance` | None
+            localization correlation of the ensemble covariance
+        weights : (float, float)
+            weights of the static and ensemble parts
+        ensembleSpace : bool
+            if True, solve the analysis in the ensemble space
+
+    :Methods:
+        initialize : np.ndarray, `Covariance`, int
+            return an initial ensemble
+        analyse : np.ndarray, np.ndarray
+            return the analysis ensemble
+        forecast : np.ndarray
+            return the forecast ensemble
+        covariance : np.ndarray
+            return the ensemble (sample) `HybridCovariance`
+        hybridCovariance : np.ndarray
+            return the hybrid static and localized ensemble covariance
+        spVariance : np.ndarray
+            return the ensemble spectral variances
+    '''
+
+    def __init__(   self, model, R, Q, inflation=1., solveDtype=np.float64, 
+                    static=None, localization=None, weights=(0.5, 0.5),
+                    ensembleSpace=False):
+        self.model = model
+        self.grid = model.grid
+        self.R = R
+        self.Q = Q
+        self.inflation = inflation
+        self.solveDtype = np.dtype(solveDtype)
+        self.static = static
+        self.localization = localization
+        self.weights = weights if static is not None else (0., 1.)
+        self.ensembleSpace = ensembleSpace or self.grid.size > self.grid.J
+
+    def initialize(self, xb, B, nEns):
+        ''' Initial ensemble drawn around `xb` with covariance `B` 
+
+        :Parameters:
+            xb : np.ndarray
+                background state
+            B : `Covariance`
+                background error covariance
+            nEns : int
+                ensemble size
+        '''
+        return xb + B.random(size=nEns)
+
+    def anomalies(self, ens):
+        ''' Ensemble anomalies (deviations from the ensemble mean) '''
+        return ens - ens.mean(axis=0)
+
+    def covariance(self, ens):
+        ''' Sample covariance of the ensemble, applied from the anomalies 
+        (`HybridCovariance` without static nor localization): the dense 
+        matrix is only built on request
+        
+        :Parameters:
+            ens : np.ndarray
+                ensemble of states (first axis)
+        '''
+        return HybridCovariance.fromEnsemble(   self.grid, None, ens, 
+                                                weights=(0., 1.))
+
+    def spVariance(self, ens):
+        ''' Spectral variances of the ensemble (homogeneous estimate) 
+
+        Eigenvalues of the circulant covariance estimated by averaging
+        the power spectra of the anomalies (see `CirculantCovariance`).
+
+        :Parameters:
+            ens : np.ndarray
+                ensemble of states (first axis)
+        '''
+        sp = np.abs(self.grid.fftTransform(self.anomalies(ens)))**2
+        return sp.sum(axis=0)/((len(ens)-1)*self.grid.size)
+
+    def analyse(self, ens, y):
+        ''' Analysis step
+
+        :Parameters:
+            ens : np.ndarray
+                forecast ensemble
+            y : np.ndarray
+                observations
+        '''
+        nEns, J = len(ens), self.grid.size
+        if self.inflation != 1.:
+            ens = ens.mean(axis=0) + np.sqrt(self.inflation)*self.anomalies(ens)
+        if self.ensembleSpace and self.localization is None:
+            return self._ensembleSpaceAnalyse(ens, y)
+        if self.static is not None or self.localization is not None:
+            return self._hybridAnalyse(ens, y)
+        with stage('EnsembleKalmanFilter.gain', 
+                    2.*J**2*nEns + 8./3*J**3):
+            P = self.covariance(ens).matrix.astype(self.solveDtype)
+            K = self.grid.asDtype(np.linalg.solve(P + self.R.matrix, P).T)
+        with stage('EnsembleKalmanFilter.stateUpdate', 2.*J**2*nEns):
+            yPert = y + self.R.random(size=nEns)
+            return ens + (yPert-ens).dot(K.T)
+
+    def hybridCovariance(self, ens):
+        ''' Hybrid static and localized covariance of the ensemble
+
+        :Parameters:
+            ens : np.ndarray
+                ensemble of states (first axis)
+        '''
+        return HybridCovariance.fromEnsemble(   self.grid, self.static, ens, 
+                                                self.localization, 
+                                                self.weights)
+
+    def _hybridAnalyse(self, ens, y):
+        ''' Matrix-free analysis with the hybrid covariance '''
+        B = self.hybridCovariance(ens)
+        applyS = lambda x: B.dot(x) + self.R.dot(x)
+        with stage('EnsembleKalmanFilter.stateUpdate'):
+            innov = y + self.R.random(size=len(ens)) - ens
+            z = np.array([  conjugateGradient(  applyS, d, tol=B.tol, 
+                                                maxIter=B.maxIter)[0] 
+                            for d in innov])
+            return self.grid.asDtype(ens + B.dot(z))
+
+    def _staticPlusR(self):
+        ''' D = wStatic Cs + R, circulant for circulant Cs and R (kept) '''
+        if getattr(self, '_D', None) is None:
+            wStatic = self.weights[0]
+            if (    isinstance(self.static, CirculantCovariance) 
+                    and isinstance(self.R, CirculantCovariance)):
+                self._D = CirculantCovariance(self.grid, 
+                                            wStatic*self.static.spVariance 
+                                            + self.R.spVariance)
+            else:
+                self._D = Covariance(self.grid, wStatic*self.static.matrix 
+                                                + self.R.matrix)
+        return self._D
+
+    def _ensembleSpaceAnalyse(self, ens, y):
+        ''' Analysis in the ensemble space (Woodbury identity) '''
+        nEns, J = len(ens), self.grid.size
+        wStatic, wEnsemble = self.weights
+        D = self.R if self.static is None else self._staticPlusR()
+        with stage('EnsembleKalmanFilter.gain', 4.*J*nEns**2 + nEns**3):
+            Xs = self.anomalies(ens)/np.sqrt(nEns-1.)
+            DiXs = D.solve(Xs).reshape(nEns, J).astype(self.solveDtype)
+            Xs = Xs.reshape(nEns, J).astype(self.solveDtype)
+            G = np.eye(nEns)/wEnsemble + Xs.dot(DiXs.T)
+        with stage('EnsembleKalmanFilter.stateUpdate', 4.*J*nEns**2):
+            innov = y + self.R.random(size=nEns) - ens
+            if self.static is None:
+                innov = innov.reshape(nEns, J)
+                w = np.linalg.solve(G, DiXs.dot(innov.T)).T
+                return self.grid.asDtype(ens + w.dot(Xs).reshape(ens.shape))
+            # -- hybrid: z = S^-1.d, increment wStatic Cs.z + wEnsemble Pe.z
+            Did = D.solve(innov).reshape(nEns, J)
+            z = Did - np.linalg.solve(G, Xs.dot(Did.T)).T.dot(DiXs)
+            dxa = wEnsemble*z.dot(Xs.T).dot(Xs).reshape(ens.shape)
+            dxa += wStatic*self.static.dot(z.reshape(ens.shape))
+            return self.grid.asDtype(ens + dxa)
+
+    def forecast(self, ens):
+        ''' Forecast step (with model error perturbations)
+
+        :Parameters:
+            ens : np.ndarray
+                analysis ensemble
+        '''
+        with stage('EnsembleKalmanFilter.forecast'):
+            return self.model.integrate(ens) + self.Q.random(size=len(ens))
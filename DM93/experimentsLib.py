@@ -0,0 +1,1078 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Experiments library
+
+Each experiment (or illustration) of the lab is a function of a `Config`
+(grid, physical parameters and error statistics) returning its results 
+as a dictionary of arrays; plotting is left to `plotsLib`.  Other 
+parameters default to the values of the corresponding scripts.
+'''
+import time
+import numpy as np 
+
+from covarianceCls import Foar, Soar, Gaussian
+from covarianceCls import Covariance, CirculantCovariance
+
+from kalmanFilterCls import KalmanFilter, SpectralKalmanFilter
+from kalmanFilterCls import FrozenGainFilter
+from batchKalmanFilterCls import BatchKalmanFilter, BatchSpectralKalmanFilter
+from ensembleKalmanFilterCls import EnsembleKalmanFilter
+from adaptiveFilterCls import AdaptiveFilter
+from gridCls import Grid2D
+from spectralModelCls import AdvectionDiffusionModel2D
+from variationalLib import var3D
+from analysisLib import directAnalysis
+from runnerLib import runExperiments
+from shardedLib import shardedSpectralFilter
+from trajectoryCls import TrajectoryReader
+from DM93Lib import *
+
+
+def propagation(config, ic=None, nDt=200, output=None):
+    ''' Integrate the model and produce a trajectory
+
+    Returns 'times' and 'traj' (states after each time increment).
+
+    :Parameters:
+        config : `Config`
+            configuration
+        ic : np.ndarray | None
+            initial state (gaussian centered at L/5 by default)
+        nDt : int
+            number of time increments
+        output : `TrajectoryWriter` | None
+            if given, the trajectory is streamed to `output` (at its 
+            cadence) instead of being kept in memory and a 
+            `TrajectoryReader` of it is returned (fields read on demand)
+    '''
+    grid = config.grid
+    model = config.model
+    if ic is None:
+        ic = np.exp(-(grid.x-grid.L/5.)**2/(grid.L/6.)**2)
+
+    if output is None:
+        times = np.array([i*config.dt for i in xrange(nDt+1)])
+        traj = np.empty(shape=(nDt+1, grid.J))
+    x = ic
+    for i in xrange(nDt+1):
+        x = model(x)
+        if output is None:
+            traj[i] = x
+        else:
+            output.append(i, times=i*config.dt, traj=x)
+
+    if output is not None:
+        return TrajectoryReader(output.directory)
+    return {'times':times, 'traj':traj}
+
+
+def analysis(config, truth=None, method='direct'):
+    ''' Compute one analysis and the error reduction
+
+    Returns the states ('truth', 'xb', 'y', 'xa'), the increment 
+    ('dxa'), the errors ('fctErr', 'obsErr'), errors norms 
+    ('error_b', 'error_a') and the method used ('method').
+
+    :Parameters:
+        config : `Config`
+            configuration (forecast and observation error statistics)
+        truth : np.ndarray | None
+            true state
+        method : str
+            'direct' (gain computed per wavenumber when B and R are 
+            homogeneous, by inversion of B+R otherwise), 'spectral', 
+            'dense' (see `directAnalysis`) or '3dvar' (variational)
+    '''
+    grid = config.grid
+    if truth is None: truth = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+    B = config.B
+    R = config.R
+
+    fctErr = B.random(bias=config.fctBias)
+    obsErr = R.random(bias=config.obsBias)
+    xb = truth + fctErr
+    y = truth + obsErr
+
+    if method in ('direct', 'spectral', 'dense'):
+        xa, A, method = directAnalysis( xb, y, B, R, 
+                                        method={'direct':'auto'}.get(method, 
+                                                                    method))
+        dxa = xa - xb
+    elif method == '3dvar':
+        xa, info = var3D(   xb, y, 
+                            CirculantCovariance.fromMatrix(grid, B.matrix),
+                            CirculantCovariance.fromMatrix(grid, R.matrix))
+        dxa = xa - xb
+    else:
+        raise ValueError('unknown analysis method: %s'%method)
+    xa = xb + dxa
+
+    error_b = grid.dx * np.sqrt(sum(fctErr**2))
+    error_a = grid.dx * np.sqrt(sum((xa-truth)**2))
+    return {'truth':truth, 'xb':xb, 'y':y, 'xa':xa, 'dxa':dxa, 
+            'fctErr':fctErr, 'obsErr':obsErr, 
+            'error_b':error_b, 'error_a':error_a, 'method':method}
+
+
+def kalmanFilter(config, truIc=None, nDt=10, doAssimilate=True, 
+                    output=None, checkpoint=None):
+    ''' Run an assimilation cycle with the Kalman Filter
+
+    Returns, for each time step `i`, the observations ('obsTraj') and 
+    analysis ('anlTraj') at step `i`, the truth ('truTraj') and 
+    forecast ('fctTraj') at step `i+1` as well as the variances at 
+    x=0 of the analysis ('anlVarTraj') and forecast ('fctVarTraj').
+
+    The covariance recursion is that of the original script: the gain
+    of the forecast covariance updates the covariance propagated from 
+    the previous analysis, and the covariances are kept unchanged when
+    the observations are not assimilated.
+
+    Long cycles can be streamed to disk with `output`: the memory used
+    then does not depend on `nDt`, and the variance fields ('anlVar', 
+    'fctVar') and spectra ('anlSpVar', 'fctSpVar') are recorded as 
+    well.  With `checkpoint`, the cycle is restarted from the last 
+    checkpoint if any (the results are identical to those of an
+    uninterrupted run); `output` must then append to the trajectory 
+    written before the interruption.
+
+    :Parameters:
+        config : `Config`
+            configuration (model and error statistics)
+        truIc : np.ndarray | None
+            initial truth state
+        nDt : int
+            number of time steps
+        doAssimilate : bool
+            if False, the observations are not assimilated
+        output : `TrajectoryWriter` | None
+            if given, the trajectories are streamed to `output` (at its 
+            cadence) instead of being kept in memory and a 
+            `TrajectoryReader` of them is returned (fields read on 
+            demand)
+        checkpoint : `Checkpointer` | None
+            if given, the cycle state is saved at the checkpointer 
+            interval and restored on restart
+    '''
+    grid = config.grid
+    if truIc is None: truIc = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+
+    model = config.model
+    B = config.B
+    R = config.R
+    Q = config.Q
+    kFilter = KalmanFilter( model, R, Q, solveDtype=config.solveDtype, 
+                            coarseModel=config.coarseModel)
+
+    if output is None:
+        results = { 'times':np.array([i*config.dt for i in xrange(nDt+1)]),
+                    'fctVarTraj':np.empty(nDt+1), 
+                    'anlVarTraj':np.empty(nDt+1)}
+        for name in ('truTraj', 'obsTraj', 'anlTraj', 'fctTraj'):
+            results[name] = np.empty(shape=(nDt+1, grid.J), dtype=grid.dtype)
+
+    xt = truIc
+    xb = xt + B.random(bias=config.fctBias)
+    A = B
+    iStart = 0
+    restart = None if checkpoint is None else checkpoint.load(grid)
+    if restart is not None:
+        step, state = restart
+        iStart = step+1
+        xt, xb, B, A = state['xt'], state['xb'], state['B'], state['A']
+        if output is None:
+            for name in results:
+                results[name][:iStart] = state[name][:iStart]
+        else:
+            output.truncate(int(state['nRecords']))
+
+    for i in xrange(iStart, nDt+1):
+        y = xt + R.random(bias=config.obsBias)
+        if doAssimilate:
+            # -- gain of the forecast covariance, then the covariance 
+            #    propagated from the previous analysis is updated with it
+            K = kFilter.gain(B)
+            xa = grid.asDtype(xb + (y-xb).dot(K.T))
+            xb, B = kFilter.forecast(xa, A)
+            A = Covariance(grid, grid.asDtype(B.matrix - K.dot(B.matrix)))
+        else:
+            xa = xb
+            xb = model(xa)
+        xt = model(xt) + Q.random(bias=config.modBias) 
+
+        if output is None:
+            results['truTraj'][i] = xt
+            results['obsTraj'][i] = y
+            results['anlTraj'][i] = xa
+            results['fctTraj'][i] = xb
+            results['fctVarTraj'][i] = B.variance[0]
+            results['anlVarTraj'][i] = A.variance[0]
+        elif output.isOutputStep(i):
+            output.append(  i, times=i*config.dt, truTraj=xt, obsTraj=y, 
+                            anlTraj=xa, fctTraj=xb, 
+                            fctVarTraj=B.variance[0], 
+                            anlVarTraj=A.variance[0],
+                            fctVar=B.variance, anlVar=A.variance,
+                            fctSpVar=_spVariance(grid, B), 
+                            anlSpVar=_spVariance(grid, A))
+
+        if checkpoint is not None and checkpoint.isCheckpointStep(i):
+            if output is None:
+                checkpoint.save(i, xt=xt, xb=xb, B=B, A=A, **results)
+            else:
+                checkpoint.save(i, xt=xt, xb=xb, B=B, A=A, 
+                                nRecords=output.nRecords)
+
+    if output is not None:
+        return TrajectoryReader(output.directory)
+    return results
+
+
+def _spVariance(grid, cov):
+    return CirculantCovariance.fromMatrix(grid, cov.matrix).spVariance
+
+
+def _divergenceXP(xpConf):
+    return kalmanFilter(**xpConf)
+
+
+def filterDivergence(   config, xpDict=None, nProcs=None, seed=213134, 
+                        batched=False, **kwargs):
+    ''' Compare assimilation experiments (filter divergence)
+
+    Runs `kalmanFilter` for each experiment of `xpDict` in parallel 
+    (see `runExperiments`) and returns a dictionary of results with the
+    same keys.  By default, the three experiments are: a perfect model 
+    assimilation ('perf'), a perfect model integration without 
+    assimilation ('perfNoDA') and an imperfect model assimilation 
+    ('imperf').
+
+    With `batched`, the experiments are instead run as one stacked 
+    filter (see `batchKalmanFilter`), in the current process, with 
+    common random numbers.
+
+    :Parameters:
+        config : `Config`
+            configuration
+        xpDict : dict | None
+            experiments configurations: model error variance 'modVar'
+            and 'doAss' (assimilation or not)
+        nProcs : int | None
+            number of processes
+        seed : int
+            base seed
+        batched : bool
+            if True, run the experiments as one batch
+        kwargs : 
+            `kalmanFilter` parameters common to all experiments
+            (`batchKalmanFilter` parameters with `batched`)
+    '''
+    if xpDict is None: xpDict = XP_DIVERGENCE
+    if batched:
+        tags = sorted(xpDict.keys())
+        np.random.seed(seed)
+        results = batchKalmanFilter(
+                    config, modVars=[xpDict[tag]['modVar'] for tag in tags],
+                    assimilate=[xpDict[tag]['doAss'] for tag in tags], 
+                    **kwargs)
+        return dict((tag, _batchResults(results, iConf)) 
+                    for iConf, tag in enumerate(tags))
+    configs = dict()
+    for xpTag, xpConf in xpDict.iteritems():
+        conf = dict(kwargs)
+        conf['config'] = config.replace(modVar=xpConf['modVar'])
+        conf['doAssimilate'] = xpConf['doAss']
+        configs[xpTag] = conf
+    return runExperiments(_divergenceXP, configs, nProcs=nProcs, seed=seed)
+
+XP_DIVERGENCE = {  
+    'perf': {       'modVar':0.0, 'doAss':True, 
+                    'label':'perfect model', 'color':'r'},
+    'perfNoDA': {   'modVar':0.0, 'doAss':False, 
+                    'label':'perfect model without assimilation', 
+                    'color':'m'},
+    'imperf': {     'modVar':0.01, 'doAss':True, 
+                    'label':'imperfect model', 'color':'b'},
+    }
+
+
+def batchKalmanFilter(  config, modVars=None, obsVars=None, fctVars=None, 
+                        truIc=None, nDt=10, assimilate=None, mode='dense'):
+    ''' Run the assimilation cycle of a batch of error variances
+
+    Runs the `kalmanFilter` cycle of `nConf` configurations differing 
+    by their model, observation and initial forecast error variances 
+    (`modVars`, `obsVars` and `fctVars`, of length `nConf` or None for 
+    the variances of `config`) as a single stacked filter, dense 
+    (`BatchKalmanFilter`) or spectral (`BatchSpectralKalmanFilter`). 
+
+    Configurations share common random numbers: their truth, 
+    observation and background errors are the same draws of the 
+    correlated errors of `config`, scaled by the standard deviations, 
+    such that results only differ by the error variances.
+
+    Returns the results of `kalmanFilter` stacked on a leading 
+    configuration axis (see `_batchResults` to split them) and the 
+    variances of each configuration ('modVar', 'obsVar', 'fctVar').
+
+    :Parameters:
+        config : `Config`
+            configuration (model and error correlations)
+        modVars, obsVars, fctVars : list | None
+            error variances of each configuration
+        truIc : np.ndarray | None
+            initial truth state
+        nDt : int
+            number of time steps
+        assimilate : list | None
+            if given, whether each configuration assimilates the 
+            observations
+        mode : str
+            'dense' or 'spectral' (homogeneous statistics)
+    '''
+    grid = config.grid
+    if truIc is None: truIc = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+    variances = {'modVar':modVars, 'obsVar':obsVars, 'fctVar':fctVars}
+    nConf = max([len(v) for v in variances.values() if v is not None] 
+                or [1])
+    for name, values in variances.items():
+        if values is None: values = [getattr(config, name)]*nConf
+        assert len(values) == nConf
+        variances[name] = np.array(values, dtype=float)
+
+    # -- unit variance errors, scaled for each configuration
+    unit = config.replace(modVar=1., obsVar=1., fctVar=1.)
+    obsStd = np.sqrt(variances['obsVar'])[:,None]
+    modStd = np.sqrt(variances['modVar'])[:,None]
+    fctStd = np.sqrt(variances['fctVar'])[:,None]
+    obsErr = unit.R.random(size=nDt+1)
+    modErr = unit.Q.random(size=nDt+1)
+
+    if mode == 'dense':
+        filterCls = BatchKalmanFilter
+    elif mode == 'spectral':
+        filterCls = BatchSpectralKalmanFilter
+    else:
+        raise ValueError('unknown filter mode: %s'%mode)
+    def scaled(cov, var):
+        stacked = filterCls.stack(grid, [cov])
+        return stacked*var.reshape((nConf,) + (1,)*(stacked.ndim-1))
+    kFilter = filterCls(config.model, scaled(unit.R, variances['obsVar']), 
+                        scaled(unit.Q, variances['modVar']), 
+                        assimilate=assimilate, solveDtype=config.solveDtype)
+    B = scaled(unit.B, variances['fctVar'])
+
+    results = { 'times':np.array([i*config.dt for i in xrange(nDt+1)]),
+                'fctVarTraj':np.empty((nConf, nDt+1)), 
+                'anlVarTraj':np.empty((nConf, nDt+1))}
+    for name in ('truTraj', 'obsTraj', 'anlTraj', 'fctTraj'):
+        results[name] = np.empty(   shape=(nConf, nDt+1, grid.J), 
+                                    dtype=grid.dtype)
+    results.update(variances)
+
+    # -- recursion of `kalmanFilter`: the gain of the forecast covariance 
+    #    updates the covariance propagated from the previous analysis, 
+    #    free runs keep their covariances
+    ass = kFilter.assimilate.reshape((nConf,) + (1,)*(B.ndim-1))
+    xt = grid.asDtype(truIc*np.ones((nConf, grid.J)))
+    xb = xt + config.fctBias + fctStd*unit.B.random()
+    A = B
+    for i in xrange(nDt+1):
+        y = xt + config.obsBias + obsStd*obsErr[i]
+        BNext = np.where(ass, kFilter.forecast(xb, A)[1], B)
+        xa, A = kFilter.analyse(xb, B, y, P=BNext)
+        xb, B = config.model.integrate(xa), BNext
+        xt = config.model.integrate(xt) + config.modBias + modStd*modErr[i]
+
+        results['truTraj'][:,i] = xt
+        results['obsTraj'][:,i] = y
+        results['anlTraj'][:,i] = xa
+        results['fctTraj'][:,i] = xb
+        results['fctVarTraj'][:,i] = kFilter.variance(B)[:,0]
+        results['anlVarTraj'][:,i] = kFilter.variance(A)[:,0]
+    return results
+
+
+def _batchResults(results, iConf):
+    ''' Results of one configuration of `batchKalmanFilter` '''
+    return dict((name, value if name == 'times' else value[iConf])
+                for name, value in results.iteritems())
+
+
+def sensitivitySweep(   config, modVars=None, obsVars=None, fctVars=None, 
+                        truIc=None, nDt=10, mode='dense'):
+    ''' Sensitivity of the Kalman Filter to the error variances
+
+    Runs every combination of the model, observation and initial 
+    forecast error variances (`modVars`, `obsVars` and `fctVars`, the 
+    variance of `config` if None) as one batch (see 
+    `batchKalmanFilter`).  The results of `batchKalmanFilter` are 
+    reshaped such that their leading axes index the model, observation 
+    and forecast error variances (shape (nMod, nObs, nFct, ...)).
+
+    :Parameters:
+        config : `Config`
+            configuration
+        modVars, obsVars, fctVars : list | None
+            error variances of the sweep
+        truIc : np.ndarray | None
+            initial truth state
+        nDt : int
+            number of time steps
+        mode : str
+            'dense' or 'spectral' (homogeneous statistics)
+    '''
+    axes = [np.atleast_1d(v if v is not None else getattr(config, name))
+            for v, name in ((modVars, 'modVar'), (obsVars, 'obsVar'), 
+                            (fctVars, 'fctVar'))]
+    modGrid, obsGrid, fctGrid = np.meshgrid(*axes, indexing='ij')
+    shape = modGrid.shape
+    results = batchKalmanFilter(config, modVars=modGrid.ravel(), 
+                                obsVars=obsGrid.ravel(), 
+                                fctVars=fctGrid.ravel(), truIc=truIc, 
+                                nDt=nDt, mode=mode)
+    for name, value in results.items():
+        if name != 'times':
+            results[name] = value.reshape(shape + value.shape[1:])
+    results.update(modVars=axes[0], obsVars=axes[1], fctVars=axes[2])
+    return results
+
+
+def assymptoticSolution(config):
+    ''' Assymptotic variance and convergence rate spectra
+
+    Returns the spectra of observation error ('r2'), model error 
+    ('q2'), assymptotic forecast ('f2Plus') and analysis ('analPlus')
+    variances and assymptotic convergence rate ('cPlus').
+
+    :Parameters:
+        config : `Config`
+            configuration (observation and model error correlations)
+    '''
+    grid, dt, nu = config.grid, config.dt, config.nu
+    r2 = config.obsCorr.powSpecTh()
+    q2 = config.modCorr.powSpecTh()
+    f2Plus = spVarStationary(grid, r2, q2, dt=dt, nu=nu)[0]
+    analPlus = analSpVar(f2Plus, r2)
+    cPlus = convRateAssymp(grid, r2, q2, dt=dt, nu=nu)
+    return {'r2':r2, 'q2':q2, 'f2Plus':f2Plus, 'analPlus':analPlus, 
+            'cPlus':cPlus}
+
+
+def viscosity(config, nuFactors=(0, .0001, .001)):
+    ''' Impact of viscosity on the assymptotic spectra
+
+    Returns 'nuFactors' and the corresponding assymptotic forecast 
+    variance ('f2Plus') and convergence rate ('cPlus') spectra stacked
+    in arrays of shape (len(nuFactors), N+1).
+
+    :Parameters:
+        config : `Config`
+            configuration (observation and forecast error correlations)
+        nuFactors : list
+            non-dimensional viscosity factors
+    '''
+    grid, dt = config.grid, config.dt
+    r2 = config.obsCorr.powSpecTh()
+    q2 = config.fctCorr.powSpecTh()
+    f2Plus = np.empty(shape=(len(nuFactors), grid.N+1))
+    cPlus = np.empty(shape=(len(nuFactors), grid.N+1))
+    for i, nuF in enumerate(nuFactors):
+        nu =  nuF/dt*(2.*np.pi*grid.L)**2
+        f2Plus[i] = spVarStationary(grid, r2, q2, dt=dt, nu=nu)[0]
+        cPlus[i] = convRateAssymp(grid, r2, q2, dt=dt, nu=nu)
+    return {'nuFactors':np.array(nuFactors), 'f2Plus':f2Plus, 'cPlus':cPlus}
+
+
+def spectralVariance(config):
+    ''' Analysis impact on the variance spectrum
+
+    Returns the observation ('r2'), forecast ('f2') and analysis ('a2')
+    variance spectra.
+
+    :Parameters:
+        config : `Config`
+            configuration (observation and forecast error correlations)
+    '''
+    r2 = config.obsCorr.powSpecTh()
+    f2 = config.fctCorr.powSpecTh()
+    return {'r2':r2, 'f2':f2, 'a2':analSpVar(f2, r2)}
+
+
+def sampleCorrelations(config, nList=(3, 10, 30, 100, 500)):
+    ''' Correlation matrices estimated from finite ensembles
+
+    Returns a dictionary of sampled covariance matrices ('B') keyed by 
+    ensemble size and the exact correlation matrix ('exact').
+
+    :Parameters:
+        config : `Config`
+            configuration (forecast error correlation)
+        nList : list
+            ensemble sizes (a larger ensemble includes the smaller ones)
+    '''
+    fctCorr = config.fctCorr
+    perturbations = fctCorr.random(size=max(nList))
+    BMatrices = dict()
+    for n in nList:
+        BMatrices[n] = perturbations[:n].T.dot(perturbations[:n])/n
+    return {'B':BMatrices, 'exact':fctCorr.matrix}
+
+
+def stationarySolutions(config, k=10, f20=0.05, nIter=5, nDom=1000):
+    ''' Forecast variance convergence to the stationary solutions
+
+    Returns the iterates ('convF2', 'convG'), the stationary solutions 
+    ('f2Plus', 'f2Minus') and their images ('GF2Plus', 'GF2Minus') and 
+    the forecast variance propagator ('imGF2') on a domain ('domF2').
+
+    :Parameters:
+        config : `Config`
+            configuration (observation and model error correlations)
+        k : int
+            wavenumber
+        f20 : float
+            initial forecast variance
+        nIter : int
+            number of iterations
+        nDom : int
+            number of points of the variance domain
+    '''
+    grid, dt, nu = config.grid, config.dt, config.nu
+    r2 = config.obsCorr.powSpecTh()
+    q2 = config.modCorr.powSpecTh()
+
+    convF2 = list()
+    convG = list()
+    f2n = f20
+    for g in varItGenerator(grid, f20, r2[k], q2[k], nIter=nIter, 
+                            k=k, dt=dt, nu=nu):
+        convF2.append(f2n)
+        f2n = g
+        convG.append(f2n)
+
+    f2Plus, f2Minus = spVarStationary(grid, r2[k], q2[k], k=k, dt=dt, nu=nu)
+    GF2Plus = fcstSpVarPropagator(  grid, f2Plus, r2[k], q2[k], 
+                                    k=k, dt=dt, nu=nu)
+    GF2Minus = fcstSpVarPropagator( grid, f2Minus, r2[k], q2[k], 
+                                    k=k, dt=dt, nu=nu)
+
+    minF2 = np.min((f2Plus, f2Minus, np.min(convF2)))
+    maxF2 = np.max((f2Plus, f2Minus, np.max(convF2)))
+    domF2 = np.linspace(minF2, maxF2, nDom)
+    imGF2 = [   fcstSpVarPropagator(grid, f2, r2[k], q2[k], k=k, dt=dt, nu=nu)
+                for f2 in domF2]
+    return {'k':k, 'convF2':np.array(convF2), 'convG':np.array(convG), 
+            'f2Plus':f2Plus, 'f2Minus':f2Minus, 
+            'GF2Plus':GF2Plus, 'GF2Minus':GF2Minus,
+            'domF2':domF2, 'imGF2':np.array(imGF2)}
+
+
+def correlationModels(config, Lc=None):
+    ''' Compare the homogeneous correlation models
+
+    Returns, for each model ('foar', 'soar' and 'gaussian'), the 
+    correlation function ('corrFunc'), normalized theoretical power 
+    spectrum ('powSpecTh') and a random realization ('realization').
+
+    :Parameters:
+        config : `Config`
+            configuration
+        Lc : float | None
+            correlation length (L/20 by default)
+    '''
+    grid = config.grid
+    if Lc is None: Lc = grid.L/20.
+    results = {'Lc':Lc}
+    for cm in (Foar(grid, Lc), Soar(grid, Lc), Gaussian(grid, Lc)):
+        results[cm.name] = {'corrFunc':cm.corrFunc(), 
+                            'powSpecTh':cm.powSpecTh(), 
+                            'realization':cm.random()}
+    return results
+
+
+def _truthObservations(config, truIc, nDt):
+    ''' Truth and observation trajectories and initial background '''
+    grid = config.grid
+    truTraj = np.empty(shape=(nDt+1, grid.J))
+    obsTraj = np.empty(shape=(nDt+1, grid.J))
+    xt = truIc
+    for i in xrange(nDt+1):
+        truTraj[i] = xt
+        obsTraj[i] = xt + config.R.random(bias=config.obsBias)
+        xt = config.model(xt) + config.Q.random(bias=config.modBias)
+    xb = truIc + config.B.random(bias=config.fctBias)
+    return truTraj, obsTraj, xb
+
+
+def _kalmanFilter(mode, config):
+    ''' Kalman Filter of a mode ('dense', 'spectral' or 'frozenGain'), 
+    initial background error covariance and spectral variances function
+    '''
+    grid = config.grid
+    if mode == 'dense':
+        kFilter = KalmanFilter( config.model, config.R, config.Q, 
+                                solveDtype=config.solveDtype)
+        B = config.B
+        spVariance = _spVariance
+    else:
+        R = CirculantCovariance.fromMatrix(grid, config.R.matrix)
+        Q = CirculantCovariance.fromMatrix(grid, config.Q.matrix)
+        if mode == 'spectral':
+            kFilter = SpectralKalmanFilter( config.model, R, Q, 
+                                            solveDtype=config.solveDtype)
+        elif mode == 'frozenGain':
+            kFilter = FrozenGainFilter( config.model, R, Q, 
+                                        solveDtype=config.solveDtype)
+        else:
+            raise ValueError('unknown filter mode: %s'%mode)
+        B = CirculantCovariance.fromMatrix(grid, config.B.matrix)
+        spVariance = lambda grid, cov: cov.spVariance
+    return kFilter, B, spVariance
+
+
+def _filterMode(mode, config, truTraj, obsTraj, xb, nEns, nProcs=None):
+    ''' Run one filter mode, return forecast and analysis spectral 
+    variances and analysis states '''
+    grid = config.grid
+    nDt = len(obsTraj)-1
+    f2 = np.empty(shape=(nDt+1, grid.N+1))
+    a2 = np.empty(shape=(nDt+1, grid.N+1))
+    anlTraj = np.empty(shape=(nDt+1, grid.J), dtype=grid.dtype)
+    obsTraj = grid.asDtype(obsTraj)
+    xb = grid.asDtype(xb)
+
+    if mode == 'ensemble':
+        kFilter = EnsembleKalmanFilter( config.model, config.R, config.Q, 
+                                        solveDtype=config.solveDtype)
+        ens = kFilter.initialize(xb, config.B, nEns)
+        for i in xrange(nDt+1):
+            f2[i] = kFilter.spVariance(ens)
+            ens = kFilter.analyse(ens, obsTraj[i])
+            a2[i] = kFilter.spVariance(ens)
+            anlTraj[i] = ens.mean(axis=0)
+            ens = kFilter.forecast(ens)
+        return f2, a2, anlTraj
+
+    if mode == 'sharded':
+        kFilter, B, _ = _kalmanFilter('spectral', config)
+        results = shardedSpectralFilter(kFilter, xb, B, obsTraj, 
+                                        nProcs=nProcs)
+        return results['f2'], results['a2'], results['anlTraj']
+
+    kFilter, B, spVariance = _kalmanFilter(mode, config)
+    for i in xrange(nDt+1):
+        f2[i] = spVariance(grid, B)
+        xa, A = kFilter.analyse(xb, B, obsTraj[i])
+        a2[i] = spVariance(grid, A)
+        anlTraj[i] = xa
+        xb, B = kFilter.forecast(xa, A)
+    return f2, a2, anlTraj
+
+
+def _convRate(f2, f2Plus, tol=1e-6):
+    ''' Measured convergence rate spectrum (last ratio of successive 
+    deviations from the stationary variances larger than `tol`) '''
+    dev = f2 - f2Plus
+    rate = np.nan*np.ones(f2.shape[1])
+    for n in xrange(len(f2)-1):
+        valid = np.abs(dev[n]) > tol*f2Plus
+        rate[valid] = dev[n+1][valid]/dev[n][valid]
+    return rate
+
+
+def filterAccuracy( config, modes=('dense', 'spectral', 'ensemble', 
+                    'frozenGain'), nDt=50, nEns=100, truIc=None, 
+                    nProcs=None):
+    ''' Accuracy and runtime of the Kalman Filter implementations
+
+    Every filter mode assimilates the same truth and observations: the
+    dense Kalman Filter ('dense'), the spectral Kalman Filter 
+    ('spectral'), the stochastic Ensemble Kalman Filter ('ensemble'), 
+    the spectral filter with frozen stationary gain ('frozenGain') and
+    the spectral Kalman Filter sharded by wavenumbers over `nProcs` 
+    processes ('sharded', see `shardedSpectralFilter`).
+
+    The theoretical stationary forecast ('f2Plus') and analysis 
+    ('a2Plus') spectral variances and convergence rate ('cPlus') are 
+    computed with `spVarStationary`, `analSpVar` and `convRateAssymp` 
+    from the discrete spectra of the observation ('r2') and model 
+    ('q2') error covariances.  For each mode, results hold:
+    
+    - 'time': runtime of the cycle [s]
+    - 'f2', 'a2': forecast and analysis spectral variances at each step
+    - 'f2Error', 'a2Error': relative errors of the final spectra 
+      against 'f2Plus' and 'a2Plus' (at each wavenumber)
+    - 'f2RelError', 'a2RelError': relative errors of the final spectra 
+      (l2 norm)
+    - 'convRate': measured convergence rate spectrum (nan where the 
+      variances converged before the first step or never departed 
+      from the stationary solution)
+    - 'anlRmse': analysis error at each step
+
+    :Parameters:
+        config : `Config`
+            configuration (model and error statistics)
+        modes : list
+            filter modes to run
+        nDt : int
+            number of time steps
+        nEns : int
+            ensemble size
+        truIc : np.ndarray | None
+            initial truth state
+        nProcs : int | None
+            number of processes of the 'sharded' mode (number of cores
+            by default)
+    '''
+    grid = config.grid
+    if truIc is None: truIc = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+
+    r2 = _spVariance(grid, config.R)
+    q2 = _spVariance(grid, config.Q)
+    f2Plus = spVarStationary(grid, r2, q2, dt=config.dt, nu=config.nu)[0]
+    a2Plus = analSpVar(f2Plus, r2)
+    cPlus = convRateAssymp(grid, r2, q2, dt=config.dt, nu=config.nu)
+    results = { 'r2':r2, 'q2':q2, 'f2Plus':f2Plus, 'a2Plus':a2Plus, 
+                'cPlus':cPlus, 'modes':list(modes)}
+
+    truTraj, obsTraj, xb = _truthObservations(config, truIc, nDt)
+    for mode in modes:
+        start = time.time()
+        f2, a2, anlTraj = _filterMode(  mode, config, truTraj, obsTraj, xb,
+                                        nEns, nProcs=nProcs)
+        elapsed = time.time() - start
+        results[mode] = {   
+                'time':elapsed, 'f2':f2, 'a2':a2,
+                'f2Error':(f2[-1]-f2Plus)/f2Plus,
+                'a2Error':(a2[-1]-a2Plus)/a2Plus,
+                'f2RelError':np.linalg.norm(f2[-1]-f2Plus)
+                                /np.linalg.norm(f2Plus),
+                'a2RelError':np.linalg.norm(a2[-1]-a2Plus)
+                                /np.linalg.norm(a2Plus),
+                'convRate':_convRate(f2, f2Plus),
+                'anlRmse':np.sqrt(((anlTraj-truTraj)**2).mean(axis=1))}
+    return results
+
+
+def precisionLoss(  config, modes=('dense', 'spectral', 'ensemble'), 
+                    precisions=(('double', 'float64', 'float64'), 
+                                ('mixed', 'float32', 'float64'),
+                                ('single', 'float32', 'float32')),
+                    nDt=50, nEns=100, truIc=None, seed=0):
+    ''' Precision loss and speed up of single and mixed precision
+
+    The filter modes (see `filterAccuracy`) assimilate the same truth 
+    and observations with each precision, given by its label, the grid
+    floating point type (`Config.dtype`) and the type of the gain solve 
+    and covariance update (`Config.solveDtype`).  The random stream is
+    reseeded with `seed` before each run such that all runs draw the 
+    same random numbers (ensembles also differ by the round-off of the
+    covariance factorizations used to sample them).  The first 
+    precision is the reference; for each precision and mode, results 
+    hold:
+
+    - 'time': runtime of the cycle [s]
+    - 'f2', 'a2': forecast and analysis spectral variances
+    - 'f2Loss', 'a2Loss', 'anlLoss': relative differences (l2 norm) of
+      the spectral variances and analysis trajectories with the 
+      reference
+    - 'anlRmse': analysis error at each step
+
+    :Parameters:
+        config : `Config`
+            configuration (model and error statistics)
+        modes : list
+            filter modes to run
+        precisions : list
+            (label, dtype, solveDtype) of each precision
+        nDt : int
+            number of time steps
+        nEns : int
+            ensemble size
+        truIc : np.ndarray | None
+            initial truth state
+        seed : int
+            random seed of the filters
+    '''
+    grid = config.grid
+    if truIc is None: truIc = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+    truTraj, obsTraj, xb = _truthObservations(config, truIc, nDt)
+
+    results = {'precisions':[label for label, _, _ in precisions], 
+                'modes':list(modes)}
+    for label, dtype, solveDtype in precisions:
+        pConfig = config.replace(dtype=dtype, solveDtype=solveDtype)
+        results[label] = {}
+        for mode in modes:
+            np.random.seed(seed)
+            start = time.time()
+            f2, a2, anlTraj = _filterMode(  mode, pConfig, truTraj, 
+                                            obsTraj, xb, nEns)
+            elapsed = time.time() - start
+            results[label][mode] = {
+                'time':elapsed, 'f2':f2, 'a2':a2, 'anlTraj':anlTraj,
+                'anlRmse':np.sqrt(((anlTraj-truTraj)**2).mean(axis=1))}
+
+    reference = results[precisions[0][0]]
+    for label, _, _ in precisions:
+        for mode in modes:
+            res, ref = results[label][mode], reference[mode]
+            for name in ('f2', 'a2', 'anl'):
+                key = 'anlTraj' if name == 'anl' else name
+                res[name+'Loss'] = (np.linalg.norm(res[key]-ref[key])
+                                    /np.linalg.norm(ref[key]))
+    return results
+
+
+def adaptiveFilter( config, trueModVar=None, 
+                    methods=(None, 'inflation', 'Q'), mode='spectral', 
+                    nDt=200, memory=20, nSigma=3., 
+                    truIc=None):
+    ''' Online innovation statistics and adaptive forecast error 
+    statistics
+
+    The truth is integrated with the model error variance `trueModVar`
+    (`config.modVar` if None) and the filter (see `filterAccuracy` for 
+    the modes) assumes `config.modVar`: with a misspecified model error
+    variance, the innovation statistics detect the inconsistency and 
+    the adaptive schemes of `AdaptiveFilter` correct it.  For each 
+    method (None is labelled 'none'), results hold at each step:
+
+    - 'dd', 'rEstimate', 'bEstimate', 'chi2': running means of the 
+      innovation statistics (see `InnovationStatistics`)
+    - 'chi2Step': normalized chi-square of the step
+    - 'chi2Lower', 'chi2Upper': bounds of the mean chi-square
+    - 'obsVar', 'fctVar': predicted variances (mean over the domain)
+    - 'consistent', 'diverging': chi-square consistency flags
+    - 'factor': inflation or model error covariance factor
+    - 'anlRmse': analysis error
+
+    and the final 'innovationMean' and 'innovationVar' at each grid 
+    point.
+
+    :Parameters:
+        config : `Config`
+            configuration (model and assumed error statistics)
+        trueModVar : float | None
+            model error variance of the truth
+        methods : list
+            adaptive methods (None, 'inflation', 'Q')
+        mode : str
+            filter mode ('dense', 'spectral' or 'frozenGain')
+        nDt : int
+            number of time steps
+        memory : int | None
+            memory of the innovation statistics
+        nSigma : float
+            number of standard deviations of the chi-square bounds
+        truIc : np.ndarray | None
+            initial truth state
+    '''
+    grid = config.grid
+    if truIc is None: truIc = 10. * np.exp(-grid.x**2/(grid.L/6.)**2)
+    truConfig = config
+    if trueModVar is not None: truConfig = config.replace(modVar=trueModVar)
+    truTraj, obsTraj, xb0 = _truthObservations(truConfig, truIc, nDt)
+
+    results = {'methods':[str(m).lower() for m in methods]}
+    scalars = ('dd', 'rEstimate', 'bEstimate', 'chi2', 'obsVar', 'fctVar')
+    for method in methods:
+        kFilter, B, _ = _kalmanFilter(mode, config)
+        aFilter = AdaptiveFilter(kFilter, method=method, memory=memory)
+        stats = aFilter.statistics
+        res = dict((name, np.empty(nDt+1)) for name in scalars + (
+                        'chi2Step', 'chi2Lower', 'chi2Upper', 'factor', 
+                        'anlRmse'))
+        res['consistent'] = np.empty(nDt+1, dtype=bool)
+        res['diverging'] = np.empty(nDt+1, dtype=bool)
+        xb = xb0
+        for i in xrange(nDt+1):
+            xa, A = aFilter.analyse(xb, B, obsTraj[i])
+            for name in scalars:
+                res[name][i] = stats.scalars[name]
+            res['chi2Step'][i] = stats.last['chi2']
+            res['chi2Lower'][i], res['chi2Upper'][i] = stats.chi2Bounds(
+                                                                    nSigma)
+            res['consistent'][i] = stats.isConsistent(nSigma)
+            res['diverging'][i] = stats.isDiverging(nSigma)
+            res['factor'][i] = aFilter.factor
+            res['anlRmse'][i] = np.sqrt(((xa-truTraj[i])**2).mean())
+            xb, B = aFilter.forecast(xa, A)
+        res['innovationMean'] = stats.mean
+        res['innovationVar'] = stats.var
+        results[str(method).lower()] = res
+    return results
+
+
+def kalmanFilter2D( config, modes=('spectral', 'ensemble'), nDt=20, nEns=40,
+                    V=None, isotropic=True, truIc=None, staticWeight=0.5):
+    ''' Spectral and ensemble Kalman Filters on a doubly periodic grid
+
+    The configuration is extended to the square `Grid2D` of truncature 
+    `config.N` in each direction: the wind vector is (U, V) and the 
+    observation, forecast and model error covariances are the 2D 
+    (isotropic or separable) extensions of the configuration 
+    correlation models (see `CirculantCovariance.fromCorrModel2D`).  
+    Every filter mode assimilates the same truth and observations: the
+    spectral Kalman Filter ('spectral') and the stochastic Ensemble 
+    Kalman Filter ('ensemble', solved in the ensemble space, with the 
+    initial forecast error covariance as static part of an hybrid 
+    covariance of weight `staticWeight`).  For each mode, results hold:
+
+    - 'time': runtime of the cycle [s]
+    - 'anlRmse': analysis error at each step
+    - 'anlStd': analysis error standard deviation predicted by the 
+      filter (mean over the domain) at each step
+    - 'anl': final analysis field
+
+    and 'tru' the final truth.
+
+    :Parameters:
+        config : `Config`
+            configuration (model and error statistics)
+        modes : list
+            filter modes to run
+        nDt : int
+            number of time steps
+        nEns : int
+            ensemble size
+        V : float | None
+            wind y component (U/2 if None)
+        isotropic : bool
+            if True, isotropic correlations, else separable
+        truIc : np.ndarray | None
+            initial truth field
+        staticWeight : float
+            weight of the static covariance of the ensemble filter (0: 
+            ensemble covariance only, limited by its rank nEns-1)
+    '''
+    grid = Grid2D(config.N, config.L, dtype=config.dtype)
+    if V is None: V = 0.5*config.U
+    if truIc is None: 
+        r2 = grid.x[:,None]**2 + grid.x[None,:]**2
+        truIc = 10. * np.exp(-r2/(grid.L/6.)**2)
+    model = AdvectionDiffusionModel2D(  grid, (config.U, V), dt=config.dt, 
+                                        nu=config.nu)
+    cov = lambda corr, var: CirculantCovariance.fromCorrModel2D( 
+                                        grid, corr, var, isotropic=isotropic)
+    R = cov(config.obsCorr, config.obsVar)
+    B0 = cov(config.fctCorr, config.fctVar)
+    Q = cov(config.modCorr, config.modVar)
+
+    truTraj = np.empty(shape=(nDt+1,)+grid.shape)
+    obsTraj = np.empty(shape=(nDt+1,)+grid.shape)
+    xt = truIc
+    for i in xrange(nDt+1):
+        truTraj[i] = xt
+        obsTraj[i] = xt + R.random(bias=config.obsBias)
+        xt = model(xt) + Q.random(bias=config.modBias)
+    xb0 = truIc + B0.random(bias=config.fctBias)
+
+    results = {'modes':list(modes), 'tru':truTraj[-1]}
+    for mode in modes:
+        res = {'anlRmse':np.empty(nDt+1), 'anlStd':np.empty(nDt+1)}
+        start = time.time()
+        if mode == 'spectral':
+            kFilter = SpectralKalmanFilter( model, R, Q, 
+                                            solveDtype=config.solveDtype)
+            xb, B = xb0, B0
+            for i in xrange(nDt+1):
+                xa, A = kFilter.analyse(xb, B, obsTraj[i])
+                res['anlRmse'][i] = np.sqrt(((xa-truTraj[i])**2).mean())
+                res['anlStd'][i] = np.sqrt(A.variance.mean())
+                xb, B = kFilter.forecast(xa, A)
+        elif mode == 'ensemble':
+            static = B0 if staticWeight > 0. else None
+            kFilter = EnsembleKalmanFilter( model, R, Q, 
+                                            solveDtype=config.solveDtype,
+                                            static=static, 
+                                            weights=(staticWeight, 
+                                                     1.-staticWeight))
+            ens = kFilter.initialize(xb0, B0, nEns)
+            for i in xrange(nDt+1):
+                ens = kFilter.analyse(ens, obsTraj[i])
+                xa = ens.mean(axis=0)
+                res['anlRmse'][i] = np.sqrt(((xa-truTraj[i])**2).mean())
+                res['anlStd'][i] = np.sqrt(kFilter.anomalies(ens).var(
+                                                    axis=0, ddof=1).mean())
+                ens = kFilter.forecast(ens)
+        else:
+            raise ValueError('unknown filter mode: %s'%mode)
+        res['time'] = time.time() - start
+        res['anl'] = xa
+        results[mode] = res
+    return results
+
+
+EXPERIMENTS = { 'propagation':propagation,
+                'analysis':analysis,
+                'kalmanFilter':kalmanFilter,
+                'filterDivergence':filterDivergence,
+                'sensitivitySweep':sensitivitySweep,
+                'assymptoticSolution':assymptoticSolution,
+                'viscosity':viscosity,
+                'spectralVariance':spectralVariance,
+                'sampleCorrelations':sampleCorrelations,
+                'stationarySolutions':stationarySolutions,
+                'correlationModels':correlationModels,
+                'filterAccuracy':filterAccuracy,
+                'precisionLoss':precisionLoss,
+                'adaptiveFilter':adaptiveFilter,
+                'kalmanFilter2D':kalmanFilter2D,
+                }
+
+
+def flattenResults(results, prefix=''):
+    ''' Flatten nested results dictionaries 
+
+    Nested keys are joined with '/'.
+
+    :Parameters:
+        results : dict
+            results
+        prefix : str
+            keys prefix
+    '''
+    flat = dict()
+    for key, value in results.iteritems():
+        if isinstance(value, dict):
+            flat.update(flattenResults(value, prefix+str(key)+'/'))
+        else:
+            flat[prefix+str(key)] = np.asarray(value)
+    return flat
+
+
+def saveResults(fileName, results):
+    ''' Save results in a numpy `.npz` file (see `flattenResults`) 
+
+    Streamed results (`TrajectoryReader`) are copied chunk by chunk.
+    
+    :Parameters:
+        fileName : str
+            output file name
+        results : dict | `TrajectoryReader`
+            results
+    '''
+    if isinstance(results, TrajectoryReader):
+        results.savez(fileName)
+    else:
+        np.savez(fileName, **flattenResults(results))
@@ -20,6 +20,21 @@
 #-------------------------- LICENCE END -----------------------------
 import numpy as np 
 
+# -- numpy >= 1.17 (pocketfft) computes FFTs of any length in O(n log n),
+#    older versions (fftpack) in O(n p) with p the prime factors of n
+POCKETFFT = np.lib.NumpyVersion(np.__version__) >= '1.17.0'
+
+
+def fastFFT(n):
+    ''' True if the FFTs of length `n` cost O(n log n) '''
+    if POCKETFFT:
+        return True
+    for p in (2, 3, 5):
+        while n % p == 0:
+            n //= p
+    return n == 1
+
+
 class Grid(object):
     ''' Simple centered periodic grid class
 
@@ -37,7 +52,29 @@ class Grid(object):
         dx : float
             grid space increment
         F : numpy.ndarray(float)
-            Fourier transform matrix (unitary)
+            Fourier transform matrix (unitary, built on first use)
+        cache : `DiskCache` | None
+            on-disk cache of the matrices of the grid and of the objects
+            defined on it (correlation models, models)
+        dtype : numpy.dtype
+            floating point type of the fields, matrices and ensembles
+            defined on the grid (float64 by default, float32 halves 
+            their memory); coordinates are kept in float64
+        complexDtype : numpy.dtype
+            complex type of the spectra
+        shape : tuple
+            shape of the fields (J,)
+        size : int
+            number of grid points
+        spShape : tuple
+            shape of the complex half spectrum (N+1,)
+        spWeights : numpy.ndarray
+            multiplicity of the half spectrum coefficients in the full 
+            spectrum (1 for the mean, 2 otherwise)
+        fastFFT : bool
+            True if the FFTs of length J cost O(J log J) (always with 
+            numpy >= 1.17, otherwise J must only have the prime factors
+            2, 3 and 5)
 
     :Methods:
         transform : numpy.ndarray(shape=self.J)
@@ -46,15 +83,29 @@ class Grid(object):
             the constant term followed by sine and cosine terms. 
         inverse : numpy.ndarray(shape=self.J)
             return inverse Fourier transform of spectra
+        fftTransform : numpy.ndarray(shape=self.N+1, dtype=complex)
+            return the complex half spectrum of signal computed by FFT
+        fftInverse : numpy.ndarray(shape=self.J)
+            return the signal from its complex half spectrum by FFT
+        asDtype : numpy.ndarray
+            return the array cast to the grid floating point type
+        transfer : numpy.ndarray, `Grid`
+            return fields transferred to another resolution (spectral 
+            truncation or zero-padding)
+        transferMatrix : `Grid`
+            return the matrix of `transfer`
         ticks : int, format
             return a tuple (xticks, xticklabels) for axe formating
             
     '''
     
-    def __init__(self, N, L):
+    def __init__(self, N, L, cache=None, dtype=np.float64):
         self.N=N
         self.L=L
         self.J = 2*self.N+1 
+        self.cache = cache
+        self.dtype = np.dtype(dtype)
+        self.complexDtype = np.result_type(self.dtype, np.complex64)
 
 
         self.halfK = np.array(range(self.N+1), dtype=float)
@@ -64,8 +115,38 @@ class Grid(object):
                                 for k in self.k
                                 ])
         self.dx = self.x[1]-self.x[0]
+
+        self.shape = (self.J,)
+        self.size = self.J
+        self.spShape = self.halfK.shape
+        self.spWeights = np.where(self.halfK == 0, 1., 2.)
+        self.fastFFT = fastFFT(self.J)
         
-        self.F = self._fourierMatrix()
+
+    @property
+    def F(self):
+        if getattr(self, '_F', None) is None:
+            if self.cache is None:
+                self._F = self._fourierMatrix()
+            else:
+                self._F = self.cache.get(   'Grid.F', 
+                                            {'N':self.N, 'L':self.L}, 
+                                            self._fourierMatrix)
+            self._F = self.asDtype(self._F)
+        return self._F
+
+    def asDtype(self, x):
+        ''' Cast a real (or complex) array to the grid floating point 
+        type (no copy when it already has it) 
+
+        :Parameters:
+            x : numpy.ndarray
+                array
+        '''
+        x = np.asarray(x)
+        if np.iscomplexobj(x):
+            return x.astype(self.complexDtype, copy=False)
+        return x.astype(self.dtype, copy=False)
 
     def _fourierMatrix(self):
         ''' Build real unitary Fourier matrix '''
@@ -106,6 +187,91 @@ class Grid(object):
         '''
         return np.dot(self.F.T, sp)
 
+    def fftTransform(self, x):
+        ''' Fast discrete Fourier transform (complex half spectrum)
+
+        Coefficients are indexed by `halfK` and referenced to the 
+        domain center (x=0), such that
+        
+            x_j = (X_0 + 2 Re sum_n X_n exp(2 i pi n x_j/L))/J
+
+        The transform is applied on the last axis (multiple signals can
+        be transformed at once) and costs O(J log J) per signal.
+        The spectrum has the grid complex type (numpy computes the 
+        transform itself in double precision).
+
+        :Parameters:
+            x : numpy.ndarray
+                signal (last axis of length J)
+        '''
+        sp = np.fft.rfft(np.roll(x, -self.N, axis=-1), axis=-1)
+        return sp.astype(self.complexDtype, copy=False)
+
+    def fftInverse(self, sp):
+        ''' Inverse of `fftTransform`
+
+        :Parameters:
+            sp : numpy.ndarray(dtype=complex)
+                complex half spectrum (last axis of length N+1)
+        '''
+        x = np.roll(np.fft.irfft(sp, n=self.J, axis=-1), self.N, axis=-1)
+        return x.astype(self.dtype, copy=False)
+
+    def transfer(self, x, grid):
+        ''' Transfer fields to a grid of another resolution (same length)
+
+        The complex half spectrum is truncated (coarser `grid`) or 
+        padded with zeros (finer `grid`) and rescaled by the ratio of 
+        the number of grid points, such that the retained wavenumbers 
+        are exactly preserved: padding then truncating is the identity.
+        Applied on the last axis, by FFT in O(J log J) per field; 
+        several fields are transferred by `transferMatrix`, in 
+        O(J Jc) per field, when the FFTs of either grid are slow (see 
+        `fastFFT`).
+
+        :Parameters:
+            x : numpy.ndarray
+                field(s) (last axis of length J)
+            grid : `Grid`
+                target grid
+        '''
+        if np.ndim(x) > 1 and not (self.fastFFT and grid.fastFFT):
+            return grid.asDtype(x.dot(self.transferMatrix(grid).T))
+        sp = self.fftTransform(x)
+        n = min(self.N, grid.N)
+        spOut = np.zeros(sp.shape[:-1]+(grid.N+1,), dtype=grid.complexDtype)
+        spOut[...,:n+1] = sp[...,:n+1]*(float(grid.J)/self.J)
+        return grid.fftInverse(spOut)
+
+    def transferMatrix(self, grid):
+        ''' Matrix of `transfer` to `grid`, of shape (grid.J, J) (built on
+        first use and kept)
+
+        Element (i, j) is the periodic Dirichlet kernel 
+
+            (1 + 2 sum_{n=1}^{m} cos(2 pi n (y_i-x_j)/L))/J
+
+        with m the smallest truncature, x and y the points of this grid 
+        and of `grid`.  Transferring matrices (e.g. covariances) costs 
+        O(J Jc) per column, less than the FFTs of length J when they are
+        slow (O(J**2) for a prime J, see `fastFFT`).
+
+        :Parameters:
+            grid : `Grid`
+                target grid (same length)
+        '''
+        if getattr(self, '_transferMatrices', None) is None:
+            self._transferMatrices = dict()
+        if grid.N not in self._transferMatrices:
+            m = min(self.N, grid.N)
+            phi = 2.*np.pi*(grid.x[:,None]-self.x[None,:])/self.L
+            sinHalf = np.sin(0.5*phi)
+            small = np.abs(sinHalf) < 1e-12
+            kernel = np.where(  small, 2.*m+1., 
+                                np.sin((m+0.5)*phi)/np.where(small, 1., sinHalf))
+            self._transferMatrices[grid.N] = grid.asDtype(kernel/self.J)
+        return self._transferMatrices[grid.N]
+
     def ticks(self, nTicks=5, format='%.0f', units=1.):
         ''' Return a tuple of ``xticklabels``, ``xticks`` and corresponding 
         indexes for axe formatting.
@@ -130,3 +296,102 @@ class Grid(object):
             else:
                 ticklabels.append(format%(self.x[idx]/units))
         return (ticklabels, ticks, indexes)
+
+
+class Grid2D(object):
+    ''' Centered doubly periodic square grid
+
+    Fields are stored on the last two axes (y, x) of shape (J, J) and 
+    transformed with the 2D real FFT: the complex half spectrum has 
+    shape (J, N+1), full in the y wavenumbers (FFT order: 0, 1, ..., N,
+    -N, ..., -1) and half in the x wavenumbers (0, ..., N).  As for 
+    `Grid`, coefficients are referenced to the domain center (x=y=0).
+    Covariances and models defined on the grid are diagonal in spectral
+    space (dense matrices have J**4 elements and are not built).
+
+    :Attributes:
+        N : int
+            spectral resolution (truncature) in each direction
+        L : float 
+            domain length (period) in each direction
+        J : int
+            number of grid points in each direction
+        x : numpy.ndarray(float)
+            coordinates in each direction
+        dx : float
+            grid space increment
+        grid1D : `Grid`
+            1D grid of each direction
+        shape : tuple
+            shape of the fields (J, J)
+        size : int
+            number of grid points (J**2)
+        kx, ky : numpy.ndarray
+            wavenumbers of the half spectrum (broadcast to `spShape`)
+        kNorm : numpy.ndarray
+            total wavenumber sqrt(kx**2 + ky**2)
+        spShape : tuple
+            shape of the complex half spectrum (J, N+1)
+        spWeights : numpy.ndarray
+            multiplicity of the half spectrum coefficients in the full 
+            spectrum (1 for kx=0, 2 otherwise)
+        cache : `DiskCache` | None
+            on-disk cache
+        dtype : numpy.dtype
+            floating point type of the fields
+        complexDtype : numpy.dtype
+            complex type of the spectra
+
+    :Methods:
+        fftTransform : numpy.ndarray(shape=self.spShape, dtype=complex)
+            return the complex half spectrum of fields computed by FFT
+        fftInverse : numpy.ndarray(shape=self.shape)
+            return the fields from their complex half spectrum by FFT
+        asDtype : numpy.ndarray
+            return the array cast to the grid floating point type
+    '''
+
+    def __init__(self, N, L, cache=None, dtype=np.float64):
+        self.grid1D = Grid(N, L, cache=cache, dtype=dtype)
+        self.N = N
+        self.L = L
+        self.J = self.grid1D.J
+        self.x = self.grid1D.x
+        self.dx = self.grid1D.dx
+        self.cache = cache
+        self.dtype = self.grid1D.dtype
+        self.complexDtype = self.grid1D.complexDtype
+
+        self.shape = (self.J, self.J)
+        self.size = self.J**2
+        self.kx = self.grid1D.halfK[None,:]
+        self.ky = np.fft.fftfreq(self.J, 1./self.J)[:,None]
+        self.kNorm = np.sqrt(self.kx**2 + self.ky**2)
+        self.spShape = self.kNorm.shape
+        self.spWeights = np.where(self.kx == 0, 1., 2.)*np.ones(self.spShape)
+
+    def asDtype(self, x):
+        return self.grid1D.asDtype(x)
+
+    def fftTransform(self, x):
+        ''' Fast 2D discrete Fourier transform (complex half spectrum) of
+        the fields on the last two axes, O(J**2 log J) per field
+
+        :Parameters:
+            x : numpy.ndarray
+                field(s) (last axes of shape (J, J))
+        '''
+        x = np.roll(np.roll(x, -self.N, axis=-1), -self.N, axis=-2)
+        sp = np.fft.rfft2(x, axes=(-2, -1))
+        return sp.astype(self.complexDtype, copy=False)
+
+    def fftInverse(self, sp):
+        ''' Inverse of `fftTransform`
+
+        :Parameters:
+            sp : numpy.ndarray(dtype=complex)
+                complex half spectrum (last axes of shape (J, N+1))
+        '''
+        x = np.fft.irfft2(sp, s=self.shape, axes=(-2, -1))
+        x = np.roll(np.roll(x, self.N, axis=-1), self.N, axis=-2)
+        return x.astype(self.dtype, copy=False)
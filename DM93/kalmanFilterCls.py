@@ -0,0 +1,458 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+try:
+    from scipy.linalg import solve_triangular
+except ImportError:
+    solve_triangular = None
+
+from covarianceCls import Covariance, CirculantCovariance, PackedCovariance
+from covarianceCls import DiagonalCovariance, LowRankCovariance
+from profilerLib import stage, fftFlops
+
+class KalmanFilter(object):
+    ''' Kalman Filter with dense covariance matrices
+
+    Observations are collocated with grid points (identity observation
+    operator).
+
+    Covariances are stored and propagated in the grid floating point 
+    type; the gain solve and the covariance update are computed in 
+    `solveDtype` (mixed precision when the grid is single precision).
+
+    With `packed`, covariances are stored as `PackedCovariance` (upper
+    triangle, symmetric by construction) and the analysis covariance is 
+    the symmetric rank update A = B - H'.H, with H = C^-1.B and C the 
+    Cholesky factor of B + R.  With `joseph`, the analysis covariance 
+    is computed in the Joseph form A = (I-K).B.(I-K)' + K.R.K', which 
+    stays positive definite (and is valid for any gain K).
+
+    A `LowRankCovariance` forecast covariance B = D + U.U' gives a 
+    reduced rank filter in O(J r**2) (observation errors must be 
+    uncorrelated): the state is updated with the Woodbury identity and
+    only the low rank part of the covariance is analysed, in square 
+    root form U.(I + U'.(D+R)^-1.U)^-1/2, and propagated by the model; 
+    the diagonal part is kept and the model error variances are added
+    to it (exact when D = 0 and Q is diagonal).
+
+    With a `coarseModel`, defined on a coarser grid of the same length,
+    covariances are propagated at reduced resolution: the analysis 
+    covariance is truncated to the coarse grid, propagated by the 
+    coarse model and zero-padded back.  The propagation cost is divided
+    by (N/Nc)**3 for a dense model ((N/Nc)**2 for a model applied by 
+    FFT on each column), to which the truncation and padding (FFT of the 
+    rows and columns, O(J**2 log J)) and the closure (O(J**2)) add; 
+    numpy FFTs before 1.17 are O(J**2) for a prime length J, the 
+    transfers then use the transfer matrices, O(J**2 Jc).  The discarded 
+    wavenumbers are closed by `closure`: 'diagonal' keeps their 
+    spectral variances (homogeneous part of the analysis covariance) 
+    propagated by the model spectral multiplier if any, a `Covariance`
+    prescribes them (its part at the discarded wavenumbers) and None 
+    drops them.
+
+    :Attributes:
+        model : `SpectralModel`
+            model
+        R : `Covariance`
+            observation error covariance
+        Q : `Covariance`
+            model error covariance
+        solveDtype : numpy.dtype
+            floating point type of the gain solve and covariance update
+        packed : bool
+            if True, store the covariances as their upper triangle
+        joseph : bool
+            if True, update the analysis covariance in the Joseph form
+        coarseModel : `SpectralModel` | None
+            model propagating the covariances at reduced resolution
+        closure : str | `Covariance` | None
+            closure of the wavenumbers discarded by the reduced 
+            resolution propagation ('diagonal', prescribed or None)
+
+    :Methods:
+        gain : `Covariance`
+            return the Kalman gain of a background error covariance
+        analyse : np.ndarray, `Covariance`, np.ndarray
+            return the analysis state and error covariance
+        forecast : np.ndarray, `Covariance`
+            return the forecast state and error covariance
+        smoothingStep : np.ndarray, `Covariance`, np.ndarray, `Covariance`,
+                        np.ndarray, `Covariance`
+            return one backward Rauch-Tung-Striebel smoothing step
+    '''
+
+    def __init__(   self, model, R, Q, solveDtype=np.float64, packed=False, 
+                    joseph=False, coarseModel=None, closure='diagonal'):
+        self.model = model
+        self.grid = model.grid
+        self.R = R
+        self.Q = Q
+        self.solveDtype = np.dtype(solveDtype)
+        self.packed = packed
+        self.joseph = joseph
+        self.coarseModel = coarseModel
+        self.closure = closure
+
+    def gain(self, B):
+        ''' Kalman gain K = B.(B+R)^-1 (computed in `solveDtype`)
+
+        :Parameters:
+            B : `Covariance`
+                background error covariance
+        '''
+        J = self.grid.J
+        with stage('KalmanFilter.gain', 8./3*J**3):
+            Bmat = B.matrix.astype(self.solveDtype, copy=False)
+            return np.linalg.solve(Bmat + self.R.matrix, Bmat).T
+
+    def analyse(self, xb, B, y):
+        ''' Analysis step
+
+        Returns the analysis state and error covariance (xa, A).
+        States are stored on the last axis such that several 
+        realisations sharing the same statistics (and gain) can be 
+        analysed at once.
+
+        :Parameters:
+            xb : np.ndarray
+                background state(s)
+            B : `Covariance`
+                background error covariance
+            y : np.ndarray
+                observations
+        '''
+        if isinstance(B, LowRankCovariance):
+            return self._lowRankAnalyse(xb, B, y)
+        if self.packed and not self.joseph:
+            return self._packedAnalyse(xb, B, y)
+        J = self.grid.J
+        K = self.gain(B)
+        Bmat = B.matrix.astype(self.solveDtype, copy=False)
+        with stage('KalmanFilter.stateUpdate', 2.*J*np.size(xb)):
+            xa = self.grid.asDtype(xb + (y-xb).dot(K.T))
+        with stage('KalmanFilter.covarianceUpdate', 
+                    (8. if self.joseph else 2.)*J**3):
+            if self.joseph:
+                IK = np.eye(J) - K
+                KR = K.dot(self.R.matrix)
+                Amat = IK.dot(Bmat).dot(IK.T) + KR.dot(K.T)
+            else:
+                Amat = Bmat - K.dot(Bmat)
+            A = self._covariance(self.grid.asDtype(Amat))
+        return xa, A
+
+    def _packedAnalyse(self, xb, B, y):
+        ''' Analysis with the symmetric rank update A = B - H'.H '''
+        J = self.grid.J
+        if not isinstance(B, PackedCovariance):
+            B = PackedCovariance.fromMatrix(self.grid, B.matrix)
+        with stage('KalmanFilter.gain', 4./3*J**3):
+            Bmat = B.matrix.astype(self.solveDtype, copy=False)
+            C = np.linalg.cholesky(Bmat + self.R.matrix)
+            H = _solveLower(C, Bmat)
+        with stage('KalmanFilter.stateUpdate', 3.*J*np.size(xb)):
+            # -- K.(y-xb) = H'.C^-1.(y-xb), the gain is not formed
+            dxa = H.T.dot(_solveLower(C, (y-xb).T)).T
+            xa = self.grid.asDtype(xb + dxa)
+        with stage('KalmanFilter.covarianceUpdate', J**3):
+            A = B.rankUpdate(H, -1.)
+        return xa, A
+
+    def _coarsePropagation(self, xa, A):
+        ''' Covariance propagation at reduced resolution, with closure 
+
+        The rows and columns of the covariances are truncated and 
+        zero-padded in spectral space (see `Covariance.transfer`).
+        '''
+        grid, coarse = self.grid, self.coarseModel.grid
+        xaCoarse = grid.transfer(xa, coarse)
+        with stage('KalmanFilter.coarseTransfer'):
+            Ac = A.transfer(coarse).matrix
+        AMt = self.coarseModel.tangentLinear(Ac, xaCoarse)
+        P = self.coarseModel.tangentLinear(AMt.T, xaCoarse)
+        with stage('KalmanFilter.coarseTransfer'):
+            P = coarse.transfer(coarse.transfer(P, grid).T, grid)
+
+        if self.closure is None:
+            return P
+        elif isinstance(self.closure, Covariance):
+            return P + self._prescribedClosure()
+        elif self.closure == 'diagonal':
+            with stage('KalmanFilter.closure', 2.*grid.J**2):
+                return P + self._diagonalClosure(A)
+        raise ValueError('unknown closure: %s'%self.closure)
+
+    def _diagonalClosure(self, A):
+        ''' Homogeneous part of A at the discarded wavenumbers, 
+        propagated by the model spectral multiplier if any '''
+        grid, coarse = self.grid, self.coarseModel.grid
+        if getattr(self, '_circulantIndex', None) is None:
+            # -- A[i,(i+j)%J] are the periodic diagonals and C[i,(i-j)%J]
+            #    the circulant matrix of column C[:,0] (computed once)
+            idx = np.arange(grid.J)
+            self._circulantIndex = ((idx[:,None]+idx[None,:])%grid.J, 
+                                    (idx[:,None]-idx[None,:])%grid.J)
+        diagonals, circulant = self._circulantIndex
+        column = np.roll(A.matrix[np.arange(grid.J)[:,None], 
+                                    diagonals].mean(axis=0), grid.N)
+        h2 = CirculantCovariance.fromColumn(grid, column).spVariance.copy()
+        h2[:coarse.N+1] = 0.
+        spMultiplier = getattr(self.model, 'spMultiplier', None)
+        if spMultiplier is not None:
+            h2 *= np.abs(spMultiplier)**2
+        column = np.roll(grid.fftInverse(h2), -grid.N)
+        return column[circulant]
+
+    def _prescribedClosure(self):
+        ''' Part of the prescribed closure at the discarded wavenumbers '''
+        if getattr(self, '_closureMatrix', None) is None:
+            grid, coarse = self.grid, self.coarseModel.grid
+            if isinstance(self.closure, CirculantCovariance):
+                h2 = self.closure.spVariance.copy()
+                h2[:coarse.N+1] = 0.
+                self._closureMatrix = CirculantCovariance(grid, h2).matrix
+            else:
+                highPass = lambda x: x - coarse.transfer(
+                                            grid.transfer(x, coarse), grid)
+                C = highPass(highPass(self.closure.matrix).T)
+                self._closureMatrix = 0.5*(C + C.T)
+        return self._closureMatrix
+
+    def _lowRankAnalyse(self, xb, B, y):
+        ''' Reduced rank analysis of a `LowRankCovariance` '''
+        J, r = B.U.shape
+        DR = B.diagonal + self._obsVariance()
+        with stage('KalmanFilter.gain', 2.*J*r**2):
+            S = LowRankCovariance(self.grid, DR, B.U)
+        with stage('KalmanFilter.stateUpdate', 8.*r*np.size(xb)):
+            xa = self.grid.asDtype(xb + B.dot(S.solve(y-xb)))
+        with stage('KalmanFilter.covarianceUpdate', 2.*J*r**2 + 10.*r**3):
+            U = B.U.astype(self.solveDtype, copy=False)
+            W = np.eye(r) + U.T.dot(U/DR[:,None])
+            eigVal, eigVec = np.linalg.eigh(W)
+            T = (eigVec/np.sqrt(eigVal)).dot(eigVec.T)
+            A = LowRankCovariance(self.grid, B.diagonal, U.dot(T))
+        return xa, A
+
+    def _obsVariance(self):
+        ''' Observation error variances (uncorrelated errors only) '''
+        # -- computed once per covariance (R can be replaced)
+        cached = getattr(self, '_rVariance', (None, None))
+        if cached[0] is not self.R:
+            if not isinstance(self.R, DiagonalCovariance):
+                R = self.R.matrix
+                if np.count_nonzero(R - np.diag(R.diagonal())):
+                    raise ValueError(   'reduced rank analysis requires '
+                                        'uncorrelated observation errors')
+            cached = (self.R, self.R.variance)
+            self._rVariance = cached
+        return cached[1]
+
+    def _covariance(self, matrix):
+        ''' Covariance in the storage of the filter '''
+        if self.packed:
+            return PackedCovariance.fromMatrix(self.grid, matrix)
+        return Covariance(self.grid, matrix)
+
+    def forecast(self, xa, A):
+        ''' Forecast step
+
+        Returns the forecast state and error covariance (xb, B)
+        with B = M.A.M' + Q.
+
+        :Parameters:
+            xa : np.ndarray
+                analysis state
+            A : `Covariance`
+                analysis error covariance
+        '''
+        with stage('KalmanFilter.stateForecast'):
+            xb = self.model.integrate(xa)
+        if isinstance(A, LowRankCovariance):
+            with stage('KalmanFilter.covarianceForecast'):
+                B = A.propagate(self.model, xa)
+                return xb, LowRankCovariance(   self.grid, 
+                                                B.diagonal+self.Q.variance, 
+                                                B.U)
+        if self.coarseModel is not None:
+            with stage('KalmanFilter.covarianceForecast', 
+                        4.*self.coarseModel.grid.J**3):
+                P = self._coarsePropagation(xa, A)
+                return xb, self._covariance(P + self.Q.matrix)
+        with stage('KalmanFilter.covarianceForecast', self.grid.J**2):
+            AMt = self.model.tangentLinear(A.matrix, xa)
+            B = self._covariance(   self.model.tangentLinear(AMt.T, xa) 
+                                    + self.Q.matrix)
+        return xb, B
+
+    def smoothingStep(self, xa, A, xbNext, BNext, xsNext, PsNext):
+        ''' Rauch-Tung-Striebel backward smoothing step
+
+        Returns the smoothed state and error covariance (xs, Ps):
+
+            C = A.M'.B^-1
+            xs = xa + C.(xsNext - xbNext)
+            Ps = A + C.(PsNext - BNext).C'
+
+        :Parameters:
+            xa : np.ndarray
+                analysis state
+            A : `Covariance`
+                analysis error covariance
+            xbNext : np.ndarray
+                forecast state (from `xa`)
+            BNext : `Covariance`
+                forecast error covariance (from `A`)
+            xsNext : np.ndarray
+                smoothed state at the forecast time
+            PsNext : `Covariance`
+                smoothed error covariance at the forecast time
+        '''
+        AMt = self.model.tangentLinear(A.matrix, xa)
+        C = np.linalg.solve(BNext.matrix, AMt.T).T
+        xs = xa + C.dot(xsNext-xbNext)
+        Ps = A.matrix + (C.dot(PsNext.matrix-BNext.matrix)).dot(C.T)
+        return xs, Covariance(self.grid, 0.5*(Ps+Ps.T))
+
+
+def _solveLower(C, X):
+    ''' C^-1.X for a lower triangular C (triangular solve with scipy) '''
+    if solve_triangular is None:
+        return np.linalg.solve(C, X)
+    return solve_triangular(C, X, lower=True)
+
+
+class SpectralKalmanFilter(KalmanFilter):
+    ''' Kalman Filter for homogeneous statistics
+
+    When the model is a spectral multiplier (`AdvectionDiffusionModel`)
+    and all covariances are homogeneous, the Kalman Filter decouples by
+    wavenumber (Daley and Menard, 1993): covariances are stored as 
+    `CirculantCovariance` (one variance per wavenumber) and states are 
+    updated by FFT, such that a cycle costs O(J log J).
+
+    :Attributes:
+        model : `SpectralModel`
+            model providing `spMultiplier`
+        R : `Covariance`
+            homogeneous observation error covariance
+        Q : `Covariance`
+            homogeneous model error covariance
+    '''
+
+    def __init__(self, model, R, Q, solveDtype=np.float64):
+        super(SpectralKalmanFilter, self).__init__( model, R, Q, 
+                                                    solveDtype=solveDtype)
+        self.m2 = np.abs(self.model.spMultiplier)**2
+
+    @property
+    def r2(self):
+        ''' Observation error spectral variances '''
+        return self._spVarianceOf('R')
+
+    @property
+    def q2(self):
+        ''' Model error spectral variances '''
+        return self._spVarianceOf('Q')
+
+    def _spVarianceOf(self, name):
+        # -- computed once per covariance (R and Q can be replaced)
+        cov = getattr(self, name)
+        cached = getattr(self, '_sp'+name, (None, None))
+        if cached[0] is not cov:
+            cached = (cov, self.spVariance(cov))
+            setattr(self, '_sp'+name, cached)
+        return cached[1]
+
+    def spVariance(self, cov):
+        ''' Spectral variances of an homogeneous covariance 
+        
+        :Parameters:
+            cov : `Covariance`
+                homogeneous covariance
+        '''
+        if isinstance(cov, CirculantCovariance):
+            return cov.spVariance
+        return CirculantCovariance.fromMatrix(self.grid, cov.matrix).spVariance
+
+    def analyse(self, xb, B, y):
+        with stage('SpectralKalmanFilter.gain', 2.*len(self.r2)):
+            f2 = self.spVariance(B).astype(self.solveDtype)
+            gain = f2/(f2+self.r2)
+        with stage('SpectralKalmanFilter.stateUpdate', 
+                    fftFlops(self.grid.J, np.size(xb)//self.grid.J)):
+            xa = xb + self.grid.fftInverse(gain*self.grid.fftTransform(y-xb))
+        return xa, CirculantCovariance(self.grid, (1.-gain)*f2)
+
+    def forecast(self, xa, A):
+        with stage('SpectralKalmanFilter.stateForecast'):
+            xb = self.model.integrate(xa)
+        with stage('SpectralKalmanFilter.covarianceForecast', 
+                    2.*len(self.q2)):
+            f2 = self.m2*self.spVariance(A) + self.q2
+        return xb, CirculantCovariance(self.grid, f2)
+
+    def smoothingStep(self, xa, A, xbNext, BNext, xsNext, PsNext):
+        a2 = self.spVariance(A)
+        f2 = self.spVariance(BNext)
+        gain = a2*self.model.spMultiplier.conj()/f2
+        xs = xa + self.grid.fftInverse(gain*self.grid.fftTransform(
+                                                        xsNext-xbNext))
+        s2 = a2 + np.abs(gain)**2*(self.spVariance(PsNext)-f2)
+        return xs, CirculantCovariance(self.grid, s2)
+
+
+class FrozenGainFilter(SpectralKalmanFilter):
+    ''' Spectral filter with a frozen (stationary) gain
+
+    States are analysed with the stationary gain of the Kalman Filter
+    (Daley and Menard, 1993), which is computed once; the error 
+    variances of this suboptimal filter are updated with the Joseph 
+    form: a2 = (1-g)**2 f2 + g**2 r2.  They converge to the Kalman 
+    Filter stationary variances.
+
+    :Attributes:
+        gain : np.ndarray
+            spectral gain
+    '''
+
+    def __init__(self, model, R, Q, gain=None, solveDtype=np.float64):
+        super(FrozenGainFilter, self).__init__(model, R, Q, 
+                                                solveDtype=solveDtype)
+        if gain is None:
+            f2Plus = self.stationarySpVariance()
+            gain = f2Plus/(f2Plus+self.r2)
+        self.gain = gain
+
+    def stationarySpVariance(self):
+        ''' Stationary forecast spectral variances (stable solution) '''
+        alpha = 0.5 * (self.q2 + self.r2*(self.m2+1.))
+        beta = alpha**2 - self.m2*self.r2**2
+        return alpha - self.r2 + np.sqrt(np.maximum(beta, 0.))
+
+    def analyse(self, xb, B, y):
+        f2 = self.spVariance(B).astype(self.solveDtype)
+        gain = self.gain
+        with stage('FrozenGainFilter.stateUpdate', 
+                    fftFlops(self.grid.J, np.size(xb)//self.grid.J)):
+            xa = xb + self.grid.fftInverse(gain*self.grid.fftTransform(y-xb))
+        a2 = (1.-gain)**2*f2 + gain**2*self.r2
+        return xa, CirculantCovariance(self.grid, a2)
@@ -0,0 +1,86 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+
+
+def monteCarloKF(   kFilter, truIc, B, nReal, nDt, fctBias=0., obsBias=0.,
+                    modBias=0., doAssimilate=True):
+    ''' Monte Carlo verification of a (linear) Kalman Filter
+
+    Many independent truth, observation and assimilation realisations
+    are advanced together: since the gain does not depend on the 
+    realisation, the covariance recursion is computed once per time 
+    step and the states of all realisations, stacked in (nReal, J) 
+    arrays, are updated by matrix products.
+
+    Returns a dictionary of time series (length nDt+1, `i` being the 
+    time step index):
+
+        'fctRmse', 'anlRmse' : 
+            root mean square forecast and analysis errors (over space and
+            realisations), at step `i` before and after the analysis
+        'fctSpread', 'anlSpread' : 
+            standard deviation of the errors among realisations, 
+            averaged over space
+        'fctStd', 'anlStd' : 
+            root mean forecast and analysis error variances predicted by
+            the filter
+
+    :Parameters:
+        kFilter : `KalmanFilter`
+            filter
+        truIc : np.ndarray
+            initial truth state
+        B : `Covariance`
+            initial forecast error covariance
+        nReal : int
+            number of realisations
+        nDt : int
+            number of time steps
+        fctBias, obsBias, modBias : float
+            initial forecast, observation and model errors biases
+        doAssimilate : bool
+            if False, the forecasts are not corrected by the observations
+    '''
+    stats = dict()
+    for key in ( 'fctRmse', 'anlRmse', 'fctSpread', 'anlSpread', 
+                'fctStd', 'anlStd'):
+        stats[key] = np.empty(nDt+1)
+
+    xt = truIc * np.ones((nReal, kFilter.grid.J))
+    xb = xt + B.random(bias=fctBias, size=nReal)
+    for i in xrange(nDt+1):
+        y = xt + kFilter.R.random(bias=obsBias, size=nReal)
+        if doAssimilate:
+            xa, A = kFilter.analyse(xb, B, y)
+        else:
+            xa, A = xb, B
+
+        for tag, x, C in (('fct', xb, B), ('anl', xa, A)):
+            err = x - xt
+            stats[tag+'Rmse'][i] = np.sqrt(np.mean(err**2))
+            stats[tag+'Spread'][i] = np.mean(np.std(err, axis=0))
+            stats[tag+'Std'][i] = np.sqrt(np.mean(C.variance))
+
+        xb, B = kFilter.forecast(xa, A)
+        xt = (  kFilter.model.integrate(xt) 
+                + kFilter.Q.random(bias=modBias, size=nReal))
+    return stats
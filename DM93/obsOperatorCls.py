@@ -0,0 +1,88 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from gridCls import Grid
+
+class ObsOperator(object):
+    ''' Identity observation operator (grid-points collocated observations)
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        nObs : int
+            number of observations
+
+    Callable::
+
+        y = H(x)
+    '''
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.nObs = self.grid.J
+
+    def __call__(self, x):
+        ''' Apply observation operator on the last axis of `x` 
+
+        :Parameters:
+            x : np.ndarray
+                model state
+        '''
+        return x
+
+    def adjoint(self, y):
+        ''' Apply the adjoint observation operator on the last axis of `y`
+
+        :Parameters:
+            y : np.ndarray
+                observation space vector
+        '''
+        return y
+
+    @property
+    def matrix(self):
+        return self.adjoint(np.eye(self.nObs))
+
+
+class PointObsOperator(ObsOperator):
+    ''' Grid-point observations on a subset of the grid
+
+    :Attributes:
+        grid : `Grid`
+            space domain descriptor
+        indexes : np.ndarray(int)
+            observed grid points indexes
+        nObs : int
+            number of observations
+    '''
+
+    def __init__(self, grid, indexes):
+        self.grid = grid
+        self.indexes = np.asarray(indexes, dtype=int)
+        self.nObs = len(self.indexes)
+
+    def __call__(self, x):
+        return x[...,self.indexes]
+
+    def adjoint(self, y):
+        x = np.zeros(y.shape[:-1]+(self.grid.J,))
+        x[...,self.indexes] = y
+        return x
@@ -0,0 +1,631 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Plots library
+
+Figures of the experiments of `experimentsLib`.  `matplotlib` is only
+imported when a figure is produced, such that experiments can be run 
+without it (headless batch mode).
+'''
+import numpy as np 
+
+from trajectoryCls import TrajectoryReader
+
+
+def _pyplot():
+    import matplotlib.pyplot as plt
+    return plt
+
+def show():
+    ''' Show all figures '''
+    _pyplot().show()
+
+
+def _trajectories(results, names, maxRecords=1000):
+    ''' Trajectories of `results`, subsampled to at most `maxRecords` 
+    records (read chunk by chunk) if streamed (`TrajectoryReader`) '''
+    if isinstance(results, TrajectoryReader):
+        return [results.subsample(name, maxRecords) for name in names]
+    return [results[name] for name in names]
+
+
+def plotPropagation(grid, results, spaceUnits=1000., timeUnits=3600., 
+                    nTimeTicks=5):
+    ''' Trajectory (see `propagation`) 
+    
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict | `TrajectoryReader`
+            experiment results (streamed results are subsampled)
+        spaceUnits, timeUnits : float
+            km and hour units
+        nTimeTicks : int
+            number of time ticks
+    '''
+    plt = _pyplot()
+    times, traj = _trajectories(results, ('times', 'traj'))
+    nDt = len(times)-1
+
+    fig = plt.figure(figsize=(8,5))
+    axe = plt.subplot(111)
+    im = axe.matshow(traj.T, origin='lower')
+
+    axe.set_aspect('auto')
+
+    axe.set_xlabel(r'$t$ [hours]')
+    axe.set_xticks(times[::nDt//nTimeTicks]/timeUnits)
+    axe.xaxis.set_ticks_position('bottom')
+
+    gridTicksLabel, girdTicks, indexes = grid.ticks(units=spaceUnits)
+    axe.set_ylabel(r'$x$ [km]')
+    axe.set_yticks(indexes)
+    axe.set_yticklabels(gridTicksLabel)
+
+    plt.colorbar(im)
+    return fig
+
+
+def plotAnalysis(grid, results, spaceUnits=1000.):
+    ''' States and errors (see `analysis`) 
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+        spaceUnits : float
+            km unit
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(wspace=0.05)
+    ax1 = plt.subplot(211)
+    ax2 = plt.subplot(212)
+
+    ax1.plot(grid.x, results['truth'], color='k', linewidth=2, label='$x_t$')
+    ax1.plot(grid.x, results['xb'], color='b', label='$x_b$')
+    ax1.plot(   grid.x, results['y'], color='g', marker='o', linestyle='none',
+                label='$y$')
+    ax1.plot(grid.x, results['xa'], color='r', linewidth=2, label='$x_a$')
+
+    ax2.plot(   grid.x, results['y']-results['xb'], color='m', marker='o', 
+                markersize=4, linestyle='none', label='$y-x_b$')
+    ax2.plot(   grid.x, results['dxa'], color='r', label='$\Delta x_a$')
+    ax2.plot(   grid.x, results['fctErr'], color='b', linestyle=':', 
+                linewidth=3, label='$\epsilon_b$')
+    ax2.plot(   grid.x, results['xa']-results['truth'], color='r', 
+                linestyle=':', linewidth=3, label='$\epsilon_a$')
+    ax2.axhline(y=0, color='k')
+
+    xticklabels, xticks = grid.ticks(units=spaceUnits)[:2]
+    ax1.set_xticks(xticks)
+    ax1.set_xticklabels(())
+    ax2.set_xlabel('$x$ [km]')
+    ax2.set_xticks(xticks)
+    ax2.set_xticklabels(xticklabels)
+
+    ax1.legend(loc='best')
+    ax2.legend(loc='best')
+    return fig
+
+
+def plotKalmanFilter(   grid, results, obsVar, modVar, fctVar=None, 
+                        spaceUnits=1000., timeUnits=3600., nTimeTicks=5, 
+                        title=None):
+    ''' Truth and forecasts trajectories and variances evolution 
+    (see `kalmanFilter`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict | `TrajectoryReader`
+            experiment results (streamed results are subsampled)
+        obsVar, modVar, fctVar : float
+            observation, model and initial forecast error variances
+        spaceUnits, timeUnits : float
+            km and hour units
+        nTimeTicks : int
+            number of time ticks
+        title : str | None
+            figure title (variances by default)
+    '''
+    plt = _pyplot()
+    times, truTraj, fctTraj, fctVarTraj, anlVarTraj = _trajectories(
+                                results, ('times', 'truTraj', 'fctTraj', 
+                                          'fctVarTraj', 'anlVarTraj'))
+    nDt = len(times)-1
+    h = timeUnits
+
+    fig = plt.figure(figsize=(8, 10))
+    fig.subplots_adjust(wspace=0.3, top=0.84)
+    truAx = plt.subplot(311)
+    fctAx = plt.subplot(312)
+    varAx = plt.subplot(313)
+
+    vmin = min((truTraj.min(), fctTraj.min()))
+    vmax = max((truTraj.max(), fctTraj.max()))
+
+    truAx.matshow(truTraj.T, origin='lower', vmin=vmin, vmax=vmax)
+    fctAx.matshow(fctTraj.T, origin='lower', vmin=vmin, vmax=vmax)
+
+    truAx.set_title('Truth')
+    fctAx.set_title('Forecasts')
+
+    gridTicksLabel, gridTicks, indexes = grid.ticks(units=spaceUnits)
+    for axe in (truAx, fctAx):
+        axe.set_aspect('auto')
+        axe.xaxis.set_ticks_position('bottom')
+        axe.set_xticks(())
+
+        axe.set_ylabel(r'$x$ [km]')
+        axe.set_yticks(indexes)
+        axe.set_yticklabels(gridTicksLabel)
+
+    varAx.plot( times/h, obsVar*np.ones(len(times)), 
+                linestyle='--', color='g',  label=r'$\sigma_o^2$')
+    if modVar > 0:
+        varAx.plot( times/h, modVar*np.ones(len(times)), 
+                    linestyle='--', color='m', label=r'$\sigma_q^2$')
+    varAx.plot(times/h, fctVarTraj, color='b', label=r'$\sigma_f^2$')
+    varAx.plot(times/h, anlVarTraj, color='r', label=r'$\sigma_a^2$')
+
+    varAx.set_yscale('log')
+    varAx.set_xlabel(r'$t$ [hours]')
+
+    maxVar = max((obsVar, modVar, fctVarTraj.max(), anlVarTraj.max()))
+    if modVar > 0:
+        minVar = min((obsVar, modVar, fctVarTraj.min(), anlVarTraj.min()))
+    else:
+        minVar = min((obsVar, fctVarTraj.min(), anlVarTraj.min()))
+        
+    varAx.set_ylim(0.8*minVar, 1.2*maxVar)
+    varAx.set_xticks(times[::nDt//nTimeTicks]/h)
+    varAx.legend(loc='upper right')
+    varAx.set_title('Forecast variance')
+
+    if title is None:
+        title = r'$\sigma_q^2=%.0e,\ \sigma_b^2=%.0e,\ \sigma_o^2=%.0e$'%(
+                                                    modVar, fctVar, obsVar)
+    fig.suptitle(title, fontsize=16)
+    return fig
+
+
+def plotFilterDivergence(   results, xpDict, obsVar, timeUnits=3600., 
+                            nTimeTicks=5):
+    ''' Forecast variances of the experiments (see `filterDivergence`)
+
+    :Parameters:
+        results : dict
+            experiments results
+        xpDict : dict
+            experiments configurations (with 'label', 'color' and 
+            'modVar')
+        obsVar : float
+            observation error variance
+        timeUnits : float
+            hour unit
+        nTimeTicks : int
+            number of time ticks
+    '''
+    plt = _pyplot()
+    h = timeUnits
+    fig = plt.figure()
+    varAx = plt.subplot(111)
+    minVar = np.infty
+    maxVar = -np.infty
+    for xpTag in results.iterkeys():
+        times = results[xpTag]['times']
+        fctVarTraj = results[xpTag]['fctVarTraj']
+        anlVarTraj = results[xpTag]['anlVarTraj']
+        varAx.plot(times/h, fctVarTraj, color=xpDict[xpTag]['color'], 
+                    label=r'$\sigma_f^2$ %s'%xpDict[xpTag]['label'])
+
+        tmp = min((obsVar, fctVarTraj.min(), anlVarTraj.min()))
+        if tmp < minVar : minVar = tmp
+        tmp = max(( obsVar, xpDict[xpTag]['modVar'], fctVarTraj.max(), 
+                    anlVarTraj.max()))
+        if tmp > maxVar : maxVar = tmp
+    nDt = len(times)-1
+
+    varAx.plot(times/h, obsVar*np.ones(len(times)), linestyle='--', 
+                color='g', label=r'$\sigma_o^2$')
+    varAx.set_yscale('log')
+    varAx.set_ylim(0.8*minVar, 1.2*maxVar)
+
+    varAx.legend(loc='upper right')
+    varAx.set_xlabel(r'$t$ [hours]')
+    varAx.set_xticks(times[::nDt//nTimeTicks]/h)
+    varAx.set_title('Forecast variance')
+    return fig
+
+
+def plotAssymptoticSolution(grid, results):
+    ''' Assymptotic spectra (see `assymptoticSolution`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    axe = plt.subplot(111)
+
+    axe.plot(grid.halfK, results['f2Plus'], label=r'$\overline{f}_+^2$')
+    axe.plot(grid.halfK, results['analPlus'], label=r'$\overline{a}_+^2$')
+    axe.plot(grid.halfK, results['r2'], label=r'$r^2$')
+
+    axe.plot(   grid.halfK, results['cPlus'], linestyle='--', color='k', 
+                label=r'$\overline{c}_+$')
+
+    axe.set_yscale('log')
+    axe.set_xscale('log')
+    axe.set_xlabel('wavenumber $k$')
+    axe.set_title('Assymptotical variance and convergence spectra')
+    axe.legend(loc='best')
+    return fig
+
+
+def plotViscosity(grid, results):
+    ''' Assymptotic spectra for several viscosities (see `viscosity`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    axVar = plt.subplot(211)
+    axConv = plt.subplot(212)
+
+    nuFStr = r'$4\pi^2\nu\Delta t/L^2=$'
+    for i, nuF in enumerate(results['nuFactors']):
+        axVar.plot( grid.halfK, results['f2Plus'][i], 
+                    label='%s %.0e'%(nuFStr, nuF))
+        axConv.plot(grid.halfK, results['cPlus'][i], 
+                    label='%s %.0e'%(nuFStr, nuF))
+
+    axVar.set_xscale('log')
+    axVar.set_yscale('log')
+    axVar.set_ylim(bottom=1e-6)
+    axConv.set_xscale('log')
+    axConv.set_yscale('log')
+    axConv.set_ylim(bottom=1e-6)
+
+    axVar.set_xticks(())
+    axConv.set_xlabel('wavenumber $k$')
+
+    axVar.set_title('Assymptotical variance spectra')
+    axConv.set_title('Assymptotical convergence spectra')
+    axVar.legend(loc='best')
+    return fig
+
+
+def plotSpectralVariance(grid, results, obsLabel='$r^2$', fctLabel='$f^2$'):
+    ''' Variances spectra (see `spectralVariance`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+        obsLabel, fctLabel : str
+            observation and forecast spectra labels
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    axe = plt.subplot(111)
+
+    axe.plot(grid.halfK, results['f2'], label=fctLabel)
+    axe.plot(grid.halfK, results['r2'], label=obsLabel)
+    axe.plot(grid.halfK, results['a2'], label=r'$a^2$')
+
+    axe.set_yscale('log')
+    axe.set_xscale('log')
+    axe.set_xlabel('wavenumber $k$')
+    axe.set_title('Variances spectra')
+    axe.legend(loc='best')
+    return fig
+
+
+def plotSampleCorrelations(results, title=''):
+    ''' Sampled correlation matrices (see `sampleCorrelations`)
+
+    :Parameters:
+        results : dict
+            experiment results
+        title : str
+            figure title
+    '''
+    plt = _pyplot()
+    nList = sorted(results['B'].keys())
+    fig = plt.figure(figsize=(8,10))
+    fig.subplots_adjust(wspace=0.01, hspace=0.35)
+    nRows = (len(nList)+2)//2
+    for i, n in enumerate(nList):
+        axe = plt.subplot(nRows, 2, i+1)
+        axe.matshow(results['B'][n], vmin=0, vmax=1)
+        axe.set_xticks(())
+        axe.set_yticks(())
+        axe.set_title('$N=%d$'%n)
+    axe = plt.subplot(nRows, 2, len(nList)+1)
+    axe.matshow(results['exact'], vmin=0, vmax=1)
+    axe.set_xticks(())
+    axe.set_yticks(())
+    axe.set_title('Exact correlation matrix')
+    fig.suptitle(title, fontsize=16)
+    return fig
+
+
+def plotStationarySolutions(results):
+    ''' Convergence on the manifold (see `stationarySolutions`)
+
+    :Parameters:
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    domF2 = results['domF2']
+    fig = plt.figure()
+    axe = plt.subplot(111)
+
+    axe.plot(domF2, results['imGF2'], 'k', linewidth=2, label=r'$G(f^2)$')
+    axe.plot(domF2, domF2, 'k', linestyle=':')
+
+    axe.plot(   results['f2Plus'], results['GF2Plus'], 's', color='g', 
+                label=r'$\overline{f}_+^2$')
+    axe.plot(   results['f2Minus'], results['GF2Minus'], 's', color='r', 
+                label=r'$\overline{f}_-^2$')
+
+    for i, (f2, g) in enumerate(zip(results['convF2'], results['convG'])):
+        axe.plot(f2, g, marker='o', color='b')
+        axe.annotate(str(i), xy=(f2, g), fontsize=16, color='b')
+
+    axe.set_xlabel(r'$f^2$')
+    axe.set_ylabel(r'$G(f^2)$')
+    axe.set_xlim(domF2.min(), domF2.max())
+    axe.set_aspect('equal')
+
+    axe.set_title(  r'Convergence to stationary solution for $k=%d$'%(
+                                                            results['k']))
+    axe.legend(loc='best')
+    return fig
+
+
+def plotCorrelationModels(grid, results, spaceUnits=1000.):
+    ''' Correlation models, spectra and realizations
+    (see `correlationModels`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+        spaceUnits : float
+            km unit
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.6)
+    axGrid = plt.subplot(311)
+    axSpTh = plt.subplot(312)
+    axReal = plt.subplot(313)
+    for label in ('foar', 'soar', 'gaussian'):
+        axGrid.plot(grid.x, results[label]['corrFunc'], label=label)
+        axSpTh.plot(grid.halfK, results[label]['powSpecTh'], label=label)
+        axReal.plot(grid.x, results[label]['realization'], label=label)
+
+    axGrid.set_title('Correlation $L_c=%.0f$ km'%(results['Lc']/spaceUnits))
+
+    xticklabels, xticks = grid.ticks(units=spaceUnits)[:2]
+    axGrid.set_xticks(xticks)
+    axGrid.set_xticklabels(xticklabels)
+    axGrid.set_xlabel('distance [km]')
+
+    axSpTh.set_title('Normalized theoretical power spectrum')
+    axSpTh.set_xlabel('wavenumber $k$')
+
+    axReal.set_title('Random realization')
+    axReal.set_xlabel('$x$ [km]')
+    axReal.set_xticks(xticks)
+    axReal.set_xticklabels(xticklabels)
+
+    axSpTh.legend(loc='best')
+    return fig
+
+
+def plotFilterAccuracy(grid, results):
+    ''' Filter spectral variances, convergence rates and runtimes against
+    the theoretical stationary solution (see `filterAccuracy`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.6)
+    axF2 = plt.subplot(311)
+    axRate = plt.subplot(312)
+    axRmse = plt.subplot(313)
+
+    axF2.plot(  grid.halfK, results['f2Plus'], 'k', linewidth=2, 
+                label=r'$\overline{f}_+^2$')
+    axRate.plot(grid.halfK, results['cPlus'], 'k', linewidth=2, 
+                label=r'$c_+$')
+    for mode in results['modes']:
+        label = '%s (%.3f s)'%(mode, results[mode]['time'])
+        axF2.plot(grid.halfK, results[mode]['f2'][-1], label=label)
+        axRate.plot(grid.halfK, results[mode]['convRate'], label=mode)
+        axRmse.plot(results[mode]['anlRmse'], label=mode)
+
+    axF2.set_title('Final forecast spectral variance')
+    axF2.set_xlabel('wavenumber $k$')
+    axF2.set_yscale('log')
+    axF2.legend(loc='best', fontsize=8)
+
+    axRate.set_title('Convergence rate')
+    axRate.set_xlabel('wavenumber $k$')
+
+    axRmse.set_title('Analysis error')
+    axRmse.set_xlabel('time step')
+    return fig
+
+
+def plotSensitivitySweep(results, iFct=0):
+    ''' Final forecast and analysis variances as functions of the model
+    error variance, for each observation error variance (see 
+    `sensitivitySweep`)
+
+    :Parameters:
+        results : dict
+            experiment results
+        iFct : int
+            index of the initial forecast error variance
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.4)
+    axFct = plt.subplot(211)
+    axAnl = plt.subplot(212)
+    modVars = results['modVars']
+    for iObs, obsVar in enumerate(results['obsVars']):
+        label = r'$\sigma_o^2=%.2g$'%obsVar
+        axFct.plot( modVars, results['fctVarTraj'][:,iObs,iFct,-1], 
+                    marker='o', label=label)
+        axAnl.plot( modVars, results['anlVarTraj'][:,iObs,iFct,-1], 
+                    marker='o', label=label)
+
+    axFct.set_title(r'Final forecast variance ($\sigma_b^2=%.2g$)'%(
+                                                results['fctVars'][iFct]))
+    axFct.legend(loc='best', fontsize=8)
+    axAnl.set_title('Final analysis variance')
+    axAnl.set_xlabel(r'$\sigma_q^2$')
+    return fig
+
+
+def plotAdaptiveFilter(results):
+    ''' Normalized chi-square, adaptive factor and analysis error of each 
+    method (see `adaptiveFilter`)
+
+    :Parameters:
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.6)
+    axChi2 = plt.subplot(311)
+    axFactor = plt.subplot(312)
+    axRmse = plt.subplot(313)
+    for i, method in enumerate(results['methods']):
+        res = results[method]
+        line = axChi2.plot(res['chi2'], label=method)[0]
+        if i == 0:
+            axChi2.fill_between(np.arange(len(res['chi2'])), 
+                                res['chi2Lower'], res['chi2Upper'],
+                                color='0.85')
+        axFactor.plot(res['factor'], color=line.get_color(), label=method)
+        axRmse.plot(res['anlRmse'], color=line.get_color(), label=method)
+
+    axChi2.set_title(r'Normalized $\chi^2$ (running mean)')
+    axChi2.set_xlabel('time step')
+    axChi2.legend(loc='best', fontsize=8)
+
+    axFactor.set_title('Inflation or model error factor')
+    axFactor.set_xlabel('time step')
+
+    axRmse.set_title('Analysis error')
+    axRmse.set_xlabel('time step')
+    return fig
+
+
+def plotKalmanFilter2D(results):
+    ''' Final truth and analyses fields and analysis errors of each 
+    filter on the doubly periodic grid (see `kalmanFilter2D`)
+
+    :Parameters:
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    modes = results['modes']
+    nCols = len(modes) + 1
+    fig = plt.figure(figsize=(4*nCols, 7))
+    fig.subplots_adjust(hspace=0.4)
+    fields = [('truth', results['tru'])] + [(m, results[m]['anl']) 
+                                            for m in modes]
+    vmin, vmax = results['tru'].min(), results['tru'].max()
+    for i, (name, field) in enumerate(fields):
+        axe = plt.subplot(2, nCols, i+1)
+        im = axe.matshow(field, origin='lower', vmin=vmin, vmax=vmax)
+        axe.set_title(name)
+        axe.set_xticks([])
+        axe.set_yticks([])
+    plt.colorbar(im)
+
+    axRmse = plt.subplot(2, 1, 2)
+    for mode in modes:
+        res = results[mode]
+        line = axRmse.plot( res['anlRmse'], 
+                            label='%s (%.3f s)'%(mode, res['time']))[0]
+        axRmse.plot(res['anlStd'], color=line.get_color(), linestyle='--')
+    axRmse.set_title('Analysis error (predicted: dashed)')
+    axRmse.set_xlabel('time step')
+    axRmse.legend(loc='best', fontsize=8)
+    return fig
+
+
+def plotPrecisionLoss(grid, results):
+    ''' Final forecast spectral variances and analysis errors of each 
+    precision (see `precisionLoss`)
+
+    :Parameters:
+        grid : `Grid`
+            periodic grid
+        results : dict
+            experiment results
+    '''
+    plt = _pyplot()
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.4)
+    axF2 = plt.subplot(211)
+    axRmse = plt.subplot(212)
+    for mode in results['modes']:
+        for label in results['precisions']:
+            res = results[label][mode]
+            name = '%s %s (%.3f s)'%(mode, label, res['time'])
+            axF2.plot(grid.halfK, res['f2'][-1], label=name)
+            axRmse.plot(res['anlRmse'], label=name)
+
+    axF2.set_title('Final forecast spectral variance')
+    axF2.set_xlabel('wavenumber $k$')
+    axF2.set_yscale('log')
+    axF2.legend(loc='best', fontsize=8)
+
+    axRmse.set_title('Analysis error')
+    axRmse.set_xlabel('time step')
+    return fig
@@ -0,0 +1,172 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Per-stage instrumentation of the filter cycle
+
+Stages of the cycle (gain solve, state update, covariance propagation,
+covariance validation, random draws, ...) record their wall time, 
+calls, estimated floating point operations and the growth of the 
+process peak memory when profiling is enabled::
+
+    with profilerLib.profiling() as profile:
+        experimentsLib.kalmanFilter(config)
+    print(profile.table())
+    profile.save('profile.json')
+
+Stage times include nested stages, FLOPs are those of the stage own 
+operations (nested stages excluded).  When profiling is disabled 
+(default), a stage costs about a microsecond.
+'''
+import json
+import time
+import numpy as np 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# -- active profile (None when profiling is disabled)
+_profile = None
+
+
+def _maxRss():
+    ''' process peak resident memory [bytes] (Linux) '''
+    if resource is None: return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fftFlops(J, nSignals=1):
+    ''' Estimated FLOPs of a forward and inverse real FFT of length J '''
+    return 5.*J*np.log2(J)*nSignals
+
+
+class Profile(object):
+    ''' Per-stage statistics of a run
+
+    :Attributes:
+        stages : dict
+            for each stage: 'calls', 'time' (wall time [s]), 'flops' 
+            (estimated floating point operations) and 'peakMemory' 
+            (growth of the process peak resident memory [bytes])
+
+    :Methods:
+        record : str, float, float, int
+            add one call of a stage
+        table : str
+            return the statistics as a text table
+        save : str
+            save the statistics in a JSON file
+    '''
+
+    def __init__(self):
+        self.stages = dict()
+
+    def record(self, name, elapsed, flops, memory):
+        ''' Add one call of a stage
+
+        :Parameters:
+            name : str
+                stage name
+            elapsed : float
+                wall time [s]
+            flops : float
+                estimated floating point operations
+            memory : int
+                growth of the peak memory [bytes]
+        '''
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = {'calls':0, 'time':0., 'flops':0., 'peakMemory':0}
+            self.stages[name] = stats
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['flops'] += flops
+        stats['peakMemory'] = max(stats['peakMemory'], memory)
+
+    def table(self, sortBy='time'):
+        ''' Statistics as a text table (sorted by decreasing `sortBy`) '''
+        lines = ['%-36s %8s %10s %10s %10s %10s'%( 'stage', 'calls', 
+                                                    'time [s]', 'GFLOP', 
+                                                    'GFLOP/s', 'peak [MB]')]
+        for name in sorted( self.stages, 
+                            key=lambda n: -self.stages[n][sortBy]):
+            s = self.stages[name]
+            rate = s['flops']/s['time']*1e-9 if s['time'] > 0 else 0.
+            lines.append('%-36s %8d %10.4f %10.4f %10.3f %10.1f'%(
+                                name, s['calls'], s['time'], 
+                                s['flops']*1e-9, rate, 
+                                s['peakMemory']/1024.**2))
+        return '\n'.join(lines)
+
+    def save(self, fileName):
+        ''' Save the statistics in a JSON file '''
+        with open(fileName, 'w') as f:
+            json.dump(self.stages, f, indent=1, sort_keys=True)
+
+
+class profiling(object):
+    ''' Context enabling profiling, returning the `Profile` 
+
+    :Parameters:
+        profile : `Profile` | None
+            profile to accumulate into (a new one by default)
+    '''
+    def __init__(self, profile=None):
+        self.profile = Profile() if profile is None else profile
+
+    def __enter__(self):
+        global _profile
+        self._previous = _profile
+        _profile = self.profile
+        return self.profile
+
+    def __exit__(self, *args):
+        global _profile
+        _profile = self._previous
+
+
+class stage(object):
+    ''' Context recording one stage call in the active profile (if any)
+
+    :Parameters:
+        name : str
+            stage name
+        flops : float
+            estimated floating point operations of the stage
+    '''
+    __slots__ = ('name', 'flops', '_profile', '_start', '_rss')
+
+    def __init__(self, name, flops=0.):
+        self.name = name
+        self.flops = flops
+
+    def __enter__(self):
+        self._profile = _profile
+        if self._profile is not None:
+            self._rss = _maxRss()
+            self._start = _timer()
+
+    def __exit__(self, *args):
+        if self._profile is not None:
+            elapsed = _timer() - self._start
+            self._profile.record(   self.name, elapsed, self.flops, 
+                                    _maxRss() - self._rss)
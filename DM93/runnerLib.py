@@ -0,0 +1,276 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import os
+import zlib
+import ctypes
+import warnings
+import multiprocessing
+import numpy as np 
+
+BLAS_THREADS_VARIABLES = (  'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 
+                            'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                            'NUMEXPR_NUM_THREADS')
+
+# -- (library name pattern, threads setter) of the loaded BLAS libraries
+BLAS_THREADS_SETTERS = (('openblas', 'openblas_set_num_threads'),
+                        ('mkl_rt', 'MKL_Set_Num_Threads'),
+                        ('blis', 'bli_thread_set_num_threads'),
+                        ('libgomp', 'omp_set_num_threads'),
+                        ('libiomp', 'omp_set_num_threads'),
+                        ('libomp', 'omp_set_num_threads'))
+
+
+def runSeed(seed, tag):
+    ''' Seed of the random stream of one experiment run
+
+    The seed only depends on the base `seed` and the run `tag` (its key
+    in a configurations dictionary or its index in a list), such that
+    a run is reproducible whatever the worker, the order of execution 
+    or the other configurations.
+
+    :Parameters:
+        seed : int
+            base seed
+        tag : str | int
+            run tag
+    '''
+    if isinstance(tag, int):
+        return [seed, tag]
+    return [seed, zlib.crc32(str(tag)) & 0xffffffff]
+
+
+def _loadedLibraries():
+    ''' Paths of the shared libraries loaded in the process (Linux) '''
+    try:
+        with open('/proc/self/maps') as f:
+            return sorted(set(  line.split()[-1] for line in f 
+                                if '.so' in line.split()[-1]))
+    except IOError:
+        return []
+
+
+def limitBlasThreads(nThreads=1):
+    ''' Limit the number of threads used by the BLAS libraries
+
+    The environment variables only apply to the libraries loaded 
+    afterwards: the already loaded libraries (numpy's BLAS, in a 
+    worker process) are limited with `threadpoolctl` when available, 
+    otherwise by calling their own threads setter (OpenBLAS, MKL, BLIS
+    or OpenMP) through ctypes.  Warns when no library could be limited.
+
+    Returns True if the threads of a loaded library were limited.
+
+    :Parameters:
+        nThreads : int
+            number of threads
+    '''
+    for var in BLAS_THREADS_VARIABLES:
+        os.environ[var] = str(nThreads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(limits=nThreads)
+        return True
+
+    limited = False
+    for path in _loadedLibraries():
+        name = os.path.basename(path).lower()
+        for pattern, setterName in BLAS_THREADS_SETTERS:
+            if pattern not in name: continue
+            try:
+                setter = getattr(ctypes.CDLL(path), setterName)
+            except (OSError, AttributeError):
+                continue
+            setter(ctypes.c_int(nThreads))
+            limited = True
+    if not limited:
+        warnings.warn(  'the BLAS threads could not be limited to %d '
+                        '(install threadpoolctl, or set %s before numpy '
+                        'is imported)'%(nThreads, BLAS_THREADS_VARIABLES[1]))
+    return limited
+
+
+def _runOne(args):
+    func, conf, seed = args
+    np.random.seed(seed)
+    return func(conf)
+
+
+def runExperiments(func, configs, nProcs=None, seed=0, blasThreads=1):
+    ''' Run experiments in parallel
+
+    Each configuration is passed to `func` in a worker process of a 
+    pool; the global numpy random generator is seeded, before each 
+    run, with an independent and reproducible seed (see `runSeed`) 
+    such that the results do not depend on `nProcs`.
+
+    Returns the results with the structure of `configs`: a dictionary
+    with the same keys or a list in the same order.
+
+    :Parameters:
+        func : callable
+            experiment function (module level such that it can be sent 
+            to the workers) taking a configuration and returning its 
+            results
+        configs : dict | list
+            experiments configurations
+        nProcs : int | None
+            number of worker processes (number of cores by default); 
+            with `nProcs=1` experiments are run in the current process
+        seed : int
+            base seed
+        blasThreads : int
+            number of BLAS threads of each worker (to avoid 
+            oversubscription of the cores)
+    '''
+    if isinstance(configs, dict):
+        tags = sorted(configs.keys())
+    else:
+        tags = range(len(configs))
+    tasks = [(func, configs[tag], runSeed(seed, tag)) for tag in tags]
+
+    if nProcs is None: nProcs = multiprocessing.cpu_count()
+    nProcs = min(nProcs, len(tasks))
+    if nProcs <= 1:
+        results = [_runOne(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(nProcs, initializer=limitBlasThreads, 
+                                    initargs=(blasThreads,))
+        try:
+            results = pool.map(_runOne, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    if isinstance(configs, dict):
+        return dict(zip(tags, results))
+    return results
+
+
+def sharedArray(shape, dtype=np.float64):
+    ''' Numpy array in shared memory
+
+    The array is allocated in an anonymous shared memory map: worker 
+    processes forked afterwards (see `runSharded`) write in the same 
+    memory, such that their results need not be sent back.
+
+    :Parameters:
+        shape : tuple
+            array shape
+        dtype : numpy.dtype
+            array type
+    '''
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    raw = multiprocessing.RawArray(ctypes.c_char, max(size*dtype.itemsize, 1))
+    return np.frombuffer(raw, dtype=dtype, count=size).reshape(shape)
+
+
+def shardBounds(nItems, nBlocks):
+    ''' Bounds of contiguous blocks of (almost) equal sizes
+
+    :Parameters:
+        nItems : int
+            number of items
+        nBlocks : int
+            number of blocks
+    '''
+    edges = np.linspace(0, nItems, nBlocks+1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop 
+            in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+_SHARDS = dict()
+
+def _initShards(func, arrays, args, blasThreads):
+    limitBlasThreads(blasThreads)
+    _SHARDS.update(func=func, arrays=arrays, args=args)
+
+
+def _runShard(bounds):
+    _SHARDS['func'](_SHARDS['arrays'], slice(*bounds), *_SHARDS['args'])
+
+
+def runSharded( func, inputs, outputs, nItems, nProcs=None, nBlocks=None, 
+                args=(), blasThreads=1):
+    ''' Run a computation on independent items in parallel
+
+    The items (for instance the wavenumbers of spectra) are split in 
+    `nBlocks` contiguous blocks, and `func(arrays, block, *args)` is 
+    called on each block by a pool of worker processes: it reads the 
+    inputs and writes the outputs of the block, a slice of the last 
+    axis of the `arrays` (a dictionary of the inputs and outputs).
+
+    Inputs, outputs, `func` and `args` are inherited by the forked 
+    workers, which only receive the block bounds: outputs are allocated
+    in shared memory (see `sharedArray`) and nothing is pickled.  Every
+    item is computed by the same operations whatever the blocks, such 
+    that the results do not depend on `nProcs` or `nBlocks`.
+
+    Returns the dictionary of the outputs.
+
+    :Parameters:
+        func : callable
+            computation of a block 
+        inputs : dict
+            input arrays (items on the last axis)
+        outputs : dict
+            output (shape, dtype) (items on the last axis)
+        nItems : int
+            number of items
+        nProcs : int | None
+            number of worker processes (number of cores by default); 
+            with `nProcs=1` blocks are computed in the current process
+        nBlocks : int | None
+            number of blocks (`nProcs` by default)
+        args : tuple
+            additional arguments of `func`
+        blasThreads : int
+            number of BLAS threads of each worker
+    '''
+    if nProcs is None: nProcs = multiprocessing.cpu_count()
+    if nBlocks is None: nBlocks = nProcs
+    blocks = shardBounds(nItems, nBlocks)
+    nProcs = min(nProcs, len(blocks))
+
+    arrays = dict(inputs)
+    for name, (shape, dtype) in outputs.iteritems():
+        if nProcs <= 1:
+            arrays[name] = np.empty(shape=shape, dtype=dtype)
+        else:
+            arrays[name] = sharedArray(shape, dtype=dtype)
+
+    if nProcs <= 1:
+        for bounds in blocks:
+            func(arrays, slice(*bounds), *args)
+    else:
+        pool = multiprocessing.Pool(nProcs, initializer=_initShards, 
+                                    initargs=(  func, arrays, args, 
+                                                blasThreads))
+        try:
+            pool.map(_runShard, blocks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    return dict((name, arrays[name]) for name in outputs)
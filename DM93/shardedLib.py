@@ -0,0 +1,159 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+
+from gridCls import Grid2D
+from kalmanFilterCls import SpectralKalmanFilter
+from DM93Lib import spFilterCycle, spVarStationary, analSpVar
+from DM93Lib import convRateAssymp
+from runnerLib import runSharded
+
+
+def _flatSpectra(grid, sp):
+    ''' Spectra with the wavenumbers on a single last axis '''
+    sp = np.asarray(sp)
+    return sp.reshape(sp.shape[:sp.ndim-len(grid.spShape)] + (-1,))
+
+
+def _filterShard(arrays, block):
+    f2, a2, anlSp = spFilterCycle(  arrays['spMultiplier'][block], 
+                                    arrays['r2'][block], arrays['q2'][block],
+                                    arrays['f20'][block], 
+                                    arrays['xbSp'][block], 
+                                    arrays['obsSp'][:,block])
+    arrays['f2'][:,block] = f2
+    arrays['a2'][:,block] = a2
+    arrays['anlSp'][:,block] = anlSp
+
+
+def shardedSpectralFilter(  kFilter, xb, B, obsTraj, nProcs=None, 
+                            nBlocks=None):
+    ''' Spectral Kalman Filter sharded by wavenumbers
+
+    Runs the cycles of a `SpectralKalmanFilter` (analysis of each 
+    observation of `obsTraj` then forecast) with the spectrum split in
+    blocks of wavenumbers, assimilated independently by a pool of 
+    worker processes (see `runSharded` and `spFilterCycle`).  States 
+    are only transformed to spectral space before and after the 
+    cycles.  The results do not depend on `nProcs` and `nBlocks`.
+
+    Returns the forecast ('f2') and analysis ('a2') spectral variances 
+    and the analysis states ('anlTraj') of each cycle.
+
+    :Parameters:
+        kFilter : `SpectralKalmanFilter`
+            spectral Kalman Filter
+        xb : numpy.ndarray
+            initial background state
+        B : `Covariance`
+            initial background error covariance (homogeneous)
+        obsTraj : numpy.ndarray
+            observations of each cycle (first axis)
+        nProcs : int | None
+            number of processes (number of cores by default)
+        nBlocks : int | None
+            number of blocks of wavenumbers (`nProcs` by default)
+    '''
+    assert type(kFilter) is SpectralKalmanFilter
+    grid = kFilter.grid
+    nCycles = len(obsTraj)
+    spMultiplier = np.broadcast_to(kFilter.model.spMultiplier, 
+                                    np.shape(kFilter.r2))
+    f20 = kFilter.spVariance(B).astype(kFilter.solveDtype)
+    inputs = {  'spMultiplier':_flatSpectra(grid, spMultiplier),
+                'r2':_flatSpectra(grid, kFilter.r2),
+                'q2':_flatSpectra(grid, kFilter.q2),
+                'f20':_flatSpectra(grid, f20),
+                'xbSp':_flatSpectra(grid, grid.fftTransform(
+                                                    grid.asDtype(xb))),
+                'obsSp':_flatSpectra(grid, grid.fftTransform(
+                                                grid.asDtype(obsTraj))),
+                }
+    nK = inputs['r2'].shape[-1]
+    outputs = { 'f2':((nCycles, nK), f20.dtype),
+                'a2':((nCycles, nK), f20.dtype),
+                'anlSp':((nCycles, nK), inputs['obsSp'].dtype),
+                }
+    results = runSharded(   _filterShard, inputs, outputs, nK, 
+                            nProcs=nProcs, nBlocks=nBlocks)
+
+    spShape = (nCycles,) + np.shape(kFilter.r2)
+    anlSp = results['anlSp'].reshape(spShape)
+    return {'f2':results['f2'].reshape(spShape), 
+            'a2':results['a2'].reshape(spShape), 
+            'anlTraj':grid.fftInverse(anlSp)}
+
+
+def _stationaryShard(arrays, block, grid, dt, nu):
+    r2, q2 = arrays['r2'][...,block], arrays['q2'][...,block]
+    k = arrays['k'][block]
+    f2Plus, f2Minus = spVarStationary(grid, r2, q2, k=k, dt=dt, nu=nu)
+    arrays['f2Plus'][...,block] = f2Plus
+    arrays['f2Minus'][...,block] = f2Minus
+    arrays['analPlus'][...,block] = analSpVar(f2Plus, r2)
+    arrays['cPlus'][...,block] = convRateAssymp(grid, r2, q2, k=k, dt=dt, 
+                                                nu=nu)
+
+
+def shardedStationarySolution(  grid, r2, q2, dt=1., nu=0, nProcs=None, 
+                                nBlocks=None):
+    ''' Stationary solutions sharded by wavenumbers
+
+    Stable ('f2Plus') and unstable ('f2Minus') stationary forecast 
+    spectral variances, stable analysis variances ('analPlus') and 
+    assymptotic convergence rates ('cPlus') (see `spVarStationary`), 
+    computed by blocks of wavenumbers in a pool of worker processes 
+    (see `runSharded`).
+
+    The spectra `r2` and `q2` can have leading axes (they are 
+    broadcast together), for instance to sweep error variances or 
+    correlation length scales in one call.  On a `Grid2D`, the 
+    wavenumber is the total wavenumber.
+
+    :Parameters:
+        grid : `Grid` | `Grid2D`
+            periodic grid
+        r2 : numpy.ndarray
+            observation error spectral variances
+        q2 : numpy.ndarray
+            model error spectral variances
+        dt : float
+            time increment
+        nu : float
+            viscosity coefficient
+        nProcs : int | None
+            number of processes (number of cores by default)
+        nBlocks : int | None
+            number of blocks of wavenumbers (`nProcs` by default)
+    '''
+    r2, q2 = np.broadcast_arrays(np.asarray(r2, dtype=float), 
+                                 np.asarray(q2, dtype=float))
+    k = grid.kNorm if isinstance(grid, Grid2D) else grid.halfK
+    inputs = {  'r2':_flatSpectra(grid, r2), 'q2':_flatSpectra(grid, q2), 
+                'k':_flatSpectra(grid, k)}
+    shape = inputs['r2'].shape
+    outputs = dict((name, (shape, np.float64)) for name 
+                    in ('f2Plus', 'f2Minus', 'analPlus', 'cPlus'))
+    results = runSharded(   _stationaryShard, inputs, outputs, shape[-1], 
+                            nProcs=nProcs, nBlocks=nBlocks, 
+                            args=(grid, dt, nu))
+    return dict((name, value.reshape(r2.shape)) 
+                for name, value in results.iteritems())
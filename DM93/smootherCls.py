@@ -0,0 +1,173 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from collections import deque
+
+class RTSSmoother(object):
+    ''' Rauch-Tung-Striebel smoother with checkpointing
+
+    The forward (filter) pass only keeps the forecast state and 
+    covariance every `interval` time steps (checkpoints).  The backward
+    pass recomputes the filter over one segment at a time from its 
+    checkpoint, such that at most `nSteps/interval + interval` 
+    covariances are held in memory instead of `nSteps`.
+    
+    Time convention: the observations `y_k` are assimilated at step `k`
+    and the analysis is propagated to step `k+1`.
+
+    :Attributes:
+        kFilter : `KalmanFilter`
+            filter (provides `analyse`, `forecast` and `smoothingStep`)
+        interval : int | None
+            checkpoint interval (by default, the square root of the 
+            number of steps which minimizes memory)
+    '''
+
+    def __init__(self, kFilter, interval=None):
+        self.kFilter = kFilter
+        self.interval = interval
+
+    def smooth(self, xb, B, observations):
+        ''' Smoothed estimates generator
+
+        Yields the tuples (k, xs, Ps) of smoothed state and error 
+        covariance backward in time, from the last step to the first.
+
+        :Parameters:
+            xb : np.ndarray
+                background state at the first step
+            B : `Covariance`
+                background error covariance at the first step
+            observations : list
+                observations at every step
+        '''
+        nSteps = len(observations)
+        interval = self.interval
+        if interval is None: 
+            interval = max(1, int(np.ceil(np.sqrt(nSteps))))
+
+        # -- forward pass keeping checkpoints only
+        checkpoints = dict()
+        for k, y in enumerate(observations):
+            if k%interval == 0: checkpoints[k] = (xb, B)
+            xa, A = self.kFilter.analyse(xb, B, y)
+            xb, B = self.kFilter.forecast(xa, A)
+
+        # -- backward pass, one segment at a time
+        xsNext = PsNext = None
+        for start in sorted(checkpoints.keys(), reverse=True):
+            xb, B = checkpoints.pop(start)
+            segment = list()
+            for k in xrange(start, min(start+interval, nSteps)):
+                xa, A = self.kFilter.analyse(xb, B, observations[k])
+                xb, B = self.kFilter.forecast(xa, A)
+                segment.append((xa, A, xb, B))
+
+            for i in xrange(len(segment)-1, -1, -1):
+                xa, A, xbNext, BNext = segment.pop()
+                if xsNext is None:
+                    xs, Ps = xa, A
+                else:
+                    xs, Ps = self.kFilter.smoothingStep(xa, A, xbNext, BNext,
+                                                        xsNext, PsNext)
+                yield start+i, xs, Ps
+                xsNext, PsNext = xs, Ps
+
+
+class FixedLagSmoother(object):
+    ''' Fixed-lag Kalman smoother
+
+    Each assimilated observation provides the smoothed estimate `lag` 
+    steps in the past, using the future observations up to the current
+    step.  Only the last `lag+1` analyses and forecasts are kept in 
+    memory.
+
+    :Attributes:
+        kFilter : `KalmanFilter`
+            filter (provides `analyse`, `forecast` and `smoothingStep`)
+        lag : int
+            smoothing lag (number of steps)
+        xb : np.ndarray
+            current background state
+        B : `Covariance`
+            current background error covariance
+        step : int
+            current step
+    '''
+
+    def __init__(self, kFilter, lag, xb, B):
+        '''
+        :Parameters:
+            kFilter : `KalmanFilter`
+                filter
+            lag : int
+                smoothing lag (number of steps)
+            xb : np.ndarray
+                background state at the first step
+            B : `Covariance`
+                background error covariance at the first step
+        '''
+        self.kFilter = kFilter
+        self.lag = lag
+        self.xb = xb
+        self.B = B
+        self.step = 0
+        self._window = deque(maxlen=lag+1)
+
+    def assimilate(self, y):
+        ''' Assimilate the observations of the current step
+
+        Returns the tuple (k, xs, Ps) of the smoothed state and error 
+        covariance `lag` steps before the current one, or `None` while 
+        fewer than `lag+1` steps have been assimilated.
+
+        :Parameters:
+            y : np.ndarray
+                observations
+        '''
+        xa, A = self.kFilter.analyse(self.xb, self.B, y)
+        self.xb, self.B = self.kFilter.forecast(xa, A)
+        self._window.append((xa, A, self.xb, self.B))
+        self.step += 1
+        if len(self._window) <= self.lag: 
+            return None
+        return self._smoothOldest()
+
+    def flush(self):
+        ''' Smoothed estimates of the remaining steps of the window
+
+        Returns a list of tuples (k, xs, Ps) with all the future 
+        observations (the window is emptied).
+        '''
+        smoothed = list()
+        if len(self._window) > self.lag:
+            self._window.popleft()
+        while len(self._window) > 0:
+            smoothed.append(self._smoothOldest())
+            self._window.popleft()
+        return smoothed
+
+    def _smoothOldest(self):
+        xs, Ps = self._window[-1][:2]
+        for i in xrange(len(self._window)-2, -1, -1):
+            xa, A, xbNext, BNext = self._window[i]
+            xs, Ps = self.kFilter.smoothingStep(xa, A, xbNext, BNext, xs, Ps)
+        return self.step-len(self._window), xs, Ps
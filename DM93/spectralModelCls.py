@@ -18,18 +18,51 @@
 #
 # Copyright 2016 - Air Quality Research Division, Environnement Canada
 #-------------------------- LICENCE END -----------------------------
+import hashlib
 import numpy as np 
 from gridCls import Grid
+from profilerLib import stage, fftFlops
+
+def _advectionDiffusionMultiplier(grid, U, nu, dt):
+    ''' Advection-diffusion propagator on the complex half spectrum '''
+    phi = 2.*np.pi*grid.halfK*U*dt/grid.L
+    ampl = np.exp(-4.*np.pi**2*nu*dt*grid.halfK**2/grid.L**2)
+    return grid.asDtype(ampl*np.exp(-1j*phi))
+
 
 class SpectralModel(object):
     ''' Simple 1D spectral model class
 
+    The dense propagators (`S` and `M`) are only built when used and 
+    are kept in the grid `DiskCache` if any, keyed by the model class 
+    and its parameters (see `_cacheParameters`); they are cast to the
+    grid floating point type.
+
+    :Methods:
+        integrate : np.ndarray
+            propagate states (last axis) on one time increment
+        tangentLinear : np.ndarray
+            apply the tangent linear model on perturbations (last axis)
+        adjoint : np.ndarray
+            apply the adjoint model on perturbations (last axis)
     '''
     def __init__(self, grid, dt):
         self.grid = grid
         self.dt = dt
-        self.S = self._buildSpPropagator()
-        self.M = self._buildGridPropagator() 
+
+    @property
+    def S(self):
+        if getattr(self, '_S', None) is None:
+            self._S = self.grid.asDtype(self._cached('S', 
+                                                self._buildSpPropagator))
+        return self._S
+
+    @property
+    def M(self):
+        if getattr(self, '_M', None) is None:
+            self._M = self.grid.asDtype(self._cached('M', 
+                                                self._buildGridPropagator))
+        return self._M
 
     def __call__(self, x):
         ''' Apply model propagator on state or matrix
@@ -41,13 +74,63 @@ class SpectralModel(object):
             x : np.ndarray
                 model state or matrix
         '''
+        J = self.grid.J
         if x.ndim == 1:
-            return self.M.dot(x)
+            with stage('SpectralModel.call', 2.*J**2):
+                return self.M.dot(x)
         elif x.ndim == 2:
-            return (self.M.dot(x)).dot(self.M.T)
+            with stage('SpectralModel.call', 4.*J**3):
+                return (self.M.dot(x)).dot(self.M.T)
         else:
             raise ValueError()
 
+    def integrate(self, x):
+        ''' Propagate model states on one time increment 
+        
+        States are stored on the last axis of `x` such that an ensemble 
+        of states can be propagated at once.
+
+        :Parameters:
+            x : np.ndarray
+                model state(s)
+        '''
+        return self.tangentLinear(x)
+
+    def tangentLinear(self, dx, x=None):
+        ''' Apply the tangent linear model on perturbation(s)
+        
+        :Parameters:
+            dx : np.ndarray
+                perturbation(s) (last axis)
+            x : np.ndarray | None
+                linearization state (ignored by linear models)
+        '''
+        with stage('SpectralModel.tangentLinear', 2.*self.grid.J*dx.size):
+            return dx.dot(self.M.T)
+
+    def adjoint(self, dy, x=None):
+        ''' Apply the adjoint model on perturbation(s)
+        
+        :Parameters:
+            dy : np.ndarray
+                adjoint perturbation(s) (last axis)
+            x : np.ndarray | None
+                linearization state (ignored by linear models)
+        '''
+        with stage('SpectralModel.adjoint', 2.*self.grid.J*dy.size):
+            return dy.dot(self.M)
+
+
+    def _cached(self, name, builder):
+        cache = self.grid.cache
+        if cache is None:
+            return builder()
+        return cache.get(   '%s.%s'%(self.__class__.__name__, name),
+                            self._cacheParameters(), builder)
+
+    def _cacheParameters(self):
+        ''' parameters the propagators depend on '''
+        return {'N':self.grid.N, 'L':self.grid.L, 'dt':self.dt}
 
     def _buildSpPropagator(self):
         ''' build spectral propagator '''
@@ -77,6 +160,8 @@ class AdvectionDiffusionModel(SpectralModel):
             Grid space propagator
         S : np.ndarray
             Spectral space propagator
+        spMultiplier : np.ndarray(dtype=complex)
+            Propagator on the complex half spectrum (see `Grid.fftTransform`)
     
     Callable::
         
@@ -97,8 +182,29 @@ class AdvectionDiffusionModel(SpectralModel):
         '''
         self.U = U
         self.nu = nu
+        self.spMultiplier = self._buildSpMultiplier(grid, dt)
         super(AdvectionDiffusionModel, self).__init__(grid, dt)
 
+    def tangentLinear(self, dx, x=None):
+        with stage('AdvectionDiffusionModel.tangentLinear', 
+                    fftFlops(self.grid.J, dx.size//self.grid.J)):
+            sp = self.grid.fftTransform(dx)
+            return self.grid.fftInverse(self.spMultiplier*sp)
+
+    def adjoint(self, dy, x=None):
+        with stage('AdvectionDiffusionModel.adjoint', 
+                    fftFlops(self.grid.J, dy.size//self.grid.J)):
+            sp = self.grid.fftTransform(dy)
+            return self.grid.fftInverse(self.spMultiplier.conj()*sp)
+
+    def _cacheParameters(self):
+        params = super(AdvectionDiffusionModel, self)._cacheParameters()
+        params.update(U=self.U, nu=self.nu)
+        return params
+
+    def _buildSpMultiplier(self, grid, dt):
+        return _advectionDiffusionMultiplier(grid, self.U, self.nu, dt)
+
     def _buildSpPropagator(self):
         S = np.zeros(shape=(self.grid.J, self.grid.J))
         S[0,0] = 1.
@@ -112,3 +218,381 @@ class AdvectionDiffusionModel(SpectralModel):
         return S
 
         
+
+
+class AdvectionDiffusionModel2D(AdvectionDiffusionModel):
+    ''' 2D advection + diffusion model on a doubly periodic `Grid2D`,
+    with a constant wind vector
+
+    The propagator is diagonal in spectral space: states (fields on the
+    last two axes) are propagated by 2D FFT, in O(J**2 log J) each, and
+    the spectral multiplier has the shape of the 2D half spectrum.  The
+    dense propagator `M` (J**2 x J**2) is only built when requested.
+
+    :Attributes:
+        grid : `Grid2D`
+            Doubly periodic grid
+        dt : float
+            Time increment
+        U : (float, float)
+            Constant wind vector (x and y components) [m/s]
+        nu : float
+            Viscosity coefficient [m/s]
+        spMultiplier : np.ndarray(dtype=complex)
+            Propagator on the complex half spectrum (see 
+            `Grid2D.fftTransform`)
+    '''
+
+    def __call__(self, x):
+        ''' Propagate model state(s) on one time increment '''
+        return self.integrate(x)
+
+    def _buildSpMultiplier(self, grid, dt):
+        Ux, Uy = self.U
+        phi = 2.*np.pi*(grid.kx*Ux + grid.ky*Uy)*dt/grid.L
+        ampl = np.exp(-4.*np.pi**2*self.nu*dt*grid.kNorm**2/grid.L**2)
+        return grid.asDtype(ampl*np.exp(-1j*phi))
+
+    def _buildSpPropagator(self):
+        raise NotImplementedError(  '2D model: use spMultiplier on the '
+                                    'complex half spectrum')
+
+    def _buildGridPropagator(self):
+        ''' M, from the propagation of the identity '''
+        size = self.grid.size
+        identity = np.eye(size).reshape((size,)+self.grid.shape)
+        return self.tangentLinear(identity).reshape(size, size).T
+
+
+class BurgersModel(SpectralModel):
+    ''' Pseudo-spectral 1D viscous Burgers model 
+
+    Integrates du/dt + (U+u) du/dx = nu d2u/dx2 on the complex half 
+    spectrum: the linear advection and diffusion terms are integrated 
+    exactly (integrating factor, the `AdvectionDiffusionModel` 
+    multiplier of the sub-step) and the nonlinear term -1/2 d(u**2)/dx
+    with a fourth order Runge-Kutta scheme over `nSubSteps` sub-steps.
+    The nonlinear term is computed in grid space by FFT and dealiased 
+    with the 2/3 rule (wavenumbers above 2N/3 are removed from the 
+    fields and from the product).
+
+    The tangent linear and adjoint models are applied matrix-free by 
+    FFT, O(J log J) per perturbation, around the trajectory of the 
+    linearization state, which is kept for the last state such that 
+    several perturbations (e.g. the rows of a covariance matrix) are 
+    propagated with one nonlinear integration.  The model has no 
+    spectral multiplier nor dense propagator: with `KalmanFilter`, 
+    covariances are propagated by the tangent linear model around the 
+    analysis (extended Kalman Filter).
+
+    :Attributes:
+        grid : `Grid`
+            Periodic grid
+        dt : float
+            Time increment
+        U : float
+            Constant zonal wind speed [m/s]
+        nu : float
+            Viscosity coefficient [m/s]
+        nSubSteps : int
+            number of Runge-Kutta sub-steps per time increment
+        dealias : bool
+            if True, dealias the nonlinear term (2/3 rule)
+    '''
+
+    def __init__(self, grid, U=0., dt=1., nu=0, nSubSteps=1, dealias=True):
+        '''
+        :Parameters:
+            grid : `Grid`
+                Periodic 1D grid
+            U : float
+                Constant zonal wind speed (advecting the perturbations)
+            dt : float
+                Time increment
+            nu : float
+                Viscosity coefficient [m/s]
+            nSubSteps : int
+                number of Runge-Kutta sub-steps per time increment
+            dealias : bool
+                if True, dealias the nonlinear term (2/3 rule)
+        '''
+        self.U = U
+        self.nu = nu
+        self.nSubSteps = nSubSteps
+        self.dealias = dealias
+        super(BurgersModel, self).__init__(grid, dt)
+        self._h = h = float(dt)/nSubSteps
+        self._E = _advectionDiffusionMultiplier(grid, U, nu, h)
+        self._Eh = _advectionDiffusionMultiplier(grid, U, nu, 0.5*h)
+        self._D = 2j*np.pi*grid.halfK/grid.L
+        self._P = np.ones(grid.N+1)
+        if dealias:
+            self._P[grid.halfK > 2.*grid.N/3.] = 0.
+        self._linearization = None
+
+    def __call__(self, x):
+        ''' Propagate model state(s) on one time increment (matrices 
+        are propagated with `tangentLinear`, around a state) 
+        '''
+        return self.integrate(x)
+
+    def integrate(self, x):
+        with stage('BurgersModel.integrate', 
+                    8*self.nSubSteps*fftFlops(  self.grid.J, 
+                                                x.size//self.grid.J)):
+            sp = self.grid.fftTransform(x)
+            for _ in xrange(self.nSubSteps):
+                sp = self._step(sp)[0]
+            return self.grid.fftInverse(sp)
+
+    def tangentLinear(self, dx, x=None):
+        ''' Apply the tangent linear model on perturbation(s) 
+
+        :Parameters:
+            dx : np.ndarray
+                perturbation(s) (last axis)
+            x : np.ndarray
+                linearization state(s) (at the start of the increment)
+        '''
+        trajectory = self._trajectory(x)
+        E, Eh, h = self._E, self._Eh, self._h
+        with stage('BurgersModel.tangentLinear', 
+                    (8*self.nSubSteps+2)*fftFlops(  self.grid.J, 
+                                                    dx.size//self.grid.J)):
+            dsp = self.grid.fftTransform(dx)
+            for u in trajectory:
+                k1 = self._nonlinearTL(u[0], dsp)
+                k2 = self._nonlinearTL(u[1], Eh*(dsp + 0.5*h*k1))
+                k3 = self._nonlinearTL(u[2], Eh*dsp + 0.5*h*k2)
+                k4 = self._nonlinearTL(u[3], E*dsp + h*Eh*k3)
+                dsp = E*dsp + h/6.*(E*k1 + 2.*Eh*(k2+k3) + k4)
+            return self.grid.fftInverse(dsp)
+
+    def adjoint(self, dy, x=None):
+        ''' Apply the adjoint model on perturbation(s) 
+
+        :Parameters:
+            dy : np.ndarray
+                adjoint perturbation(s) (last axis)
+            x : np.ndarray
+                linearization state(s) (at the start of the increment)
+        '''
+        trajectory = self._trajectory(x)
+        E, Eh, h = self._E.conj(), self._Eh.conj(), self._h
+        with stage('BurgersModel.adjoint', 
+                    (8*self.nSubSteps+2)*fftFlops(  self.grid.J, 
+                                                    dy.size//self.grid.J)):
+            lsp = self.grid.fftTransform(dy)
+            for u in reversed(trajectory):
+                k1 = h/6.*E*lsp
+                k2 = k3 = h/3.*Eh*lsp
+                k4 = h/6.*lsp
+                lsp = E*lsp
+                s4 = self._nonlinearAdjoint(u[3], k4)
+                lsp = lsp + E*s4
+                k3 = k3 + h*Eh*s4
+                s3 = self._nonlinearAdjoint(u[2], k3)
+                lsp = lsp + Eh*s3
+                k2 = k2 + 0.5*h*s3
+                s2 = Eh*self._nonlinearAdjoint(u[1], k2)
+                lsp = lsp + s2
+                k1 = k1 + 0.5*h*s2
+                lsp = lsp + self._nonlinearAdjoint(u[0], k1)
+            return self.grid.fftInverse(lsp)
+
+    def _step(self, sp):
+        ''' One Runge-Kutta sub-step (integrating factor), returns the 
+        spectrum and the (dealiased) grid fields of the four stages 
+        '''
+        E, Eh, h = self._E, self._Eh, self._h
+        k1, u1 = self._nonlinear(sp)
+        k2, u2 = self._nonlinear(Eh*(sp + 0.5*h*k1))
+        k3, u3 = self._nonlinear(Eh*sp + 0.5*h*k2)
+        k4, u4 = self._nonlinear(E*sp + h*Eh*k3)
+        sp = E*sp + h/6.*(E*k1 + 2.*Eh*(k2+k3) + k4)
+        return sp, (u1, u2, u3, u4)
+
+    def _nonlinear(self, sp):
+        ''' Nonlinear term -1/2 d(u**2)/dx and dealiased grid field '''
+        u = self.grid.fftInverse(self._P*sp)
+        return -0.5*self._D*self._P*self.grid.fftTransform(u**2), u
+
+    def _nonlinearTL(self, u, dsp):
+        du = self.grid.fftInverse(self._P*dsp)
+        return -self._D*self._P*self.grid.fftTransform(u*du)
+
+    def _nonlinearAdjoint(self, u, lsp):
+        dl = self.grid.fftInverse(self._D*self._P*lsp)
+        return self._P*self.grid.fftTransform(u*dl)
+
+    def _trajectory(self, x):
+        ''' Stages of the nonlinear integration from `x` (kept for the 
+        last linearization state) 
+        '''
+        if x is None:
+            raise ValueError('nonlinear model: a linearization state is '
+                             'required')
+        last = self._linearization
+        if last is not None and last[0].shape == x.shape and (
+                                                    last[0] == x).all():
+            return last[1]
+        sp = self.grid.fftTransform(x)
+        trajectory = []
+        for _ in xrange(self.nSubSteps):
+            sp, stages = self._step(sp)
+            trajectory.append(stages)
+        self._linearization = (np.array(x, copy=True), trajectory)
+        return trajectory
+
+    def _cacheParameters(self):
+        params = super(BurgersModel, self)._cacheParameters()
+        params.update(  U=self.U, nu=self.nu, nSubSteps=self.nSubSteps, 
+                        dealias=self.dealias)
+        return params
+
+    def _buildSpPropagator(self):
+        raise NotImplementedError(  'nonlinear model: use tangentLinear '
+                                    'around a linearization state')
+
+    _buildGridPropagator = _buildSpPropagator
+
+
+class VariableAdvectionDiffusionModel(SpectralModel):
+    ''' 1D advection + diffusion model with spatially varying wind and 
+    viscosity
+
+    Integrates du/dt = -U(x) du/dx + d/dx(nu(x) du/dx) pseudo-spectrally
+    (derivatives by FFT, products in grid space) with a fourth order 
+    Runge-Kutta scheme.  The number of sub-steps per time increment is 
+    set from the stability limits of the scheme: the sub-step is at 
+    most `cfl` times the limits of the advection (2.8/(max|U| kMax)) 
+    and of the diffusion (2.78/(max nu kMax**2)) terms at the largest 
+    wavenumber kMax = 2 pi N/L.
+
+    Close to the stability limit, the scheme is stable but inaccurate 
+    at the largest wavenumbers (damped by about half per sub-step at 
+    `cfl=0.9`).  The cost is proportional to 1/`cfl` and the error 
+    decreases about as `cfl`**4: with a constant wind and viscosity, 
+    the relative difference with `AdvectionDiffusionModel` over one 
+    time increment is about 2e-1 at `cfl=0.9`, 3e-4 at 0.5, 2e-5 at 
+    the default 0.25 and 5e-7 at 0.1.
+
+    The model is linear: states and perturbations are propagated 
+    matrix-free, O(J log J) per sub-step, and covariances by `__call__`
+    as M.P.M' with two matrix-free propagations.  The adjoint model 
+    applies the same scheme with the adjoint operator 
+    d/dx(U(x) .) + d/dx(nu(x) d/dx .), exactly the transpose of the 
+    discrete propagator.  The dense propagators (`M`, `S`) are only 
+    built (by propagating the identity) when requested.
+
+    :Attributes:
+        grid : `Grid`
+            Periodic grid
+        dt : float
+            Time increment
+        U : np.ndarray
+            Zonal wind speed at the grid points [m/s]
+        nu : np.ndarray
+            Viscosity coefficient at the grid points
+        cfl : float
+            fraction of the stability limit of the sub-steps (accuracy
+            versus cost)
+        nSubSteps : int
+            number of Runge-Kutta sub-steps per time increment
+    '''
+
+    def __init__(self, grid, U, dt=1., nu=0, cfl=0.25):
+        '''
+        :Parameters:
+            grid : `Grid`
+                Periodic 1D grid
+            U : np.ndarray | float
+                Zonal wind speed at the grid points
+            dt : float
+                Time increment
+            nu : np.ndarray | float
+                Viscosity coefficient at the grid points
+            cfl : float
+                fraction of the stability limit of the sub-steps
+        '''
+        super(VariableAdvectionDiffusionModel, self).__init__(grid, dt)
+        self.U = np.asarray(U, dtype=np.float64)*np.ones(grid.J)
+        self.nu = np.asarray(nu, dtype=np.float64)*np.ones(grid.J)
+        self.cfl = cfl
+        self._D = 2j*np.pi*grid.halfK/grid.L
+        kMax = 2.*np.pi*grid.N/grid.L
+        rates = (np.abs(self.U).max()*kMax/2.8, 
+                 np.abs(self.nu).max()*kMax**2/2.78)
+        self.nSubSteps = max(1, int(np.ceil(dt*max(rates)/cfl)))
+        self._h = float(dt)/self.nSubSteps
+
+    def __call__(self, x):
+        ''' Apply model propagator on state or matrix
+
+        If `x` is a vector, M(x) = M.x
+        if `x` is a matrix, M(x) == M.x.M' (matrix-free)
+
+        :Parameters:
+            x : np.ndarray
+                model state or matrix
+        '''
+        if x.ndim == 1:
+            return self.integrate(x)
+        elif x.ndim == 2:
+            return self.tangentLinear(self.tangentLinear(x).T)
+        else:
+            raise ValueError()
+
+    def tangentLinear(self, dx, x=None):
+        with stage('VariableAdvectionDiffusionModel.tangentLinear', 
+                    4*self.nSubSteps*self._flops(dx)):
+            return self._rk4(self._tendency, dx)
+
+    def adjoint(self, dy, x=None):
+        with stage('VariableAdvectionDiffusionModel.adjoint', 
+                    4*self.nSubSteps*self._flops(dy)):
+            return self._rk4(self._adjointTendency, dy)
+
+    def _flops(self, x):
+        return 3*fftFlops(self.grid.J, x.size//self.grid.J)
+
+    def _rk4(self, tendency, x):
+        h = self._h
+        x = np.asarray(x, dtype=np.float64)
+        for _ in xrange(self.nSubSteps):
+            k1 = tendency(x)
+            k2 = tendency(x + 0.5*h*k1)
+            k3 = tendency(x + 0.5*h*k2)
+            k4 = tendency(x + h*k3)
+            x = x + h/6.*(k1 + 2.*(k2+k3) + k4)
+        return self.grid.asDtype(x)
+
+    def _derivative(self, x):
+        grid = self.grid
+        return grid.fftInverse(self._D*grid.fftTransform(x))
+
+    def _tendency(self, x):
+        ''' -U du/dx + d/dx(nu du/dx) '''
+        dx = self._derivative(x)
+        return -self.U*dx + self._derivative(self.nu*dx)
+
+    def _adjointTendency(self, x):
+        ''' d/dx(U u) + d/dx(nu du/dx) '''
+        return self._derivative(self.U*x + self.nu*self._derivative(x))
+
+    def _cacheParameters(self):
+        params = super(VariableAdvectionDiffusionModel, 
+                        self)._cacheParameters()
+        params.update(  U=hashlib.sha1(self.U.tobytes()).hexdigest(), 
+                        nu=hashlib.sha1(self.nu.tobytes()).hexdigest(),
+                        cfl=self.cfl)
+        return params
+
+    def _buildGridPropagator(self):
+        ''' M, from the propagation of the identity '''
+        return self.tangentLinear(np.eye(self.grid.J)).T
+
+    def _buildSpPropagator(self):
+        ''' S = F'.M.F '''
+        F = self.grid.F
+        return (F.T.dot(self.M)).dot(F)
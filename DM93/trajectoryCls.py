@@ -0,0 +1,350 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+''' Streaming trajectory output '''
+import os
+import json
+import errno
+import zipfile
+import tempfile
+import numpy as np 
+
+class TrajectoryWriter(object):
+    ''' Stream a trajectory to memory-mapped files on disk
+
+    Each call to `append` records fields (states, variance fields, 
+    spectra, scalars, ...) of one time step; only one step out of 
+    `every` is recorded.  Records are written to chunks of `chunkSize`
+    records (one memory-mapped `.npy` file per field and chunk), such 
+    that the memory used does not depend on the length of the run.
+
+    The number of records is kept in a `header.json` file which is only
+    updated (atomically) once a record is flushed to disk: a 
+    `TrajectoryReader` can thus open the trajectory while it is being 
+    written.
+
+    :Parameters:
+        directory : str
+            output directory (created if needed)
+        every : int
+            output cadence (steps)
+        chunkSize : int
+            number of records per chunk file
+        append : bool
+            if True and the directory holds a trajectory, append to it
+            (restart)
+
+    :Attributes:
+        nRecords : int
+            number of records written
+        fields : dict
+            shape and dtype of each field (defined by the first record)
+
+    :Methods:
+        isOutputStep : int
+            return True if the step is recorded
+        append : int, **np.ndarray
+            record the fields of one step
+        truncate : int
+            discard the last records (restart)
+        close :
+            mark the trajectory as complete
+    '''
+
+    def __init__(self, directory, every=1, chunkSize=256, append=False):
+        self.directory = directory
+        self.every = every
+        self.chunkSize = chunkSize
+        self.nRecords = 0
+        self.fields = None
+        self.complete = False
+        self._chunks = dict()
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST: raise
+
+        if append and os.path.exists(os.path.join(directory, 'header.json')):
+            reader = TrajectoryReader(directory)
+            self.every = reader.every
+            self.chunkSize = reader.chunkSize
+            self.fields = reader.fields or None
+            self.nRecords = reader.nRecords
+            self.truncate(reader.nRecords)
+        else:
+            self._writeHeader()
+
+    def isOutputStep(self, step):
+        ''' Return True if fields of `step` are recorded '''
+        return step%self.every == 0
+
+    def append(self, step, **fields):
+        ''' Record the fields of one step (if it is an output step)
+
+        All records must have the same fields, shapes and types.
+
+        :Parameters:
+            step : int
+                time step index
+            fields : np.ndarray | float
+                fields values
+        '''
+        if self.complete:
+            raise ValueError('trajectory is closed')
+        if not self.isOutputStep(step): 
+            return False
+        fields['step'] = step
+        values = dict((name, np.asarray(value)) 
+                        for name, value in fields.iteritems())
+        if self.fields is None:
+            self.fields = dict( (name, {'shape':list(value.shape),
+                                        'dtype':value.dtype.str})
+                                for name, value in values.iteritems())
+        elif set(values) != set(self.fields):
+            raise ValueError('fields differ from the first record')
+
+        iChunk, iRecord = divmod(self.nRecords, self.chunkSize)
+        if iRecord == 0:
+            self._openChunks(iChunk)
+        for name, value in values.iteritems():
+            self._chunks[name][iRecord] = value
+        for chunk in self._chunks.itervalues():
+            chunk.flush()
+
+        self.nRecords += 1
+        self._writeHeader()
+        return True
+
+    def truncate(self, nRecords):
+        ''' Keep only the first `nRecords` records
+
+        Used on restart to discard the records written after the 
+        checkpoint; the following records are appended after them.
+
+        :Parameters:
+            nRecords : int
+                number of records to keep
+        '''
+        if nRecords > self.nRecords:
+            raise ValueError('cannot truncate %d records to %d'%(
+                                                self.nRecords, nRecords))
+        self.nRecords = nRecords
+        self.complete = False
+        self._chunks = dict()
+        iChunk, iRecord = divmod(nRecords, self.chunkSize)
+        if iRecord > 0:
+            for name in self.fields:
+                self._chunks[name] = np.lib.format.open_memmap(
+                            _chunkPath(self.directory, name, iChunk), 
+                            mode='r+')
+        self._writeHeader()
+
+    def close(self):
+        ''' Mark the trajectory as complete and release the files '''
+        self._chunks = dict()
+        self.complete = True
+        self._writeHeader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _openChunks(self, iChunk):
+        self._chunks = dict()
+        for name, desc in self.fields.iteritems():
+            self._chunks[name] = np.lib.format.open_memmap(
+                            _chunkPath(self.directory, name, iChunk), 
+                            mode='w+', dtype=np.dtype(desc['dtype']), 
+                            shape=(self.chunkSize,)+tuple(desc['shape']))
+
+    def _writeHeader(self):
+        header = {  'every':self.every, 'chunkSize':self.chunkSize, 
+                    'nRecords':self.nRecords, 'fields':self.fields, 
+                    'complete':self.complete}
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(header, f)
+        os.rename(tmpPath, os.path.join(self.directory, 'header.json'))
+
+
+class TrajectoryReader(object):
+    ''' Read a trajectory written by `TrajectoryWriter`
+
+    The trajectory can be read while it is being written: only the 
+    records complete when the reader was opened (or last refreshed) are
+    visible.
+
+    :Parameters:
+        directory : str
+            trajectory directory
+
+    :Attributes:
+        nRecords : int
+            number of records available
+        complete : bool
+            True if the writer was closed
+        every : int
+            output cadence (steps)
+
+    Fields are read on demand: `iterChunks` and `subsample` only hold 
+    one chunk (memory-mapped) or the selected records in memory, 
+    whatever the length of the trajectory, and `savez` copies the 
+    trajectory to a `.npz` file chunk by chunk.  `read` (and 
+    `reader[name]`) returns the records in a single array.
+
+    :Methods:
+        refresh : 
+            update the number of records available
+        keys : 
+            return fields names
+        iterChunks : str, int, int, int
+            iterate over the records of a field, chunk by chunk
+        read : str, int, int, int
+            return records of a field
+        subsample : str, int
+            return at most a given number of evenly spaced records
+        savez : str
+            save all fields in a numpy `.npz` file
+        results : 
+            return all fields in a dictionary
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        ''' Update the number of records available '''
+        with open(os.path.join(self.directory, 'header.json')) as f:
+            header = json.load(f)
+        self.every = header['every']
+        self.chunkSize = header['chunkSize']
+        self.nRecords = header['nRecords']
+        self.complete = header['complete']
+        self.fields = dict( (str(name), desc) for name, desc 
+                            in (header['fields'] or dict()).iteritems())
+
+    def __len__(self):
+        return self.nRecords
+
+    def keys(self):
+        return self.fields.keys()
+
+    def iterChunks(self, name, start=0, stop=None, step=1):
+        ''' Iterate over records `start` to `stop` (excluded) of a field,
+        by blocks of records of the same chunk (memory-mapped, read-only)
+
+        :Parameters:
+            name : str
+                field name
+            start, stop, step : int | None
+                records range (all records by default)
+        '''
+        if name not in self.fields:
+            raise KeyError(name)
+        start, stop, step = slice(start, stop, step).indices(self.nRecords)
+        if step < 1:
+            raise ValueError('records are read forward: step=%d'%step)
+        while start < stop:
+            iChunk, iRecord = divmod(start, self.chunkSize)
+            chunk = np.load(_chunkPath(self.directory, name, iChunk), 
+                            mmap_mode='r')
+            end = min((iChunk+1)*self.chunkSize, stop) - iChunk*self.chunkSize
+            block = chunk[iRecord:end:step]
+            yield block
+            start += len(block)*step
+
+    def read(self, name, start=0, stop=None, step=1):
+        ''' Records `start` to `stop` (excluded) of a field
+
+        Records are memory-mapped (read-only) if they all belong to one 
+        chunk, and copied in memory otherwise.
+
+        :Parameters:
+            name : str
+                field name
+            start, stop, step : int | None
+                records range (all records by default)
+        '''
+        parts = list(self.iterChunks(name, start, stop, step))
+        if len(parts) == 1:
+            return parts[0]
+        elif len(parts) == 0:
+            desc = self.fields[name]
+            return np.empty((0,)+tuple(desc['shape']), dtype=desc['dtype'])
+        return np.concatenate(parts)
+
+    def subsample(self, name, maxRecords):
+        ''' At most `maxRecords` evenly spaced records of a field (every
+        `subsampleStep(maxRecords)` records), read chunk by chunk
+
+        :Parameters:
+            name : str
+                field name
+            maxRecords : int
+                maximal number of records
+        '''
+        return np.array(self.read(name, step=self.subsampleStep(maxRecords)))
+
+    def subsampleStep(self, maxRecords):
+        ''' Step between records of `subsample` '''
+        return max(1, -(-self.nRecords//maxRecords))
+
+    def savez(self, fileName):
+        ''' Save all fields in a numpy `.npz` file (as `numpy.savez`)
+
+        Each field is written chunk by chunk, such that the memory used 
+        does not depend on the number of records.
+
+        :Parameters:
+            fileName : str
+                output file name
+        '''
+        if not fileName.endswith('.npz'): fileName += '.npz'
+        fd, tmpPath = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(   fileName, 'w', zipfile.ZIP_STORED, 
+                                    allowZip64=True) as archive:
+                for name, desc in sorted(self.fields.iteritems()):
+                    dtype = np.dtype(desc['dtype'])
+                    header = {  'descr':np.lib.format.dtype_to_descr(dtype),
+                                'fortran_order':False,
+                                'shape':(self.nRecords,)+tuple(desc['shape'])}
+                    with open(tmpPath, 'wb') as f:
+                        np.lib.format.write_array_header_1_0(f, header)
+                        for block in self.iterChunks(name):
+                            f.write(np.ascontiguousarray(block).tobytes())
+                    archive.write(tmpPath, name+'.npy')
+        finally:
+            os.remove(tmpPath)
+
+    def __getitem__(self, name):
+        return self.read(name)
+
+    def results(self):
+        ''' All fields (see `read`) in a dictionary '''
+        return dict((name, self.read(name)) for name in self.fields)
+
+
+def _chunkPath(directory, name, iChunk):
+    return os.path.join(directory, '%s.%06d.npy'%(name, iChunk))
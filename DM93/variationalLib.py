@@ -0,0 +1,244 @@
+#-------------------------- LICENCE BEGIN ---------------------------
+# This file is part of DaleyMenard93.
+#
+# DaleyMenard93 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DaleyMenard93 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DaleyMenard93.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors - Martin Deshaies-Jacques, Richard Menard
+#
+# Copyright 2016 - Air Quality Research Division, Environnement Canada
+#-------------------------- LICENCE END -----------------------------
+import numpy as np 
+from obsOperatorCls import ObsOperator
+
+
+def conjugateGradient(applyA, b, x0=None, tol=1e-8, maxIter=None):
+    ''' Conjugate gradient solver for symmetric positive definite systems
+
+    The system matrix is only known through its application on vectors.
+    Returns the tuple (x, nIter, residual) where `residual` is the 
+    final relative residual norm |b-A.x|/|b|.
+
+    :Parameters:
+        applyA : callable
+            matrix-vector product x -> A.x
+        b : np.ndarray
+            right-hand side (vector or field, e.g. on a `Grid2D`)
+        x0 : np.ndarray | None
+            first guess (zero if not provided)
+        tol : float
+            relative residual norm convergence criterion
+        maxIter : int | None
+            maximal number of iterations (size of `b` by default)
+    '''
+    if maxIter is None: maxIter = np.size(b)
+    bNorm = np.linalg.norm(b)
+    if x0 is None:
+        x = np.zeros_like(b)
+        r = b.copy()
+    else:
+        x = x0.copy()
+        r = b - applyA(x)
+    if bNorm == 0.:
+        return x, 0, 0.
+
+    p = r.copy()
+    rr = np.vdot(r, r)
+    nIter = 0
+    while np.sqrt(rr)/bNorm > tol and nIter < maxIter:
+        Ap = applyA(p)
+        alpha = rr/np.vdot(p, Ap)
+        x += alpha*p
+        r -= alpha*Ap
+        rrNew = np.vdot(r, r)
+        p = r + (rrNew/rr)*p
+        rr = rrNew
+        nIter += 1
+    return x, nIter, np.sqrt(rr)/bNorm
+
+
+def var3D(xb, y, B, R, H=None, tol=1e-8, maxIter=None):
+    ''' Variational (3D-Var) analysis
+
+    Minimizes the cost function
+    
+        J(x) = (x-xb)'.B^-1.(x-xb)/2 + (y-H.x)'.R^-1.(y-H.x)/2
+
+    with conjugate gradients in the control space of the transform 
+    x = xb + B^1/2.v, which preconditions the Hessian to 
+    
+        I + B^T/2.H'.R^-1.H.B^1/2.
+
+    Only operator applications are used (`B.sqrtDot`, `B.sqrtTDot`, 
+    `R.solve`, `H` and `H.adjoint`): no matrix is inverted nor formed.
+    With `CirculantCovariance` and `DiagonalCovariance` statistics, 
+    each iteration costs O(J log J).
+
+    Returns the tuple (xa, info) where `info` is a dictionary with the
+    number of iterations ('nIter') and final relative residual 
+    ('residual').
+
+    :Parameters:
+        xb : np.ndarray
+            background state
+        y : np.ndarray
+            observations
+        B : `Covariance`
+            background error covariance
+        R : `Covariance`
+            observation error covariance
+        H : `ObsOperator` | None
+            observation operator (identity by default)
+        tol : float
+            relative residual norm convergence criterion
+        maxIter : int | None
+            maximal number of iterations
+    '''
+    if H is None: H = ObsOperator(B.grid)
+
+    def applyHessian(v):
+        return v + B.sqrtTDot(H.adjoint(R.solve(H(B.sqrtDot(v)))))
+
+    d = y - H(xb)
+    gradient = B.sqrtTDot(H.adjoint(R.solve(d)))
+    v, nIter, residual = conjugateGradient(applyHessian, gradient, 
+                                            tol=tol, maxIter=maxIter)
+    xa = xb + B.sqrtDot(v)
+    return xa, {'nIter':nIter, 'residual':residual}
+
+
+def adjointTest(model, x=None, nTest=5):
+    ''' Dot product test of the tangent linear and adjoint models
+
+    Returns the maximal relative error 
+        
+        |<M.dx, dy> - <dx, M'.dy>| / |<M.dx, dy>|
+
+    over `nTest` random perturbation pairs, which should be of the 
+    order of machine precision.
+
+    :Parameters:
+        model : `SpectralModel`
+            model providing `tangentLinear` and `adjoint`
+        x : np.ndarray | None
+            linearization state
+        nTest : int
+            number of random tests
+    '''
+    shape = model.grid.shape
+    maxErr = 0.
+    for i in xrange(nTest):
+        dx = np.random.normal(size=shape)
+        dy = np.random.normal(size=shape)
+        lhs = np.vdot(model.tangentLinear(dx, x), dy)
+        rhs = np.vdot(dx, model.adjoint(dy, x))
+        maxErr = max(maxErr, np.abs(lhs-rhs)/np.abs(lhs))
+    return maxErr
+
+
+def var4D(  xb, obs, B, R, model, H=None, nOuter=1, 
+            tol=1e-8, maxIter=None):
+    ''' Incremental strong constraint variational (4D-Var) analysis
+
+    Minimizes, with respect to the initial state x, the cost function
+    
+        J(x) = (x-xb)'.B^-1.(x-xb)/2 
+                + sum_k (y_k-H.x_k)'.R_k^-1.(y_k-H.x_k)/2
+
+    where x_k is the model state after `k` time increments and the sum
+    runs on the observations of the assimilation window.  Each outer 
+    loop integrates the model from the current guess and minimizes the 
+    quadratic incremental cost function (linearized around the guess
+    trajectory) with conjugate gradients in the control space of the 
+    transform x = xb + B^1/2.v.  For a linear model, one outer loop 
+    gives the exact minimum.
+
+    Only operator applications are used (`model.tangentLinear`, 
+    `model.adjoint`, `B.sqrtDot`, `B.sqrtTDot`, `R.solve`, `H` and 
+    `H.adjoint`).
+
+    Returns the tuple (xa, info) where `xa` is the analysis at the 
+    beginning of the window and `info` a dictionary with the number 
+    of inner iterations for each outer loop ('nIter') and the final 
+    relative residual ('residual').
+
+    :Parameters:
+        xb : np.ndarray
+            background state at the beginning of the window
+        obs : list
+            list of (k, y) tuples, `y` being observed after `k` model 
+            time increments (k=0 at the beginning of the window)
+        B : `Covariance`
+            background error covariance
+        R : `Covariance` | list
+            observation error covariance (or one per observation time)
+        model : `SpectralModel`
+            model
+        H : `ObsOperator` | None
+            observation operator (identity by default)
+        nOuter : int
+            number of outer loops (at least one)
+        tol : float
+            inner loop relative residual norm convergence criterion
+        maxIter : int | None
+            maximal number of inner iterations
+    '''
+    if nOuter < 1:
+        raise ValueError('var4D needs at least one outer loop: %s'%nOuter)
+    if H is None: H = ObsOperator(B.grid)
+    if not isinstance(R, (list, tuple)): R = [R]*len(obs)
+    obsDict = dict()
+    for (k, y), Rk in zip(obs, R):
+        obsDict[k] = (y, Rk)
+    nSteps = max(obsDict.keys())
+
+    def trajectory(x0):
+        traj = [x0]
+        for k in xrange(nSteps):
+            traj.append(model.integrate(traj[-1]))
+        return traj
+
+    def adjointSum(forcing, traj):
+        ''' sum_k M_k'.forcing_k by backward adjoint integration '''
+        adj = np.zeros(B.grid.J)
+        for k in xrange(nSteps, -1, -1):
+            if k in forcing: adj += forcing[k]
+            if k > 0: adj = model.adjoint(adj, traj[k-1])
+        return adj
+
+    def applyHessian(v, traj):
+        dx = B.sqrtDot(v)
+        forcing = dict()
+        for k in xrange(nSteps+1):
+            if k in obsDict:
+                y, Rk = obsDict[k]
+                forcing[k] = H.adjoint(Rk.solve(H(dx)))
+            if k < nSteps: dx = model.tangentLinear(dx, traj[k])
+        return v + B.sqrtTDot(adjointSum(forcing, traj))
+
+    w = np.zeros(B.controlSize)
+    x0 = xb
+    nIters = list()
+    for i in xrange(nOuter):
+        traj = trajectory(x0)
+        forcing = dict()
+        for k, (y, Rk) in obsDict.iteritems():
+            forcing[k] = H.adjoint(Rk.solve(y - H(traj[k])))
+        gradient = B.sqrtTDot(adjointSum(forcing, traj)) - w
+        dw, nIter, residual = conjugateGradient(
+                                    lambda v: applyHessian(v, traj), 
+                                    gradient, tol=tol, maxIter=maxIter)
+        w = w + dw
+        x0 = xb + B.sqrtDot(w)
+        nIters.append(nIter)
+    return x0, {'nIter':nIters, 'residual':residual}
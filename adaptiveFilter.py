@@ -0,0 +1,57 @@
+'''
+Monitor the consistency of the Kalman Filter with online innovation statistics and adapt the forecast error statistics when the model error variance is misspecified:
+
+-   the truth is integrated with the model error variance `trueModVar`;
+-   the filter assumes the model error variance `modVar` of config.py.
+
+The innovation statistics (innovation variance, Desroziers estimates of the observation and forecast error variances, normalized chi-square) are updated at each analysis in constant memory.
+The filter is run without adaptation (diagnostics only), with an adaptive inflation of the forecast error covariance and with an adaptive model error covariance.
+
+The script prints the final statistics of each method and plots the normalized chi-square, the adaptive factors and the analysis errors.
+'''
+import numpy as np 
+
+from DM93 import Config, experimentsLib, plotsLib
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+
+# -- model error variance of the truth (None: same as the filter)
+trueModVar = 10.*config.modVar
+
+# -- adaptive methods: None, 'inflation', 'Q'
+methods = (None, 'inflation', 'Q')
+
+# -- filter: 'dense', 'spectral', 'frozenGain'
+mode = 'spectral'
+
+# -- integration and memory of the innovation statistics (None for 
+#    cumulative statistics)
+nDt = 200
+memory = 20
+
+#====================================================================
+#===| computations |=================================================
+
+results = experimentsLib.adaptiveFilter(config, trueModVar=trueModVar, 
+                                        methods=methods, mode=mode, 
+                                        nDt=nDt, memory=memory)
+
+print('%-10s %8s %18s %8s %8s %8s %8s %8s'%(
+            'method', 'chi2', 'chi2 bounds', 'diverg.', 'b est.', 
+            'fctVar', 'factor', 'anl err'))
+for method in results['methods']:
+    res = results[method]
+    print('%-10s %8.3f %8.3f - %-7.3f %8s %8.4f %8.4f %8.3f %8.4f'%(
+                method, res['chi2'][-1], res['chi2Lower'][-1], 
+                res['chi2Upper'][-1], res['diverging'][-1], 
+                res['bEstimate'][-1], res['fctVar'][-1], res['factor'][-1],
+                res['anlRmse'][nDt//2:].mean()))
+
+#====================================================================
+#===| plots |========================================================
+
+plotsLib.plotAdaptiveFilter(results)
+plotsLib.show()
@@ -1,5 +1,5 @@
 '''
-Compute the analysis (through direct inversion of B+R innovation matrix) and output the error reduction.
+Compute the analysis (through direct inversion of B+R innovation matrix or variational minimization) and output the error reduction.
 
 For both observation and forecast errors, statistics need to be provided:
 
@@ -10,96 +10,47 @@ For both observation and forecast errors, statistics need to be provided:
 
 By default (and as it is a common hypothesis in most context), the observation error are uncorrelated.
 What would be the impact of having correlated observation errors? The impact of biases?
+
+With `method = 'direct'`, the gain and increment are computed per wavenumber in O(J log J) when both covariances are homogeneous (circulant), correlated observation errors included, and by inversion of the J x J innovation covariance matrix otherwise (see `DM93.directAnalysis`); `'spectral'` and `'dense'` force either computation.
+With `method = '3dvar'`, the analysis is obtained by minimizing the 3D-Var cost function with conjugate gradients (see `DM93.var3D`), using only FFT applications of the homogeneous covariances.
 '''
 import numpy as np 
 from numpy import pi
-import matplotlib.pyplot as plt
 
-from DM93 import Covariance, Uncorrelated, Foar, Soar, Gaussian
+from DM93 import Config, experimentsLib, plotsLib
 
 #====================================================================
 #===| setup and configuration |======================================
 
-execfile('config.py')
-
-# -- observation errors
-obsLc = None
-obsCorr = Uncorrelated(grid, obsLc)
-obsBias = 0.
-obsVar = 1.
+config = Config.fromFile('config.py')
+grid = config.grid
+km, h = config.km, config.h
 
-# -- forecast errors
-fctLc = grid.L/20.
-fctCorr = Soar(grid, fctLc)
-fctBias = 0.
-fctVar = 2.
+# -- observation and forecast errors (see config.py)
+config = config.replace(obsVar=1.)
 
 # -- initial truth state
 ampl = 10.
 truth = ampl * np.exp(-grid.x**2/(grid.L/6.)**2)
 
+# -- analysis method ('direct', 'spectral', 'dense' or '3dvar')
+method = 'direct'
+
 #====================================================================
 #===| computations |=================================================
 
-# -- covariance matrices
-B = Covariance(grid, fctVar * fctCorr.matrix)
-R = Covariance(grid, obsVar * obsCorr.matrix)
-
-# -- random error structures
-fctErr = B.random(bias=fctBias)
-obsErr = R.random(bias=obsBias)
-
-# -- background state
-xb = truth + fctErr
-
-# -- observations
-y = truth + obsErr
-
-# -- analysis
-SInv = np.linalg.inv(B.matrix+R.matrix) 
-K = B.matrix.dot(SInv)
-dxa = K.dot(y-xb) 
-
-xa = xb + dxa
+results = experimentsLib.analysis(config, truth=truth, method=method)
 
 # -- reduction of error
-error_b = grid.dx * np.sqrt(sum(fctErr**2))
-error_a = grid.dx * np.sqrt(sum((xa-truth)**2))
+error_b = results['error_b']
+error_a = results['error_a']
 print('background error = %.1e'%error_b)
 print('analysis error = %.1e'%error_a)
 print('error reduction = %.1f%%'%((error_b-error_a)/error_b*100.))
+print('analysis method: %s'%results['method'])
 
 #====================================================================
 #===| plots |========================================================
 
-fig = plt.figure()
-fig.subplots_adjust(wspace=0.05)
-ax1 = plt.subplot(211)
-ax2 = plt.subplot(212)
-
-ax1.plot(grid.x, truth, color='k', linewidth=2, label='$x_t$')
-ax1.plot(grid.x, xb, color='b', label='$x_b$')
-ax1.plot(grid.x, y, color='g', marker='o', linestyle='none', label='$y$')
-ax1.plot(grid.x, xa, color='r', linewidth=2, label='$x_a$')
-
-
-ax2.plot(   grid.x, y-xb, color='m', marker='o', markersize=4, 
-            linestyle='none', label='$y-x_b$')
-ax2.plot(   grid.x, dxa, color='r', label='$\Delta x_a$')
-ax2.plot(   grid.x, fctErr, color='b', linestyle=':', linewidth=3,
-            label='$\epsilon_b$')
-ax2.plot(   grid.x, xa-truth, color='r', linestyle=':', linewidth=3, 
-            label='$\epsilon_a$')
-ax2.axhline(y=0, color='k')
-
-xticklabels, xticks = grid.ticks(units=km)[:2]
-ax1.set_xticks(xticks)
-ax1.set_xticklabels(())
-ax2.set_xlabel('$x$ [km]')
-ax2.set_xticks(xticks)
-ax2.set_xticklabels(xticklabels)
-
-ax1.legend(loc='best')
-ax2.legend(loc='best')
-
-plt.show()
+plotsLib.plotAnalysis(grid, results, spaceUnits=km)
+plotsLib.show()
@@ -0,0 +1,61 @@
+'''
+Time the hot paths of the lab (grid, correlation models, model propagation, Kalman Filter steps and spectral functions) across resolutions and save the results in `benchmarks.json`.
+
+Dense implementations and their fast alternatives (FFT, spectral) are shown side by side for each operation, with their complexity slope (log-log slope of time versus the number of grid points J); dense and 2D benchmarks are only run up to `maxDenseN`.
+Setting `baseline` to a previous results file prints the time ratios (above 1 for a slowdown).
+'''
+import numpy as np 
+import matplotlib.pyplot as plt
+
+from DM93 import benchmarkLib
+
+#====================================================================
+#===| setup and configuration |======================================
+
+# -- spectral truncatures
+resolutions = [48, 96, 192, 384, 768, 1536, 3072]
+maxDenseN = 384
+
+# -- output and baseline results files
+output = 'benchmarks.json'
+baseline = None
+
+#====================================================================
+#===| computations |=================================================
+
+results = benchmarkLib.runBenchmarks(   resolutions=resolutions, 
+                                        maxDenseN=maxDenseN, verbose=True)
+benchmarkLib.saveBenchmarks(output, results)
+print(benchmarkLib.benchmarkTable(results))
+
+if baseline is not None:
+    ratios = benchmarkLib.compareBenchmarks(
+                    results, benchmarkLib.loadBenchmarks(baseline))
+    for name in sorted(ratios):
+        print('%-45s '%name + ' '.join('N=%d: %.2f'%(N, r) 
+                                        for N, r in sorted(ratios[name].items())))
+
+#====================================================================
+#===| plots |========================================================
+
+benchmarks = results['benchmarks']
+operations = sorted(set(b['operation'] for b in benchmarks.itervalues()))
+nCols = 3
+nRows = (len(operations)+nCols-1)//nCols
+fig = plt.figure(figsize=(5*nCols, 3.5*nRows))
+for i, operation in enumerate(operations):
+    axe = plt.subplot(nRows, nCols, i+1)
+    for name in sorted(benchmarks):
+        b = benchmarks[name]
+        if b['operation'] != operation: continue
+        label = name
+        if b['slope'] is not None: label += r' ($J^{%.1f}$)'%b['slope']
+        axe.loglog(b['J'], b['time'], marker='o', 
+                    linestyle='--' if b['dense'] else '-', label=label)
+    axe.set_title(operation)
+    axe.set_xlabel(r'$J$')
+    axe.set_ylabel('time [s]')
+    axe.legend(loc='upper left', fontsize='x-small')
+fig.tight_layout()
+
+plt.show()
@@ -1,34 +1,59 @@
 '''
-Defines constants and the periodic domain.
+Defines the configuration parameters shared by the experiments.
 
--   defines space and time units
 -   defines the assimilation window for model integration
 -   defines the periodic domain and spectral truncature
 -   define the two physical parameters: the zonal wind speed and the dissipation coefficient
+-   defines the default error statistics (correlation model, correlation length, variance and bias of observation, forecast and model errors)
 
-`config.py` is sourced in most of the other scripts (such that they share the parametrization), but one can replace the statetment `execfile('config.py')` with explicit local definitions of the grid and parameters.
-
-The grid defined in the script is an instance of `Grid` class defined in `./DM93/gridCls.py`.
-This object also provide the discrete Fourier transform and its inverse.
+`config.py` is loaded in most of the other scripts (such that they share the parametrization) as a `Config` object (`./DM93/configCls.py`): `config = Config.fromFile('config.py')`.
+Space and time units (`km`, `h` and `day`) are predefined.
+The periodic domain (`config.grid`, an instance of `Grid`), the model and the correlation and covariance matrices are built only when first used and are then kept by the configuration.
 '''
 from numpy import pi 
-from DM93 import Grid
-
-# -- units of space: m and time: s
-km = 1000.
-h = 3600.
-day = 24.*h
 
 # -- discretization
 L = 16000 * km
 N = 48
-grid = Grid(N, L)
 dt =1.*h
 
 # -- zonal wind
 U = 100.*km/h
 
-# -- viscosity
+# -- viscosity (nu = nuFactor/dt*(2.*pi*L)**2)
 #nuFactor = 0.00001
 nuFactor = 0.0
-nu =  nuFactor/dt*(2.*pi*grid.L)**2
+
+# -- model: 'advectionDiffusion' or the nonlinear viscous Burgers model
+#    'burgers' (the zonal wind advects the solution, the Kalman Filter 
+#    is then the extended Kalman Filter; set a viscosity)
+#modelName = 'burgers'
+
+# -- observation errors (R)
+obsCorrName = 'uncorrelated'
+obsVar = 0.1
+
+# -- forecast errors (B)
+fctCorrName = 'soar'
+fctLc = L/20.
+fctVar = 2.
+
+# -- model errors (Q)
+modCorrName = 'gaussian'
+modLc = L/50.
+modVar = 0.01
+
+# -- on-disk cache of the grid, correlation and propagator matrices
+#    (worth it for large N)
+#cacheDir = 'cache'
+#cacheMaxSize = 2*1024**3
+
+# -- floating point type of the fields, matrices and ensembles, and of 
+#    the filters gain solve and covariance update ('float32' halves the
+#    memory, keep solveDtype = 'float64' for mixed precision)
+#dtype = 'float32'
+#solveDtype = 'float64'
+
+# -- reduced resolution covariance propagation of the Kalman Filter 
+#    (spectral truncature of the coarse grid)
+#coarseN = 16
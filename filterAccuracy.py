@@ -0,0 +1,90 @@
+'''
+Compare the accuracy and runtime of the Kalman Filter implementations (dense, spectral, ensemble and frozen gain) against the assymptotic spectral theory of the article:
+
+-   the stationary forecast and analysis variance spectra;
+-   the convergence rate spectrum.
+
+Observation, forecast and model errors statistics are set in config.py.
+
+The script plots the final forecast variance spectra, the measured convergence rates and the analysis errors of each filter.
+
+The filters are then run in double, mixed (float32 storage, float64 gain solve and covariance update) and single precision to report the precision loss and runtime of each (set `precisions = None` to skip).
+'''
+import numpy as np 
+
+from DM93 import Config, experimentsLib, plotsLib
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+grid = config.grid
+
+# -- filters: 'dense', 'spectral', 'ensemble', 'frozenGain', 'sharded'
+modes = ('dense', 'spectral', 'ensemble', 'frozenGain')
+
+# -- integration and ensemble size
+nDt = 50
+nEns = 100
+
+# -- precisions: (label, dtype, solveDtype), the first is the reference
+precisions = (  ('double', 'float64', 'float64'), 
+                ('mixed', 'float32', 'float64'), 
+                ('single', 'float32', 'float32'))
+
+# -- regression check (opt-in): the sharded filter must be bit-identical
+#    for any number of processes, e.g. checkProcs = (1, 2) (one pool of 
+#    processes per run, the random generator state is kept)
+checkProcs = None
+
+#====================================================================
+#===| computations |=================================================
+
+results = experimentsLib.filterAccuracy(config, modes=modes, nDt=nDt, 
+                                        nEns=nEns)
+
+print('%-12s %10s %12s %12s %12s'%( 'filter', 'time [s]', 'f2 error', 
+                                    'a2 error', 'rate error'))
+for mode in modes:
+    res = results[mode]
+    rateError = np.abs(res['convRate']-results['cPlus'])
+    print('%-12s %10.4f %12.2e %12.2e %12.2e'%(
+                mode, res['time'], res['f2RelError'], res['a2RelError'], 
+                np.nanmax(rateError) if np.isfinite(rateError).any() 
+                                     else np.nan))
+
+if precisions is not None:
+    precResults = experimentsLib.precisionLoss( config, modes=modes, 
+                                                precisions=precisions, 
+                                                nDt=nDt, nEns=nEns)
+    print('\n%-12s %-8s %10s %12s %12s %12s'%(  'filter', 'precision', 
+                                                'time [s]', 'f2 loss', 
+                                                'a2 loss', 'xa loss'))
+    for mode in modes:
+        for label in precResults['precisions']:
+            res = precResults[label][mode]
+            print('%-12s %-8s %10.4f %12.2e %12.2e %12.2e'%(
+                        mode, label, res['time'], res['f2Loss'], 
+                        res['a2Loss'], res['anlLoss']))
+
+if checkProcs is not None:
+    sharded = []
+    rngState = np.random.get_state()
+    for nProcs in checkProcs:
+        np.random.seed(0)
+        sharded.append(experimentsLib.filterAccuracy(
+                            config, modes=('sharded',), nDt=nDt, 
+                            nProcs=nProcs)['sharded'])
+    np.random.set_state(rngState)
+    for nProcs, res in zip(checkProcs[1:], sharded[1:]):
+        mismatch = [name for name in ('f2', 'a2', 'anlRmse')
+                    if not np.array_equal(res[name], sharded[0][name])]
+        assert not mismatch, ('sharded filter differs with %d processes:'
+                              ' %s'%(nProcs, mismatch))
+    print('\nsharded check: bit-identical with %s processes'%(checkProcs,))
+
+#====================================================================
+#===| plots |========================================================
+
+plotsLib.plotFilterAccuracy(grid, results)
+plotsLib.show()
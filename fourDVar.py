@@ -0,0 +1,119 @@
+'''
+Assimilate a window of observations spread over several time increments with the incremental 4D-Var and compare with the Kalman Filter.
+
+The 4D-Var minimizes a single cost function over the whole window using the tangent linear and adjoint models (applied by FFT); the adjoint is first validated by a dot product test.
+For a linear perfect model, the 4D-Var analysis propagated to the end of the window is identical to the Kalman Filter analysis at that time: the script outputs their difference.
+'''
+from sys import stdout
+import numpy as np 
+from numpy import pi
+import matplotlib.pyplot as plt
+
+from DM93 import Config, Covariance
+from DM93 import CirculantCovariance, var4D, adjointTest
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+grid = config.grid
+km, h = config.km, config.h
+
+# -- observation (R) and forecast (B) errors: see config.py
+
+# -- initial truth state
+ampl = 10.
+truIc = ampl * np.exp(-grid.x**2/(grid.L/6.)**2)
+
+# -- model 
+model = config.model
+
+# -- assimilation window (observations every `obsStep` time increments)
+nDt = 10
+obsStep = 2
+
+# -- regression check (opt-in): maximal relative error of the adjoint 
+#    test, e.g. 1e-10 (None only prints it)
+adjointTol = None
+
+#====================================================================
+#===| computations |=================================================
+
+adjointError = adjointTest(model)
+print('adjoint test: %.1e'%adjointError)
+if adjointTol is not None:
+    assert adjointError < adjointTol, 'adjoint test failed: %.1e'%adjointError
+
+# -- covariance matrices
+B = config.B
+R = config.R
+
+# -- truth and observations
+xb = truIc + B.random()
+xt = truIc
+obs = list()
+for i in xrange(nDt+1):
+    if i%obsStep == 0:
+        obs.append((i, xt + R.random()))
+    xt = model(xt)
+
+# -- 4D-Var analysis (at the beginning of the window)
+xa0, info = var4D(  xb, obs, 
+                    CirculantCovariance.fromMatrix(grid, B.matrix), 
+                    CirculantCovariance.fromMatrix(grid, R.matrix), 
+                    model)
+print('4D-Var: %d iterations, residual = %.1e'%(info['nIter'][-1], 
+                                                info['residual']))
+
+# -- Kalman Filter over the same window (perfect model)
+obsDict = dict(obs)
+xa = xb
+A = B
+for i in xrange(nDt+1):
+    stdout.write('..%d'%i)
+    stdout.flush()
+    if i > 0:
+        xa = model(xa)
+        A = Covariance(grid, model(A.matrix))
+    if i in obsDict:
+        SInv = np.linalg.inv(A.matrix+R.matrix) 
+        K = A.matrix.dot(SInv)
+        xa = xa + K.dot(obsDict[i]-xa)
+        A = Covariance(grid, (np.eye(grid.J) - K).dot(A.matrix))
+print('')
+
+# -- 4D-Var analysis trajectory
+truTraj = np.empty(shape=(nDt+1, grid.J))
+varTraj = np.empty(shape=(nDt+1, grid.J))
+xt = truIc
+x = xa0
+for i in xrange(nDt+1):
+    truTraj[i] = xt
+    varTraj[i] = x
+    xt = model(xt)
+    x = model(x)
+
+print('|x_a(4D-Var)-x_a(KF)| at the end of window = %.1e'%(
+                                np.abs(varTraj[-1] - xa).max()))
+
+#====================================================================
+#===| plots |========================================================
+
+fig = plt.figure()
+axe = plt.subplot(111)
+
+axe.plot(grid.x, truTraj[-1], color='k', linewidth=2, label='$x_t$')
+axe.plot(grid.x, obs[-1][1], color='g', marker='o', linestyle='none', 
+            label='$y$')
+axe.plot(grid.x, xa, color='b', linewidth=2, label='$x_a$ (KF)')
+axe.plot(grid.x, varTraj[-1], color='r', linestyle='--', linewidth=2, 
+            label='$x_a$ (4D-Var)')
+
+xticklabels, xticks = grid.ticks(units=km)[:2]
+axe.set_xticks(xticks)
+axe.set_xticklabels(xticklabels)
+axe.set_xlabel('$x$ [km]')
+axe.set_title('Analyses at the end of the assimilation window')
+axe.legend(loc='best')
+
+plt.show()
@@ -0,0 +1,53 @@
+'''
+Run the spectral and ensemble Kalman Filters on a doubly periodic square domain (`Grid2D`) of truncature `N` (config.py) in each direction.
+
+The model advects the field with the constant wind vector (U, V) and diffuses it; the observation, forecast and model error covariances are the isotropic (or separable) 2D extensions of the correlation models of config.py, diagonal in spectral space, such that no J**2 x J**2 matrix is built.
+The ensemble Kalman Filter is solved in the ensemble space; alone, the ensemble covariance is limited by its rank (nEns much smaller than J**2) and the filter diverges, its hybrid with the static initial forecast error covariance (weight `staticWeight`) keeps a full rank gain and a spread consistent with the analysis error.
+
+The script prints the runtime and final analysis error of each filter and plots the final truth and analyses and the analysis errors.
+'''
+import numpy as np 
+
+from DM93 import Config, experimentsLib, plotsLib
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+
+# -- filters: 'spectral', 'ensemble'
+modes = ('spectral', 'ensemble')
+
+# -- wind y component [m/s] (None: U/2) and isotropic or separable 
+#    correlations
+V = None
+isotropic = True
+
+# -- integration and ensemble size
+nDt = 20
+nEns = 40
+
+# -- weight of the static covariance of the ensemble filter (0: 
+#    ensemble covariance only)
+staticWeight = 0.5
+
+#====================================================================
+#===| computations |=================================================
+
+results = experimentsLib.kalmanFilter2D(config, modes=modes, nDt=nDt, 
+                                        nEns=nEns, V=V, isotropic=isotropic,
+                                        staticWeight=staticWeight)
+
+print('%-12s %10s %12s %12s'%('filter', 'time [s]', 'anl error', 
+                              'predicted'))
+for mode in modes:
+    res = results[mode]
+    print('%-12s %10.4f %12.4f %12.4f'%(mode, res['time'], 
+                                        res['anlRmse'][-1], 
+                                        res['anlStd'][-1]))
+
+#====================================================================
+#===| plots |========================================================
+
+plotsLib.plotKalmanFilter2D(results)
+plotsLib.show()
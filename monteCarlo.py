@@ -0,0 +1,77 @@
+'''
+Verify the Kalman Filter error statistics with a Monte Carlo experiment: many independent truth, observation and assimilation realisations are run together and their actual errors are compared with the variances predicted by the filter.
+
+Since the gain is the same for every realisation, the covariance recursion is computed once and the states of all realisations are updated at once with matrix products (see `monteCarloKF`), such that hundreds of realisations cost about as much as a single one.
+'''
+import numpy as np 
+from numpy import pi
+import matplotlib.pyplot as plt
+
+from DM93 import Config
+from DM93 import KalmanFilter, SpectralKalmanFilter, monteCarloKF
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+grid = config.grid
+km, h = config.km, config.h
+
+doSpectral = False
+
+# -- observation (R), forecast (B) and model (Q) errors: see config.py
+
+# -- initial truth state
+ampl = 10.
+truIc = ampl * np.exp(-grid.x**2/(grid.L/6.)**2)
+
+# -- model 
+model = config.model
+
+# -- integration and number of realisations
+nDt = 10
+nReal = 500
+
+#====================================================================
+#===| computations |=================================================
+
+times = np.array([i*config.dt for i in xrange(nDt+1)])
+
+B = config.B
+R = config.R
+Q = config.Q
+
+if doSpectral:
+    kFilter = SpectralKalmanFilter(model, R, Q)
+else:
+    kFilter = KalmanFilter(model, R, Q)
+
+stats = monteCarloKF(   kFilter, truIc, B, nReal, nDt, 
+                        fctBias=config.fctBias, obsBias=config.obsBias, 
+                        modBias=config.modBias)
+
+#====================================================================
+#===| plots |========================================================
+nTimeTicks = 5
+
+fig = plt.figure()
+axe = plt.subplot(111)
+
+axe.plot(times/h, stats['fctRmse'], color='b', label='forecast RMSE')
+axe.plot(times/h, stats['fctSpread'], color='b', linestyle=':', 
+            label='forecast spread')
+axe.plot(times/h, stats['fctStd'], color='b', linestyle='--', 
+            label=r'$\sigma_f$')
+axe.plot(times/h, stats['anlRmse'], color='r', label='analysis RMSE')
+axe.plot(times/h, stats['anlSpread'], color='r', linestyle=':', 
+            label='analysis spread')
+axe.plot(times/h, stats['anlStd'], color='r', linestyle='--', 
+            label=r'$\sigma_a$')
+
+axe.set_yscale('log')
+axe.set_xlabel(r'$t$ [hours]')
+axe.set_xticks(times[::nDt//nTimeTicks]/h)
+axe.legend(loc='upper right')
+axe.set_title('Monte Carlo verification (%d realisations)'%nReal)
+
+plt.show()
@@ -3,67 +3,39 @@ Integrate the numerical model and produce a trajectory using an `AdvectionDiffus
 
 `AdvectionDiffusionModel` is defined with a `Grid` instance, the physical parameters `U` and `nu` (in m/s) and an assimilation window `dt` in seconds.
 
-One can change the grid or parameters setting either by modifying `config.py` or replacing the `execfile('config.py')` statement with explicit equivalent definitions.
+One can change the grid or parameters setting either by modifying `config.py` or replacing the `Config.fromFile('config.py')` statement with an explicit `Config(...)` definition.
 '''
-from sys import stdout
 import numpy as np 
 from numpy import pi
-import matplotlib.pyplot as plt
 
-from DM93 import AdvectionDiffusionModel
+from DM93 import Config, TrajectoryWriter, experimentsLib, plotsLib
 
 #====================================================================
 #===| setup and configuration |======================================
 
-execfile('config.py')
+config = Config.fromFile('config.py')
+grid = config.grid
+km, h = config.km, config.h
 
 # -- initial state
 x0 = grid.L/5.
-ic = np.exp(-(grid.x-x0)**2/(L/6.)**2)
+ic = np.exp(-(grid.x-x0)**2/(grid.L/6.)**2)
 
 # -- integration
 nDt = 200
 
+# -- streaming output for long runs, e.g. TrajectoryWriter('traj') 
+#    (None keeps the trajectory in memory)
+output = None
+
 #====================================================================
 #===| computations |=================================================
 
-# -- spectral (Ms) and grid (M) propagators (M = F.Ms.F')
-model = AdvectionDiffusionModel(grid, U, dt=dt, nu=nu)
-
-# -- integration
-times = np.array([i*dt for i in xrange(nDt+1)])
-
-traj = np.empty(shape=(nDt+1, grid.J))
-x = ic
-# -- x_{n+1} = M.x_{n} 
-for i in xrange(nDt+1):
-    stdout.write('..%d'%i)
-    stdout.flush()
-    x = model(x)
-    traj[i] = x
+results = experimentsLib.propagation(config, ic=ic, nDt=nDt, output=output)
+if output is not None: output.close()
 
 #====================================================================
 #===| plots |========================================================
-nTimeTicks = 5
-
-fig = plt.figure(figsize=(8,5))
-axe = plt.subplot(111)
-im = axe.matshow(traj.T, origin='lower')
-
-axe.set_aspect('auto')
-
-
-axe.set_xlabel(r'$t$ [hours]')
-axe.set_xticks(times[::nDt/nTimeTicks]/h)
-axe.xaxis.set_ticks_position('bottom')
-
-gridTicksLabel, girdTicks, indexes = grid.ticks(units=km)
-axe.set_ylabel(r'$x$ [km]')
-axe.set_yticks(indexes)
-axe.set_yticklabels(gridTicksLabel)
-
-
-
-plt.colorbar(im)
-plt.show()
 
+plotsLib.plotPropagation(grid, results, spaceUnits=km, timeUnits=h)
+plotsLib.show()
@@ -0,0 +1,48 @@
+'''
+Sensitivity of the Kalman Filter to the error variances:
+
+-   every combination of the model (`modVars`), observation (`obsVars`) and initial forecast (`fctVars`) error variances is assimilated;
+-   the error correlations are those of config.py.
+
+All the combinations are run as a single batched filter, dense (stacked J x J covariances, batched solves) or spectral (stacked spectral variances), with the same random draws scaled by each error standard deviation.
+
+The script prints the final forecast variance of each combination and plots the final forecast and analysis variances as functions of the model error variance.
+'''
+import numpy as np 
+
+from DM93 import Config, experimentsLib, plotsLib
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+
+# -- error variances of the sweep
+modVars = (0., 0.001, 0.01, 0.05, 0.1)
+obsVars = (0.01, 0.1, 1.)
+fctVars = (config.fctVar,)
+
+# -- filter: 'dense' or 'spectral'
+mode = 'dense'
+
+# -- integration
+nDt = 50
+
+#====================================================================
+#===| computations |=================================================
+
+results = experimentsLib.sensitivitySweep(  config, modVars=modVars, 
+                                            obsVars=obsVars, 
+                                            fctVars=fctVars, mode=mode, 
+                                            nDt=nDt)
+
+print('%-10s'%'modVar' + ''.join('%12s'%('obsVar=%g'%o) for o in obsVars))
+for i, modVar in enumerate(modVars):
+    print('%-10g'%modVar + ''.join('%12.4e'%v 
+                            for v in results['fctVarTraj'][i,:,0,-1]))
+
+#====================================================================
+#===| plots |========================================================
+
+plotsLib.plotSensitivitySweep(results)
+plotsLib.show()
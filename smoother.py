@@ -0,0 +1,121 @@
+'''
+Compare the Kalman Filter estimates with smoothed estimates (reanalysis) obtained with the Rauch-Tung-Striebel smoother and a fixed-lag smoother.
+
+The RTS smoother only keeps checkpoints of the forward pass (`interval` steps apart) and recomputes the filter segment by segment during the backward pass; the fixed-lag smoother only keeps the last `lag+1` steps in memory.
+With `doSpectral = True`, the homogeneous statistics are exploited and all computations are done wavenumber by wavenumber (`SpectralKalmanFilter`).
+'''
+from sys import stdout
+import numpy as np 
+from numpy import pi
+import matplotlib.pyplot as plt
+
+from DM93 import Config
+from DM93 import KalmanFilter, SpectralKalmanFilter
+from DM93 import RTSSmoother, FixedLagSmoother
+
+#====================================================================
+#===| setup and configuration |======================================
+
+config = Config.fromFile('config.py')
+grid = config.grid
+km, h = config.km, config.h
+
+doSpectral = False
+
+# -- observation (R), forecast (B) and model (Q) errors: see config.py
+
+# -- initial truth state
+ampl = 10.
+truIc = ampl * np.exp(-grid.x**2/(grid.L/6.)**2)
+
+# -- model 
+model = config.model
+
+# -- integration
+nDt = 20
+
+# -- smoothers
+interval = None
+lag = 4
+
+#====================================================================
+#===| computations |=================================================
+
+times = np.array([i*config.dt for i in xrange(nDt+1)])
+
+B = config.B
+R = config.R
+Q = config.Q
+
+if doSpectral:
+    kFilter = SpectralKalmanFilter(model, R, Q)
+else:
+    kFilter = KalmanFilter(model, R, Q)
+
+# -- truth and observations
+truTraj = np.empty(shape=(nDt+1, grid.J))
+observations = list()
+xt = truIc
+for i in xrange(nDt+1):
+    truTraj[i] = xt
+    observations.append(xt + R.random())
+    xt = model(xt) + Q.random()
+xbIc = truIc + B.random()
+
+# -- filter
+anlVarTraj = np.empty(nDt+1)
+anlErrTraj = np.empty(nDt+1)
+xb, Bn = xbIc, B
+for i, y in enumerate(observations):
+    stdout.write('..%d'%i)
+    stdout.flush()
+    xa, A = kFilter.analyse(xb, Bn, y)
+    xb, Bn = kFilter.forecast(xa, A)
+    anlVarTraj[i] = A.variance[0]
+    anlErrTraj[i] = np.sqrt(np.mean((xa-truTraj[i])**2))
+print('')
+
+# -- RTS smoother
+smtVarTraj = np.empty(nDt+1)
+smtErrTraj = np.empty(nDt+1)
+rts = RTSSmoother(kFilter, interval)
+for i, xs, Ps in rts.smooth(xbIc, B, observations):
+    smtVarTraj[i] = Ps.variance[0]
+    smtErrTraj[i] = np.sqrt(np.mean((xs-truTraj[i])**2))
+
+# -- fixed-lag smoother
+lagVarTraj = np.empty(nDt+1)
+smoothed = list()
+fixedLag = FixedLagSmoother(kFilter, lag, xbIc, B)
+for y in observations:
+    out = fixedLag.assimilate(y)
+    if out is not None: smoothed.append(out)
+smoothed += fixedLag.flush()
+for i, xs, Ps in smoothed:
+    lagVarTraj[i] = Ps.variance[0]
+
+#====================================================================
+#===| plots |========================================================
+nTimeTicks = 5
+
+fig = plt.figure()
+varAx = plt.subplot(211)
+errAx = plt.subplot(212)
+
+varAx.plot(times/h, anlVarTraj, color='r', label=r'$\sigma_a^2$ (filter)')
+varAx.plot(times/h, smtVarTraj, color='b', label=r'$\sigma_s^2$ (RTS)')
+varAx.plot( times/h, lagVarTraj, color='c', linestyle='--', 
+            label=r'$\sigma_s^2$ (lag %d)'%lag)
+varAx.set_yscale('log')
+varAx.set_xticks(())
+varAx.legend(loc='upper right')
+varAx.set_title('Error variance')
+
+errAx.plot(times/h, anlErrTraj, color='r', label='filter')
+errAx.plot(times/h, smtErrTraj, color='b', label='RTS')
+errAx.set_xlabel(r'$t$ [hours]')
+errAx.set_xticks(times[::nDt//nTimeTicks]/h)
+errAx.legend(loc='upper right')
+errAx.set_title('Actual RMS error')
+
+plt.show()